@@ -0,0 +1,96 @@
+from types_definition import *
+import numpy as np
+
+
+def batch_route(compiled_graph: CompiledRotorGraph, rotors: np.ndarray, particles: np.ndarray,
+                turn_and_move: bool=False) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Route the particles of B independent instances to the sinks in lockstep with NumPy.
+    At each round, every active node of every running instance sends floor(k / d) particles
+    along each of its out-edges (a full rotor period, the rotor does not move) and then fires one particle.
+    The active (instance, node) pairs of a round are kept incrementally: they are found among the active pairs
+    of the previous round and the pairs which received particles, so a round costs O(number of active pairs)
+    instead of a scan of the whole (B, V) block (which is only done when the round touched more than B*V/8 pairs).
+    By the abelian property, the result is the one of the legal routing of each instance.
+    Input:
+        - compiled_graph: the CompiledRotorGraph to route on
+        - rotors: (B, V) array of rotor indices (columns in the order of compiled_graph.nodes)
+        - particles: (B, V) or (V,) array of numbers of particles (only the particles are routed, not the antiparticles)
+        - turn_and_move: boolean (default: False),
+            if True: turn first then move
+            else (False): move first then turn
+    Output:
+        - (B,) array of the number of steps of each instance
+        - (B, V) array of the final rotor indices
+        - (B, S) array of the numbers of particles on the sinks (columns in the order of compiled_graph.nodes)
+    """
+    rotors = np.array(rotors, dtype=np.int64)
+    if rotors.ndim != 2 or rotors.shape[1] != len(compiled_graph.nodes):
+        raise ValueError("rotors has to be a (B, V) array")
+    nb_instances = rotors.shape[0]
+    particles = np.array(particles, dtype=np.int64)
+    if particles.ndim == 1:
+        particles = np.tile(particles, (nb_instances, 1))
+    if particles.shape != rotors.shape:
+        raise ValueError("particles has to be a (B, V) or (V,) array")
+
+    is_sink = np.array(compiled_graph.is_sink, dtype=bool)
+    if not is_sink.any():
+        raise ValueError("No sink in the graph: the routing would not end.")
+    offsets = np.array(compiled_graph.offsets[:-1], dtype=np.int64)
+    degrees = np.array(compiled_graph.degrees, dtype=np.int64)
+    heads = np.array(compiled_graph.heads, dtype=np.int64)
+    max_degree = int(degrees.max())
+
+    steps = np.zeros(nb_instances, dtype=np.int64)
+    nb_nodes = len(compiled_graph.nodes)
+    owner = np.zeros(nb_instances * nb_nodes, dtype=np.int64) # deduplication of the touched pairs without sorting
+    # the active (instance, node) pairs, the next ones are found among them and the nodes they sent particles to
+    b, u = np.nonzero((particles > 0) & ~is_sink)
+    while b.size:
+        d = degrees[u]
+        touched_b, touched_u = [b], [u]
+
+        # full rotor periods
+        q = particles[b, u] // d
+        if q.any():
+            for j in range(max_degree):
+                selected = (j < d) & (q > 0)
+                if selected.any():
+                    targets_b, targets_u = b[selected], heads[offsets[u[selected]] + j]
+                    np.add.at(particles, (targets_b, targets_u), q[selected])
+                    touched_b.append(targets_b)
+                    touched_u.append(targets_u)
+            particles[b, u] -= q * d
+            np.add.at(steps, b, q * d)
+
+        # one more step from the nodes which still hold particles
+        fire = particles[b, u] > 0
+        b, u, d = b[fire], u[fire], d[fire]
+        r = rotors[b, u]
+        if turn_and_move:
+            r = (r + 1) % d
+            pos = offsets[u] + r
+        else:
+            pos = offsets[u] + r
+            r = (r + 1) % d
+        rotors[b, u] = r
+        particles[b, u] -= 1
+        np.add.at(particles, (b, heads[pos]), 1)
+        np.add.at(steps, b, 1)
+        touched_b.append(b)
+        touched_u.append(heads[pos])
+
+        if sum(len(t) for t in touched_b) * 8 > nb_instances * nb_nodes:
+            # dense round: the scan of the block costs less than the deduplication
+            b, u = np.nonzero((particles > 0) & ~is_sink)
+            continue
+        keys = np.concatenate(touched_b) * nb_nodes + np.concatenate(touched_u)
+        positions = np.arange(keys.size)
+        owner[keys] = positions
+        keys = keys[owner[keys] == positions]
+        b, u = keys // nb_nodes, keys % nb_nodes
+        active = (particles[b, u] > 0) & ~is_sink[u]
+        b, u = b[active], u[active]
+
+    return steps, rotors, particles[:, is_sink]
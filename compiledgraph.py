@@ -0,0 +1,727 @@
+from types_definition import *
+from collections import deque
+from random import Random
+import rotorconfig
+
+
+class RoutingCounters(object):
+
+    def __init__(self, nb_nodes: int, nb_edges: int):
+        """
+        Counters of a routing on a CompiledRotorGraph, indexed by node and edge indices:
+            - nb_steps: total number of steps
+            - edges: number of times each edge was taken
+            - nodes: number of times each node was reached
+            - last_visit: step of the last visit of each node (None if never visited)
+        Input:
+            - nb_nodes: number of nodes of the compiled graph
+            - nb_edges: number of edges of the compiled graph
+        """
+        self.nb_steps = 0
+        self.edges = [0] * nb_edges
+        self.nodes = [0] * nb_nodes
+        self.last_visit = [None] * nb_nodes
+
+
+class CompiledRotorGraph(object):
+
+    def __init__(self, rotor_graph: RotorGraph, sinks: set=None):
+        """
+        A compiled, array-backed form of a RotorGraph used by the routing loops.
+        Nodes and edges are mapped to integers and the rotor order is stored in flat CSR-style arrays:
+            - nodes: list of the nodes, the index of a node is its position in the list
+            - node_index: dict {node: index}
+            - offsets: the out-edges of the node i are at the positions offsets[i] .. offsets[i+1]-1
+            - degrees: out-degree of each node
+            - heads: index of the head of the edge at each position
+            - edges: Edge at each position (the position of an edge is its index)
+            - is_sink: is_sink[i] is True if the node i is considered as a sink
+        A rotor configuration is a list of ints (index of the rotor in the rotor order of the node)
+        and a particle configuration is a list of ints (number of particles on each node).
+        Input:
+            - rotor_graph: the RotorGraph to compile
+            - sinks: set of nodes that are considered as sinks (optional)
+        """
+        if sinks is None:
+            sinks = rotor_graph.sinks
+
+        self.sinks = set(sinks)
+        self.nodes = list(rotor_graph.nodes)
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.offsets = [0]
+        self.degrees = list()
+        self.heads = list()
+        self.edges = list()
+        for node in self.nodes:
+            for edge in rotor_graph.rotor_order.get(node, ()):
+                self.edges.append(edge)
+                self.heads.append(self.node_index[edge[1]])
+            self.offsets.append(len(self.edges))
+            self.degrees.append(self.offsets[-1] - self.offsets[-2])
+        # nodes without out-edges cannot be fired: they are considered as sinks
+        self.is_sink = [node in self.sinks or not degree for node, degree in zip(self.nodes, self.degrees)]
+        self.edge_position = {edge: i for i, edge in enumerate(self.edges)}
+
+    def new_counters(self) -> RoutingCounters:
+        """
+        Give empty counters for a routing on the compiled graph
+        No input
+        Output:
+            - RoutingCounters
+        """
+        return RoutingCounters(len(self.nodes), len(self.edges))
+
+    def rotors_from_config(self, rotor_config: RotorConfig) -> list[int]:
+        """
+        Translate a RotorConfig to a list of rotor indices
+        Nodes missing from the configuration get the first edge of their rotor order.
+        Input:
+            - rotor_config: the rotor configuration to translate
+        Output:
+            - list of rotor indices
+        """
+        rotors = [0] * len(self.nodes)
+        offsets = self.offsets
+        edge_position = self.edge_position
+        node_index = self.node_index
+        for node, edge in rotor_config.configuration.items():
+            if node in node_index:
+                i = node_index[node]
+                rotors[i] = edge_position[edge] - offsets[i]
+        return rotors
+
+    def rotor_config_from(self, rotors: list[int], rotor_config: RotorConfig) -> dict[Node, Edge]:
+        """
+        Translate a list of rotor indices back to a configuration dict
+        Input:
+            - rotors: list of rotor indices
+            - rotor_config: the RotorConfig giving the nodes to keep (and their order)
+        Output:
+            - dict {node: edge}
+        """
+        node_index = self.node_index
+        offsets = self.offsets
+        edges = self.edges
+        configuration = dict()
+        for node, edge in rotor_config.configuration.items():
+            if node in node_index:
+                i = node_index[node]
+                configuration[node] = edges[offsets[i] + rotors[i]]
+            else:
+                configuration[node] = edge
+        return configuration
+
+    def particles_from_config(self, particle_config: ParticleConfig) -> list[int]:
+        """
+        Translate a ParticleConfig to a list of particle numbers
+        Input:
+            - particle_config: the particle configuration to translate
+        Output:
+            - list of numbers of particles
+        """
+        configuration = particle_config.configuration
+        return [configuration.get(node, 0) for node in self.nodes]
+
+    def particle_config_from(self, particles: list[int], particle_config: ParticleConfig) -> dict[Node, int]:
+        """
+        Translate a list of particle numbers back to a configuration dict
+        Input:
+            - particles: list of numbers of particles
+            - particle_config: the ParticleConfig giving the keys to keep (and their order)
+        Output:
+            - dict {node: number of particles}
+        """
+        configuration = dict(particle_config.configuration)
+        for node, k in zip(self.nodes, particles):
+            if k or node in configuration:
+                configuration[node] = k
+        return configuration
+
+    def worklist(self, nodes: list[Node], particles: list[int], sign: int=1) -> deque:
+        """
+        Give the worklist of the non sink nodes holding particles (sign=1) or antiparticles (sign=-1)
+        Input:
+            - nodes: the candidate nodes in the order in which they should be routed
+            - particles: list of numbers of particles
+            - sign: 1 for particles, -1 for antiparticles
+        Output:
+            - deque of node indices
+        """
+        node_index = self.node_index
+        is_sink = self.is_sink
+        indices = dict()
+        for node in nodes:
+            i = node_index.get(node)
+            if i is not None and not is_sink[i] and particles[i] * sign > 0:
+                indices[i] = None
+        return deque(indices)
+
+    def route(self, rotors: list[int], particles: list[int], worklist: deque, sign: int=1,
+              turn_and_move: bool=False, counters: RoutingCounters=None, log: list[tuple[int, int]]=None,
+              batch: bool=False) -> int:
+        """
+        Route in place all the particles (sign=1) or antiparticles (sign=-1) to the sinks.
+        The fired node is always the oldest node of the worklist: it fires until it is empty
+        and the nodes which receive their first particle are appended to the worklist.
+        Input:
+            - rotors: list of rotor indices, modified in place
+            - particles: list of numbers of particles, modified in place
+            - worklist: deque of the non sink node indices holding particles, consumed in place
+            - sign: 1 to route particles, -1 to route antiparticles
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+              (reversed for antiparticles, as in RotorGraph.reverse_step)
+            - counters: RoutingCounters to update (optional)
+            - log: list where to append the pairs (fired node index, number of consecutive steps) (optional)
+            - batch: boolean (default: False),
+                if True: the k particles of a node are fired at once when k is larger than its out-degree (see fire_all)
+                else (False): the particles are fired one by one
+              both modes give exactly the same result
+        Output:
+            - number of steps done
+        """
+        if counters is None:
+            counters = self.new_counters()
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        is_sink = self.is_sink
+        edges_counter = counters.edges
+        nodes_counter = counters.nodes
+        last_visit = counters.last_visit
+        turn_first = turn_and_move if sign > 0 else not turn_and_move
+        nb_steps = counters.nb_steps
+        start = nb_steps
+
+        while worklist:
+            u = worklist.popleft()
+            offset = offsets[u]
+            degree = degrees[u]
+            r = rotors[u]
+            first_step = nb_steps
+            while (k := particles[u] * sign) > 0:
+                if batch and k > degree:
+                    # fire the k particles at once
+                    rotors[u] = r
+                    counters.nb_steps = nb_steps
+                    for v in self.fire_all(rotors, particles, u, k, sign, turn_and_move, counters):
+                        if v != u and not is_sink[v]:
+                            worklist.append(v)
+                    r = rotors[u]
+                    nb_steps = counters.nb_steps
+                    continue
+
+                if turn_first:
+                    r += 1
+                    if r == degree: r = 0
+                    pos = offset + r
+                else:
+                    pos = offset + r
+                    r += 1
+                    if r == degree: r = 0
+
+                v = heads[pos]
+                particles[u] -= sign
+                particles[v] += sign
+                if particles[v] == sign and v != u and not is_sink[v]:
+                    worklist.append(v)
+
+                edges_counter[pos] += 1
+                nodes_counter[v] += 1
+                last_visit[u] = nb_steps
+                nb_steps += 1
+                last_visit[v] = nb_steps
+            rotors[u] = r
+            if log is not None and nb_steps > first_step:
+                log.append((u, nb_steps - first_step))
+
+        counters.nb_steps = nb_steps
+        return nb_steps - start
+
+    def iter_steps(self, rotors: list[int], particles: list[int], worklist: deque, sign: int=1,
+                   turn_and_move: bool=False):
+        """
+        Same as route but lazy: each step is done when the next one is asked.
+        rotors, particles and worklist are always up to date between two steps,
+        so the routing can be resumed with a new call.
+        Input:
+            - rotors: list of rotor indices, modified in place
+            - particles: list of numbers of particles, modified in place
+            - worklist: deque of the non sink node indices holding particles, consumed in place
+            - sign: 1 to route particles, -1 to route antiparticles
+            - turn_and_move: same meaning as in route
+        Output:
+            - generator of (fired node index, edge position, successor index)
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        is_sink = self.is_sink
+        turn_first = turn_and_move if sign > 0 else not turn_and_move
+
+        while worklist:
+            u = worklist[0]
+            offset = offsets[u]
+            degree = degrees[u]
+            while particles[u] * sign > 0:
+                r = rotors[u]
+                if turn_first:
+                    r = (r + 1) % degree
+                    pos = offset + r
+                else:
+                    pos = offset + r
+                    r = (r + 1) % degree
+                rotors[u] = r
+
+                v = heads[pos]
+                particles[u] -= sign
+                particles[v] += sign
+                if particles[v] == sign and v != u and not is_sink[v]:
+                    worklist.append(v)
+                yield u, pos, v
+            worklist.popleft()
+
+    def fire_all(self, rotors: list[int], particles: list[int], u: int, k: int, sign: int=1,
+                 turn_and_move: bool=False, counters: RoutingCounters=None) -> list[int]:
+        """
+        Fire k particles (or antiparticles) of the node u at once, with the rotor period arithmetic:
+        each out-edge of u receives k // d particles and the k % d first edges from the rotor
+        position receive one more (d is the out-degree of u).
+        The result (including the counters) is the same as k successive steps from u.
+        Input:
+            - rotors: list of rotor indices, modified in place
+            - particles: list of numbers of particles, modified in place
+            - u: index of the node to fire
+            - k: number of particles to fire
+            - sign: 1 for particles, -1 for antiparticles
+            - turn_and_move: same meaning as in route
+            - counters: RoutingCounters to update (optional)
+        Output:
+            - list of the node indices which hold particles (or antiparticles) since this firing,
+            in the order in which they received their first particle
+        """
+        degree = self.degrees[u]
+        offset = self.offsets[u]
+        heads = self.heads
+        turn_first = turn_and_move if sign > 0 else not turn_and_move
+        q, rem = divmod(k, degree)
+        r = rotors[u]
+        first = (r + 1) % degree if turn_first else r
+        rotors[u] = (r + k) % degree
+        particles[u] -= sign * k
+        if counters is None:
+            counters = self.new_counters()
+        nb_steps = counters.nb_steps
+        last_visit = counters.last_visit
+        last_visit[u] = nb_steps + k - 1
+
+        # times (relative to the first fire) of the arrivals on each head during one rotor period
+        arrivals = dict()
+        for j in range(degree if q else rem):
+            pos = offset + (first + j) % degree
+            v = heads[pos]
+            c = q + (j < rem)
+            if v in arrivals:
+                arrivals[v][1].append(j)
+            else:
+                arrivals[v] = (particles[v] * sign, [j])
+            particles[v] += sign * c
+            counters.edges[pos] += c
+            counters.nodes[v] += c
+            # last fire with this edge
+            last = nb_steps + j + (c - 1) * degree + 1
+            if v == u or len(arrivals[v][1]) > 1:
+                if last > last_visit[v]: last_visit[v] = last
+            else:
+                last_visit[v] = last
+        counters.nb_steps = nb_steps + k
+
+        # nodes becoming active, ordered by the time of the arrival which activated them
+        activated = list()
+        for v, (before, times) in arrivals.items():
+            if before <= 0 and particles[v] * sign > 0:
+                n, i = divmod(-before, len(times))
+                activated.append((n * degree + times[i], v))
+        if len(activated) > 1:
+            activated.sort()
+        return [v for _, v in activated]
+
+    def replay(self, rotors: list[int], particles: list[int], log: list[tuple[int, int]], sign: int=1,
+               turn_and_move: bool=False):
+        """
+        Replay in place the fired nodes of a log, yielding after each step
+        Input:
+            - rotors: list of rotor indices, modified in place
+            - particles: list of numbers of particles, modified in place
+            - log: list of pairs (fired node index, number of consecutive steps)
+            - sign: 1 for particles, -1 for antiparticles
+            - turn_and_move: same meaning as in route
+        Output:
+            - generator of (index of the fired node, its rotor index before the step, position of the taken edge),
+            the lists are updated before each yield
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        turn_first = turn_and_move if sign > 0 else not turn_and_move
+        for u, count in log:
+            for _ in range(count):
+                old = r = rotors[u]
+                if turn_first:
+                    r = (r + 1) % degrees[u]
+                    pos = offsets[u] + r
+                else:
+                    pos = offsets[u] + r
+                    r = (r + 1) % degrees[u]
+                rotors[u] = r
+                particles[u] -= sign
+                particles[heads[pos]] += sign
+                yield u, old, pos
+
+    def fire_odometer(self, rotors: list[int], particles: list[int], odometer: list[int],
+                      turn_and_move: bool=False, counters: RoutingCounters=None):
+        """
+        Fire every node u odometer[u] times with the rotor period arithmetic, whatever its number of particles
+        (the numbers of particles can become negative). The last visits are not updated.
+        Input:
+            - rotors: list of rotor indices, modified in place
+            - particles: list of numbers of particles, modified in place
+            - odometer: number of times each node fires
+            - turn_and_move: same meaning as in route
+            - counters: RoutingCounters to update (optional)
+        No output
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        for u, k in enumerate(odometer):
+            if k <= 0:
+                continue
+            degree = degrees[u]
+            q, rem = divmod(k, degree)
+            r = rotors[u]
+            first = (r + 1) % degree if turn_and_move else r
+            rotors[u] = (r + k) % degree
+            particles[u] -= k
+            for j in range(degree if q else rem):
+                pos = offsets[u] + (first + j) % degree
+                c = q + (j < rem)
+                particles[heads[pos]] += c
+                if counters is not None:
+                    counters.edges[pos] += c
+                    counters.nodes[heads[pos]] += c
+            if counters is not None:
+                counters.nb_steps += k
+
+    def last_exits_acyclic(self, rotors: list[int], odometer: list[int], turn_and_move: bool=False) -> bool:
+        """
+        Check that the last exit edges of the fired nodes form an acyclic graph
+        (with no particle left on the non sink nodes, it means that the odometer is the one of the legal routing)
+        Input:
+            - rotors: list of the rotor indices after the firing
+            - odometer: number of times each node fired
+            - turn_and_move: same meaning as in route
+        Output:
+            - True if there is no cycle
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        state = [0] * len(self.nodes) # 0: not seen, 1: on the current path, 2: done
+        for start in range(len(odometer)):
+            u = start
+            path = list()
+            while odometer[u] > 0 and state[u] == 0:
+                state[u] = 1
+                path.append(u)
+                last = rotors[u] if turn_and_move else (rotors[u] - 1) % degrees[u]
+                u = heads[offsets[u] + last]
+            if state[u] == 1 and odometer[u] > 0:
+                return False
+            for v in path:
+                state[v] = 2
+        return True
+
+    def rotor_cycles(self, rotors: list[int]) -> list[list[int]]:
+        """
+        Find the cycles of a rotor configuration (the sinks have no rotor)
+        Input:
+            - rotors: list of rotor indices
+        Output:
+            - list of cycles (lists of node indices)
+        """
+        offsets = self.offsets
+        heads = self.heads
+        is_sink = self.is_sink
+        state = [0] * len(self.nodes) # 0: not seen, 1: on the current path, 2: done
+        cycles = list()
+        for start in range(len(self.nodes)):
+            u = start
+            path = list()
+            while not is_sink[u] and state[u] == 0:
+                state[u] = 1
+                path.append(u)
+                u = heads[offsets[u] + rotors[u]]
+            if not is_sink[u] and state[u] == 1:
+                cycles.append(path[path.index(u):])
+            for v in path:
+                state[v] = 2
+        return cycles
+
+    def destination_forest(self, rotors: list[int], stop: list[bool]=None):
+        """
+        Push cycles until the rotor configuration is acyclic, in place (the single implementation,
+        used by RotorConfig.destination_forest). The cycles are popped during a single traversal
+        (the result does not depend on the order of the pushes): a path is followed from each node until
+        a sink or a node already leading to a sink, and each cycle closed by the path is pushed at once,
+        so the work is linear in the number of turns.
+        Input:
+            - rotors: list of rotor indices, modified in place
+            - stop: list of booleans, the walks also stop on these nodes and their rotors are not turned (optional)
+        No output
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        done = list(self.is_sink) # nodes leading to a sink in the final forest
+        if stop is not None:
+            done = [sink or stopped for sink, stopped in zip(done, stop)]
+        position = [-1] * len(self.nodes) # position in the current path
+        for start in range(len(self.nodes)):
+            path = list()
+            u = start
+            while not done[u]:
+                if position[u] >= 0:
+                    # pop the cycle closed by u and walk again from u
+                    i = position[u]
+                    for v in path[i:]:
+                        rotors[v] = (rotors[v] + 1) % degrees[v]
+                        position[v] = -1
+                    del path[i:]
+                    continue
+                position[u] = len(path)
+                path.append(u)
+                u = heads[offsets[u] + rotors[u]]
+            for v in path:
+                done[v] = True
+                position[v] = -1
+
+    def class_key(self, rotors: list[int]) -> bytes:
+        """
+        Give a hashable key of the class of a rotor configuration:
+        the encoding of its destination forest (as in CompactRotorConfig)
+        Input:
+            - rotors: list of rotor indices (not modified)
+        Output:
+            - the key
+        """
+        forest = list(rotors)
+        self.destination_forest(forest)
+        for u, sink in enumerate(self.is_sink):
+            if sink:
+                forest[u] = 0
+        return rotorconfig.CompactRotorConfig(self, forest).rotors
+
+    def reaches_sinks(self) -> bool:
+        """
+        Check that a sink can be reached from every node
+        No input
+        Output:
+            - True if every node reaches a sink
+        """
+        predecessors = [list() for _ in self.nodes]
+        for u in range(len(self.nodes)):
+            for pos in range(self.offsets[u], self.offsets[u+1]):
+                predecessors[self.heads[pos]].append(u)
+        reached = list(self.is_sink)
+        stack = [u for u, sink in enumerate(self.is_sink) if sink]
+        while stack:
+            v = stack.pop()
+            for u in predecessors[v]:
+                if not reached[u]:
+                    reached[u] = True
+                    stack.append(u)
+        return all(reached)
+
+    def random_acyclic_rotors(self, rng: Random) -> list[int]:
+        """
+        Draw a uniformly random acyclic rotor configuration (oriented spanning forest rooted at the sinks)
+        with Wilson's algorithm: loop-erased random walks from every node until the forest already built.
+        The expected time is the mean hitting time of the sinks, not the number of configurations.
+        Every node has to reach a sink (see reaches_sinks).
+        Input:
+            - rng: the random number generator (random.Random)
+        Output:
+            - list of rotor indices (0 for the sinks)
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        random = rng.random
+        in_forest = list(self.is_sink)
+        rotors = [0] * len(self.nodes)
+        for start in range(len(self.nodes)):
+            # random walk, the last exit of each node erases the loops
+            u = start
+            while not in_forest[u]:
+                r = int(random() * degrees[u])
+                rotors[u] = r
+                u = heads[offsets[u] + r]
+            u = start
+            while not in_forest[u]:
+                in_forest[u] = True
+                u = heads[offsets[u] + rotors[u]]
+        return rotors
+
+    def walk_to_sink(self, u: int, rotors: list[int], turn_and_move: bool=False) -> (int, int):
+        """
+        Route a single particle from the node u to a sink (lightweight form of RotorGraph.route_one_particle)
+        Input:
+            - u: index of the starting node of the particle
+            - rotors: list of rotor indices, modified in place
+            - turn_and_move: same meaning as in route
+        Output:
+            - index of the reached sink
+            - number of steps
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        is_sink = self.is_sink
+        nb_steps = 0
+        while not is_sink[u]:
+            r = rotors[u]
+            if turn_and_move:
+                r += 1
+                if r == degrees[u]: r = 0
+                pos = offsets[u] + r
+            else:
+                pos = offsets[u] + r
+                r += 1
+                if r == degrees[u]: r = 0
+            rotors[u] = r
+            u = heads[pos]
+            nb_steps += 1
+        return u, nb_steps
+
+    def _walk(self, turn_and_move: bool=False):
+        """
+        Give the function making one step of a single walker (rotor walk) and the Zobrist hashes of the states
+        Input:
+            - turn_and_move: same meaning as in route
+        Output:
+            - step(u, rotors, h) -> (new node of the walker, new hash), updates rotors in place
+            - state_hash(u, rotors) -> hash of the state
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        if not all(degrees):
+            raise ValueError("Every node needs an out-edge for a rotor walk without sink")
+        generator = Random(0)
+        edge_keys = [generator.getrandbits(64) for _ in self.edges]
+        node_keys = [generator.getrandbits(64) for _ in self.nodes]
+
+        def step(u: int, rotors: list[int], h: int) -> (int, int):
+            offset = offsets[u]
+            old = r = rotors[u]
+            if turn_and_move:
+                r += 1
+                if r == degrees[u]: r = 0
+                pos = offset + r
+            else:
+                pos = offset + r
+                r += 1
+                if r == degrees[u]: r = 0
+            rotors[u] = r
+            v = heads[pos]
+            return v, h ^ edge_keys[offset + old] ^ edge_keys[offset + r] ^ node_keys[u] ^ node_keys[v]
+
+        def state_hash(u: int, rotors: list[int]) -> int:
+            h = node_keys[u]
+            for i, r in enumerate(rotors):
+                h ^= edge_keys[offsets[i] + r]
+            return h
+
+        return step, state_hash
+
+    def find_orbit(self, u: int, rotors: list[int], turn_and_move: bool=False) -> (int, int):
+        """
+        Find the periodic orbit of the rotor walk of a single walker on a graph without sink
+        with the cycle detection algorithm of Brent.
+        The states are compared by their Zobrist hashes (updated in O(1) per step) and then completely,
+        so only a constant number of states is stored.
+        Input:
+            - u: index of the starting node of the walker
+            - rotors: list of the initial rotor indices (not modified)
+            - turn_and_move: same meaning as in route
+        Output:
+            - pre-period (number of steps before entering the periodic orbit)
+            - period (number of steps of the orbit)
+        """
+        step, state_hash = self._walk(turn_and_move)
+        h0 = state_hash(u, rotors)
+
+        # find the period: the tortoise waits at the powers of two
+        power = period = 1
+        tortoise_u, tortoise_rotors, tortoise_h = u, list(rotors), h0
+        hare_rotors = list(rotors)
+        hare_u, hare_h = step(u, hare_rotors, h0)
+        while not (hare_h == tortoise_h and hare_u == tortoise_u and hare_rotors == tortoise_rotors):
+            if power == period:
+                tortoise_u, tortoise_rotors, tortoise_h = hare_u, list(hare_rotors), hare_h
+                power *= 2
+                period = 0
+            hare_u, hare_h = step(hare_u, hare_rotors, hare_h)
+            period += 1
+
+        # find the pre-period: the hare starts period steps ahead of the tortoise
+        tortoise_u, tortoise_rotors, tortoise_h = u, list(rotors), h0
+        hare_u, hare_rotors, hare_h = u, list(rotors), h0
+        for _ in range(period):
+            hare_u, hare_h = step(hare_u, hare_rotors, hare_h)
+        pre_period = 0
+        while not (hare_h == tortoise_h and hare_u == tortoise_u and hare_rotors == tortoise_rotors):
+            tortoise_u, tortoise_h = step(tortoise_u, tortoise_rotors, tortoise_h)
+            hare_u, hare_h = step(hare_u, hare_rotors, hare_h)
+            pre_period += 1
+
+        return pre_period, period
+
+    def walk(self, u: int, rotors: list[int], nb_steps: int, turn_and_move: bool=False,
+             counters: RoutingCounters=None) -> int:
+        """
+        Make nb_steps steps of the rotor walk of a single walker, ignoring the sinks
+        Input:
+            - u: index of the starting node of the walker
+            - rotors: list of rotor indices, modified in place
+            - nb_steps: number of steps
+            - turn_and_move: same meaning as in route
+            - counters: RoutingCounters to update (optional)
+        Output:
+            - index of the node of the walker after the steps
+        """
+        offsets = self.offsets
+        degrees = self.degrees
+        heads = self.heads
+        for _ in range(nb_steps):
+            r = rotors[u]
+            if turn_and_move:
+                r += 1
+                if r == degrees[u]: r = 0
+                pos = offsets[u] + r
+            else:
+                pos = offsets[u] + r
+                r += 1
+                if r == degrees[u]: r = 0
+            rotors[u] = r
+            v = heads[pos]
+            if counters is not None:
+                counters.edges[pos] += 1
+                counters.nodes[v] += 1
+                counters.last_visit[u] = counters.nb_steps
+                counters.nb_steps += 1
+                counters.last_visit[v] = counters.nb_steps
+            u = v
+        return u
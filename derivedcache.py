@@ -0,0 +1,66 @@
+from types_definition import *
+from collections import OrderedDict
+
+
+class DerivedCache(object):
+
+    def __init__(self, max_entries: int=32):
+        """
+        A least recently used cache of the structures derived from a RotorGraph
+        (compiled graph, laplacians, smith normal forms, counts...).
+        The keys contain the version of the graph, and every entry is dropped when the graph changes.
+            - max_entries: maximal number of entries, the least recently used one is evicted beyond it
+            - hits, misses: number of lookups which found (or not) their entry
+            - evictions: number of entries evicted because the cache was full
+            - invalidations: number of entries dropped because the graph changed
+        Input:
+            - max_entries: maximal number of entries (default: 32)
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries has to be positive")
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple, compute) -> object:
+        """
+        Give the entry of the key, computed and stored if it is missing
+        Input:
+            - key: hashable key (name, version, sinks, arguments)
+            - compute: function without argument computing the entry
+        Output:
+            - the entry
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def invalidate(self):
+        """
+        Drop every entry (the graph changed)
+        No output
+        """
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Output:
+            - dict of the counters (hits, misses, evictions, invalidations) and of the number of entries
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidations": self.invalidations, "entries": len(self.entries), "max_entries": self.max_entries}
+
+    def __len__(self) -> int:
+        return len(self.entries)
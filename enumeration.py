@@ -0,0 +1,427 @@
+from types_definition import *
+from multiprocessing import Pool, cpu_count
+from itertools import product
+from trajectory import _encode, _decode
+import hashlib
+import json
+import os
+import rotorconfig
+
+CHECKPOINT_VERSION = 1
+
+
+class MaxAggregate(object):
+
+    def __init__(self):
+        """
+        Keep the maximal value and the configurations reaching it (as max_steps.max_steps)
+            - best: the maximal value (None if no value)
+            - items: the configurations (rotor assignments) reaching it, in the order of the enumeration
+        """
+        self.best = None
+        self.items = list()
+
+    def add(self, value: object, item: tuple[int]):
+        """
+        Add the value of a configuration
+        Input:
+            - value: the value
+            - item: the configuration (rotor assignment)
+        No output
+        """
+        if self.best is None or value > self.best:
+            self.best = value
+            self.items = [item]
+        elif value == self.best:
+            self.items.append(item)
+
+    def merge(self, other: "MaxAggregate"):
+        """
+        Merge the aggregate of the next configurations
+        Input:
+            - other: MaxAggregate
+        No output
+        """
+        if other.best is None:
+            return
+        if self.best is None or other.best > self.best:
+            self.best = other.best
+            self.items = list(other.items)
+        elif other.best == self.best:
+            self.items += other.items
+
+    def result(self) -> (object, list[tuple[int]]):
+        """
+        Output:
+            - the maximal value
+            - the configurations reaching it
+        """
+        return self.best, self.items
+
+    def to_json(self) -> dict:
+        """
+        Output:
+            - the state of the aggregate as a JSON value (for the checkpoints)
+        """
+        return {"best": _encode(self.best), "items": [[int(r) for r in item] for item in self.items]}
+
+    def from_json(state: dict) -> "MaxAggregate":
+        """
+        Input:
+            - state: the JSON value given by to_json
+        Output:
+            - MaxAggregate
+        """
+        aggregate = MaxAggregate()
+        aggregate.best = _decode(state["best"])
+        aggregate.items = [tuple(item) for item in state["items"]]
+        return aggregate
+
+
+class CountAggregate(object):
+
+    def __init__(self):
+        """
+        Count the configurations with a true value (every configuration if the function gives None)
+            - count: the number of configurations
+        """
+        self.count = 0
+
+    def add(self, value: object, item: tuple[int]):
+        """
+        Add the value of a configuration
+        Input:
+            - value: the value
+            - item: the configuration (rotor assignment)
+        No output
+        """
+        if value is None or value:
+            self.count += 1
+
+    def merge(self, other: "CountAggregate"):
+        """
+        Merge the aggregate of the next configurations
+        Input:
+            - other: CountAggregate
+        No output
+        """
+        self.count += other.count
+
+    def result(self) -> int:
+        """
+        Output:
+            - the number of configurations
+        """
+        return self.count
+
+    def to_json(self) -> dict:
+        """
+        Output:
+            - the state of the aggregate as a JSON value (for the checkpoints)
+        """
+        return {"count": self.count}
+
+    def from_json(state: dict) -> "CountAggregate":
+        """
+        Input:
+            - state: the JSON value given by to_json
+        Output:
+            - CountAggregate
+        """
+        aggregate = CountAggregate()
+        aggregate.count = state["count"]
+        return aggregate
+
+
+class HistogramAggregate(object):
+
+    def __init__(self):
+        """
+        Count the configurations of each value
+            - histogram: dict {value: number of configurations}
+        """
+        self.histogram = dict()
+
+    def add(self, value: object, item: tuple[int]):
+        """
+        Add the value of a configuration
+        Input:
+            - value: the value
+            - item: the configuration (rotor assignment)
+        No output
+        """
+        self.histogram[value] = self.histogram.get(value, 0) + 1
+
+    def merge(self, other: "HistogramAggregate"):
+        """
+        Merge the aggregate of the next configurations
+        Input:
+            - other: HistogramAggregate
+        No output
+        """
+        for value, count in other.histogram.items():
+            self.histogram[value] = self.histogram.get(value, 0) + count
+
+    def result(self) -> dict[object, int]:
+        """
+        Output:
+            - dict {value: number of configurations}, sorted by value
+        """
+        return dict(sorted(self.histogram.items()))
+
+    def to_json(self) -> dict:
+        """
+        Output:
+            - the state of the aggregate as a JSON value (for the checkpoints, the values can be tuples)
+        """
+        return {"histogram": [[_encode(value), count] for value, count in self.histogram.items()]}
+
+    def from_json(state: dict) -> "HistogramAggregate":
+        """
+        Input:
+            - state: the JSON value given by to_json
+        Output:
+            - HistogramAggregate
+        """
+        aggregate = HistogramAggregate()
+        aggregate.histogram = {_decode(value): count for value, count in state["histogram"]}
+        return aggregate
+
+
+AGGREGATES = {"max": MaxAggregate, "count": CountAggregate, "histogram": HistogramAggregate}
+
+
+def shard_prefixes(radices: list[int], nb_shards: int) -> list[tuple[int]]:
+    """
+    Split the mixed-radix space of the rotor assignments into disjoint shards
+    Input:
+        - radices: the out-degree of each node, the first node is the most significant digit
+        - nb_shards: the minimum number of shards wanted
+    Output:
+        - list of prefixes (values of the first digits) in the order of enum_configurations
+    """
+    length = 0
+    size = 1
+    while length < len(radices) and size < nb_shards:
+        size *= radices[length]
+        length += 1
+    return list(product(*(range(radix) for radix in radices[:length])))
+
+
+def _suffixes(radices: list[int], last: tuple[int]=None):
+    """
+    Iterate over the mixed-radix numbers in lexicographic order
+    Input:
+        - radices: the radix of each digit
+        - last: the iteration starts after this number (optional)
+    Output:
+        - generator of tuples of digits
+    """
+    if last is None:
+        yield from product(*(range(radix) for radix in radices))
+        return
+    digits = list(last)
+    while True:
+        i = len(digits) - 1
+        while i >= 0 and digits[i] == radices[i] - 1:
+            digits[i] = 0
+            i -= 1
+        if i < 0:
+            return
+        digits[i] += 1
+        yield tuple(digits)
+
+
+def checkpoint_fingerprint(G: RotorGraph, sinks: set, function, aggregate: str, acyclic: bool, compact: bool,
+                           nb_shards: int, prefix: tuple[int]) -> dict:
+    """
+    Identify the enumeration a checkpoint belongs to: a checkpoint is only resumed by the same enumeration
+    (same aggregate, function, graph, sinks, options and shards)
+    Input:
+        - G: the RotorGraph
+        - sinks: set of the sinks
+        - function: the evaluated function
+        - aggregate: the name of the aggregate
+        - acyclic, compact: the options of the enumeration
+        - nb_shards: the number of shards
+        - prefix: the prefix of the shard
+    Output:
+        - dict of JSON values
+    """
+    graph = hashlib.sha256()
+    for node, edges in G.rotor_order.items():
+        graph.update(repr((node, edges)).encode())
+    graph.update(repr(sorted(repr(sink) for sink in sinks)).encode())
+    return {"aggregate": AGGREGATES[aggregate].__name__,
+            "function": f"{function.__module__}.{function.__qualname__}",
+            "graph": graph.hexdigest(),
+            "acyclic": acyclic,
+            "compact": compact,
+            "nb_shards": nb_shards,
+            "prefix": list(prefix)}
+
+
+def _write_checkpoint(path: str, state: dict):
+    """
+    Write a checkpoint (JSON) atomically (the previous one is replaced only when the new one is complete)
+    Input:
+        - path: the path of the checkpoint file
+        - state: the state of the shard
+    No output
+    """
+    data = {"version": CHECKPOINT_VERSION, "fingerprint": state["fingerprint"],
+            "last": None if state["last"] is None else [int(r) for r in state["last"]],
+            "count": state["count"], "done": state["done"], "aggregate": state["aggregate"].to_json()}
+    with open(path + ".tmp", "w") as file:
+        json.dump(data, file)
+    os.replace(path + ".tmp", path)
+
+
+def _read_checkpoint(path: str, fingerprint: dict, aggregate_name: str) -> dict:
+    """
+    Read a checkpoint written by _write_checkpoint
+    Input:
+        - path: the path of the checkpoint file
+        - fingerprint: the fingerprint of the enumeration (see checkpoint_fingerprint)
+        - aggregate_name: the name of the aggregate
+    Output:
+        - the state of the shard
+    """
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError(f"The checkpoint {path} is not a JSON checkpoint")
+    if not isinstance(data, dict) or data.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"The checkpoint {path} has an unsupported version")
+    if data["fingerprint"] != fingerprint:
+        raise ValueError(f"The checkpoint {path} belongs to another enumeration")
+    return {"fingerprint": fingerprint, "last": None if data["last"] is None else tuple(data["last"]),
+            "count": data["count"], "done": data["done"],
+            "aggregate": AGGREGATES[aggregate_name].from_json(data["aggregate"])}
+
+
+def _run_shard(args: tuple) -> object:
+    """
+    Worker of sharded_enumeration: evaluate the function on every configuration of a shard
+    Input:
+        - args: (graph, sinks, function, aggregate name, acyclic, compact, prefix, checkpoint path,
+            checkpoint interval, fingerprint of the enumeration)
+    Output:
+        - the aggregate of the shard
+    """
+    G, sinks, function, aggregate_name, acyclic, compact, prefix, path, interval, fingerprint = args
+    state = {"fingerprint": fingerprint, "last": None, "count": 0, "done": False,
+             "aggregate": AGGREGATES[aggregate_name]()}
+    if path is not None and os.path.exists(path):
+        state = _read_checkpoint(path, fingerprint, aggregate_name)
+    if state["done"]:
+        return state["aggregate"]
+
+    compiled = G.compile(sinks)
+    nodes = [node for node in G.rotor_order.keys() if node not in sinks]
+    indices = [compiled.node_index[node] for node in nodes]
+    aggregate = state["aggregate"]
+    rotors = [0] * len(compiled.nodes)
+
+    if acyclic:
+        assignments = G.enum_spanning_forests(sinks, compact=True, prefix=prefix,
+                                              start=None if state["last"] is None else list(state["last"]))
+    else:
+        radices = [len(G.rotor_order[node]) for node in nodes[len(prefix):]]
+        last = None if state["last"] is None else state["last"][len(prefix):]
+        assignments = (prefix + suffix for suffix in _suffixes(radices, last))
+
+    for assignment in assignments:
+        assignment = tuple(assignment)
+        if compact:
+            for i, r in zip(indices, assignment):
+                rotors[i] = r
+            value = function(compiled, rotors)
+        else:
+            config = rotorconfig.RotorConfig({node: G.rotor_order[node][r] for node, r in zip(nodes, assignment)})
+            value = function(G, config)
+        aggregate.add(value, assignment)
+        state["last"] = assignment
+        state["count"] += 1
+        if path is not None and state["count"] % interval == 0:
+            _write_checkpoint(path, state)
+
+    state["done"] = True
+    if path is not None:
+        _write_checkpoint(path, state)
+    return aggregate
+
+
+def sharded_enumeration(G: RotorGraph, function, aggregate: str="max", sinks: set=None, acyclic: bool=False,
+                        compact: bool=False, nb_shards: int=None, processes: int=None,
+                        checkpoint_dir: str=None, checkpoint_interval: int=100000) -> object:
+    """
+    Evaluate a function on every rotor configuration (or every acyclic configuration) of the graph
+    and aggregate the values. The configurations are split into disjoint shards by prefix of the
+    rotor assignment (the non sink nodes of rotor_order, as in enum_configurations), which are run by a pool of processes.
+    With a checkpoint directory, every shard periodically writes its position (last rotor assignment done)
+    and its aggregate in it (JSON file), and a restarted enumeration resumes from the last checkpoints.
+    A checkpoint records the fingerprint of its enumeration (see checkpoint_fingerprint): a checkpoint of another
+    aggregate, function, graph, set of sinks, option or number of shards is rejected (ValueError).
+    Input:
+        - G: the RotorGraph
+        - function: function (RotorGraph, RotorConfig) -> value, or (CompiledRotorGraph, list of rotor indices) -> value
+            if compact, defined at the top level of a module (it is sent to the processes)
+        - aggregate: "max" (maximal value and configurations reaching it), "count" (number of configurations
+            with a true value) or "histogram" (number of configurations of each value) (default: "max")
+        - sinks: set of nodes that are considered as sinks (optional)
+        - acyclic: boolean (default: False), if True only the acyclic configurations are enumerated
+        - compact: boolean (default: False), if True the function gets the compiled graph and the rotor indices
+        - nb_shards: minimum number of shards (default: 4 times the number of processes)
+        - processes: number of processes (default: number of cpus)
+        - checkpoint_dir: directory of the checkpoints (optional, the values of the function then have to be
+            None, booleans, numbers, strings, or tuples and lists of them)
+        - checkpoint_interval: number of configurations between two checkpoints of a shard (default: 100000)
+    Output:
+        - the result of the aggregate (the configurations are rotor assignments, see assignment_to_config)
+    """
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate {aggregate}, use one of {list(AGGREGATES)}")
+    if checkpoint_interval <= 0:
+        raise ValueError("checkpoint_interval has to be positive")
+    if sinks == None:
+        if G.sinks:
+            sinks = G.sinks
+        else: raise Exception("No sink in the graph: cannot find an acyclic configuration.")
+    if processes is None:
+        processes = cpu_count()
+    if nb_shards is None:
+        nb_shards = 4 * processes
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    nodes = [node for node in G.rotor_order.keys() if node not in sinks]
+    prefixes = shard_prefixes([len(G.rotor_order[node]) for node in nodes], nb_shards)
+    tasks = [(G, sinks, function, aggregate, acyclic, compact, prefix,
+              None if checkpoint_dir is None else os.path.join(checkpoint_dir, f"shard_{i}.ckpt"),
+              checkpoint_interval,
+              checkpoint_fingerprint(G, sinks, function, aggregate, acyclic, compact, len(prefixes), prefix))
+             for i, prefix in enumerate(prefixes)]
+
+    total = AGGREGATES[aggregate]()
+    with Pool(processes) as pool:
+        for shard_aggregate in pool.imap(_run_shard, tasks):
+            total.merge(shard_aggregate)
+    return total.result()
+
+
+def assignment_to_config(G: RotorGraph, assignment: tuple[int], sinks: set=None) -> RotorConfig:
+    """
+    Translate a rotor assignment given by sharded_enumeration to a RotorConfig
+    Input:
+        - G: the RotorGraph
+        - assignment: the rotor indices of the non sink nodes of rotor_order
+        - sinks: set of nodes that are considered as sinks (optional)
+    Output:
+        - RotorConfig
+    """
+    if sinks == None:
+        sinks = G.sinks
+    nodes = [node for node in G.rotor_order.keys() if node not in sinks]
+    return rotorconfig.RotorConfig({node: G.rotor_order[node][r] for node, r in zip(nodes, assignment)})
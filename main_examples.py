@@ -161,7 +161,7 @@ if __name__ == "__main__":
     #smith_normal_form()
     G = RotorGraph.simple_path()
     rho = RotorConfig(G)
-    _, info = G.route_one_particle(2, rho)
+    _, info = G.route_one_particle(2, rho, history="all")
     for rho, sigma in info.configuration_history:
         display_path(rho, sigma)
 
@@ -1,4 +1,518 @@
 from smithnormalform import matrix, snfproblem, z
+import numpy as np
+from math import gcd
+from heapq import heappush, heappop
+
+def bareiss_determinant(rows: list[list[int]] or list[dict[int, int]]) -> int:
+    """
+    Compute the determinant of an integer square matrix with the fraction-free Bareiss elimination
+    (exact integer arithmetic, every division is exact).
+    The rows are kept sparse and a row is only updated when it has a non zero entry in the pivot column
+    (the scalings of the other rows telescope and are applied at once when the row is needed),
+    so a banded matrix of size n and bandwidth b costs O(n*b^2) operations instead of O(n^3).
+    Input:
+        - rows: list of the rows of the matrix, as lists or as dicts {column: value} (not modified)
+    Output:
+        - the determinant
+    """
+    n = len(rows)
+    a = list()
+    for row in rows:
+        if isinstance(row, dict):
+            a.append({j: v for j, v in row.items() if v})
+        else:
+            if len(row) != n:
+                raise ValueError("The matrix has to be square")
+            a.append({j: v for j, v in enumerate(row) if v})
+    columns = [set() for _ in range(n)] # rows with a non zero entry in each column
+    for i, row in enumerate(a):
+        for j in row:
+            if not 0 <= j < n:
+                raise ValueError("The matrix has to be square")
+            columns[j].add(i)
+    stamp = [0] * n # the stored row i is the row of the matrix before the step stamp[i] of the elimination
+    pivots = [1] # pivots[k+1] is the pivot of the step k, pivots[0] = 1
+    sign = 1
+
+    def materialize(i: int, k: int):
+        # bring the row i to the matrix before the step k
+        if stamp[i] < k:
+            num, den = pivots[k], pivots[stamp[i]]
+            if num != den:
+                row = a[i]
+                for j in row:
+                    row[j] = row[j] * num // den
+            stamp[i] = k
+
+    for k in range(n):
+        if k not in a[k]:
+            # pivoting: swap with a row below with a non zero entry in column k
+            below = [i for i in columns[k] if i > k]
+            if not below:
+                return 0
+            i = min(below)
+            for j in a[k]:
+                columns[j].discard(k)
+            for j in a[i]:
+                columns[j].discard(i)
+            a[k], a[i] = a[i], a[k]
+            for j in a[k]:
+                columns[j].add(k)
+            for j in a[i]:
+                columns[j].add(i)
+            stamp[k], stamp[i] = stamp[i], stamp[k]
+            sign = -sign
+        materialize(k, k)
+        row_k = a[k]
+        pivot = row_k[k]
+        previous = pivots[k]
+        for i in [i for i in columns[k] if i > k]:
+            materialize(i, k)
+            row_i = a[i]
+            factor = row_i.pop(k)
+            columns[k].discard(i)
+            for j in row_i:
+                row_i[j] = pivot * row_i[j]
+            for j, v in row_k.items():
+                if j > k:
+                    if j in row_i:
+                        row_i[j] -= factor * v
+                    else:
+                        row_i[j] = -factor * v
+                        columns[j].add(i)
+            for j in list(row_i):
+                value = row_i[j] // previous
+                if value:
+                    row_i[j] = value
+                else:
+                    del row_i[j]
+                    columns[j].discard(i)
+            stamp[i] = k + 1
+        pivots.append(pivot)
+    return sign * pivots[n]
+
+
+def _extended_gcd(a: int, b: int) -> (int, int, int):
+    """
+    Input:
+        - a, b: integers
+    Output:
+        - g, x, y such that g = x*a + y*b is a gcd of a and b
+    """
+    x0, y0, x1, y1 = 1, 0, 0, 1
+    while b:
+        q, r = divmod(a, b)
+        a, b = b, r
+        x0, y0, x1, y1 = x1, y1, x0 - q*x1, y0 - q*y1
+    return a, x0, y0
+
+
+def _diagonalize(a: list[list[int]], modulus: int=0, srows: list[list[int]]=None, tcols: list[list[int]]=None,
+                 divisibility: bool=True) -> list[int]:
+    """
+    Diagonalize in place a dense integer matrix with unimodular row and column operations
+    (the pivot is the smallest non zero entry, the other entries of its row and column are cleared
+    with the 2x2 unimodular combinations given by the extended gcd modulo modulus, else by euclidean divisions
+    which keep the entries smaller over the integers)
+    Input:
+        - a: the matrix, list of rows (modified)
+        - modulus: if not 0, the entries (and the rows of the row transform) are reduced modulo it after each
+            operation (the diagonal is then the one of the lattice of the columns plus modulus * Z^n)
+        - srows: rows of the row transform, the row operations on a are applied to them (optional)
+        - tcols: columns of the column transform, the column operations on a are applied to them (optional)
+        - divisibility: boolean (default: True), if True each pivot divides the next ones (smith normal form)
+    Output:
+        - the diagonal
+    """
+    r = len(a)
+    q = len(a[0]) if r else 0
+    if modulus:
+        for row in a:
+            for j in range(q):
+                row[j] %= modulus
+
+    def combine(u: list[int], v: list[int], x: int, y: int, z: int, w: int, reduce: bool):
+        # (u, v) = (x*u + y*v, z*u + w*v)
+        if x == 1 and y == 0 and w == 1:
+            # v += z*u (the usual elimination)
+            for j, uj in enumerate(u):
+                if uj:
+                    v[j] = (v[j] + z*uj) % modulus if reduce else v[j] + z*uj
+            return
+        for j in range(len(u)):
+            uj, vj = u[j], v[j]
+            if uj or vj:
+                uj, vj = x*uj + y*vj, z*uj + w*vj
+                if reduce:
+                    uj %= modulus
+                    vj %= modulus
+                u[j], v[j] = uj, vj
+
+    def combine_rows(k: int, i: int, x: int, y: int, z: int, w: int):
+        combine(a[k], a[i], x, y, z, w, bool(modulus))
+        if srows is not None:
+            combine(srows[k], srows[i], x, y, z, w, bool(modulus))
+
+    def combine_columns(k: int, j: int, x: int, y: int, z: int, w: int):
+        for row in a:
+            uk, vj = row[k], row[j]
+            if uk or vj:
+                uk, vj = x*uk + y*vj, z*uk + w*vj
+                if modulus:
+                    uk %= modulus
+                    vj %= modulus
+                row[k], row[j] = uk, vj
+        if tcols is not None:
+            combine(tcols[k], tcols[j], x, y, z, w, False)
+
+    def swap_rows(i: int, k: int):
+        a[i], a[k] = a[k], a[i]
+        if srows is not None:
+            srows[i], srows[k] = srows[k], srows[i]
+
+    def swap_columns(j: int, k: int):
+        for row in a:
+            row[j], row[k] = row[k], row[j]
+        if tcols is not None:
+            tcols[j], tcols[k] = tcols[k], tcols[j]
+
+    for k in range(min(r, q)):
+        best = None
+        for i in range(k, r):
+            row = a[i]
+            for j in range(k, q):
+                if row[j] and (best is None or abs(row[j]) < best[0]):
+                    best = (abs(row[j]), i, j)
+            if best is not None and best[0] == 1:
+                break
+        if best is None:
+            break
+        swap_rows(k, best[1])
+        swap_columns(k, best[2])
+
+        while True:
+            for i in range(k+1, r):
+                b = a[i][k]
+                if b:
+                    p = a[k][k]
+                    if b % p == 0:
+                        combine_rows(k, i, 1, 0, -(b // p), 1)
+                    elif modulus:
+                        g, x, y = _extended_gcd(p, b)
+                        combine_rows(k, i, x, y, -(b // g), p // g)
+                    else:
+                        # euclidean division (rounded), the remainder is smaller than half the pivot
+                        combine_rows(k, i, 1, 0, -((2*b + p) // (2*p)), 1)
+            for j in range(k+1, q):
+                b = a[k][j]
+                if b:
+                    p = a[k][k]
+                    if b % p == 0:
+                        combine_columns(k, j, 1, 0, -(b // p), 1)
+                    elif modulus:
+                        g, x, y = _extended_gcd(p, b)
+                        combine_columns(k, j, x, y, -(b // g), p // g)
+                    else:
+                        combine_columns(k, j, 1, 0, -((2*b + p) // (2*p)), 1)
+            if not modulus:
+                # the smallest remainder becomes the pivot
+                i = min((i for i in range(k+1, r) if a[i][k]), key=lambda i: abs(a[i][k]), default=None)
+                j = min((j for j in range(k+1, q) if a[k][j]), key=lambda j: abs(a[k][j]), default=None)
+                if i is not None and (j is None or abs(a[i][k]) <= abs(a[k][j])):
+                    swap_rows(k, i)
+                    continue
+                if j is not None:
+                    swap_columns(k, j)
+                    continue
+            # the column operations can fill the column of the pivot again (with a smaller pivot)
+            elif any(a[i][k] for i in range(k+1, r)):
+                continue
+            if divisibility:
+                pivot = a[k][k]
+                i = next((i for i in range(k+1, r) if any(a[i][j] % pivot for j in range(k+1, q))), None)
+                if i is not None:
+                    combine_rows(k, i, 1, 1, 0, 1)
+                    continue
+            break
+
+        if a[k][k] < 0 and not modulus:
+            a[k][k] = -a[k][k]
+            if srows is not None:
+                srows[k] = [-v for v in srows[k]]
+
+    return [a[k][k] for k in range(min(r, q))]
+
+
+def _divisibility_chain(values: list[int]) -> list[int]:
+    """
+    Give the smith normal form of a diagonal matrix (each value divides the next one, the zeros are at the end)
+    Input:
+        - values: the non negative diagonal
+    Output:
+        - the invariant factors
+    """
+    values = list(values)
+    for i in range(len(values)):
+        for j in range(i+1, len(values)):
+            a, b = values[i], values[j]
+            g = gcd(a, b)
+            values[i], values[j] = g, (a * b // g if g else 0)
+    return values
+
+
+def _sparse_rows(rows: list[list[int]] or list[dict[int, int]] or np.ndarray,
+                 nb_columns: int=None) -> (list[dict[int, int]], list[set[int]], int):
+    """
+    Copy the rows of an integer matrix as sparse rows and index their columns
+    Input:
+        - rows: list of the rows of the matrix, as lists or as dicts {column: value}, or an integer array (not modified)
+        - nb_columns: number of columns if the rows are dicts (default: the number of rows)
+    Output:
+        - the rows as dicts {column: non zero value}
+        - for each column, the set of the rows with a non zero entry in it
+        - the number of columns
+    """
+    if isinstance(rows, np.ndarray):
+        rows = rows.tolist()
+    n = len(rows)
+    if nb_columns is None:
+        nb_columns = n if not rows or isinstance(rows[0], dict) else len(rows[0])
+    m = nb_columns
+    a = list()
+    for row in rows:
+        if isinstance(row, dict):
+            a.append({j: int(v) for j, v in row.items() if v})
+        else:
+            if len(row) != m:
+                raise ValueError("The rows have to have the same length")
+            a.append({j: int(v) for j, v in enumerate(row) if v})
+    columns = [set() for _ in range(m)]
+    for i, row in enumerate(a):
+        for j in row:
+            if not 0 <= j < m:
+                raise ValueError(f"Column {j} out of range")
+            columns[j].add(i)
+    return a, columns, m
+
+
+def _unit_pivots(a: list[dict[int, int]], columns: list[set[int]], S: list[dict[int, int]]=None,
+                 Tt: list[list[int]]=None) -> (list[int], list[int]):
+    """
+    Eliminate in place the entries equal to 1 or -1 of a sparse matrix, by increasing fill-in cost
+    (checked again when popped): each pivot clears its column with row operations, its row is then left out
+    (it is cleared by the column operations, which are only applied to the column transform)
+    Input:
+        - a: the rows of the matrix as dicts {column: value} (modified)
+        - columns: for each column, the set of the rows with a non zero entry in it (modified)
+        - S: sparse rows {column: value} of the row transform, the row operations are applied to them (optional)
+        - Tt: columns of the column transform, the column operations are applied to them (optional)
+    Output:
+        - the rows of the pivots
+        - the columns of the pivots
+    """
+    def unit_entries(p: int):
+        row = a[p]
+        for c, v in row.items():
+            if v == 1 or v == -1:
+                heappush(candidates, ((len(row) - 1) * (len(columns[c]) - 1), p, c))
+
+    active_rows = set(range(len(a)))
+    pivot_rows, pivot_columns = list(), list()
+    candidates = list()
+    for p in range(len(a)):
+        unit_entries(p)
+    while candidates:
+        cost, p, c = heappop(candidates)
+        if p not in active_rows or a[p].get(c) not in (1, -1):
+            continue
+        current = (len(a[p]) - 1) * (len(columns[c]) - 1)
+        if current > cost:
+            heappush(candidates, (current, p, c))
+            continue
+        row_p = a[p]
+        e = row_p[c]
+        updated = columns[c] - {p}
+        for i in updated:
+            row_i = a[i]
+            f = row_i[c] * e
+            for j, v in row_p.items():
+                value = row_i.get(j, 0) - f * v
+                if value:
+                    if j not in row_i:
+                        columns[j].add(i)
+                    row_i[j] = value
+                elif j in row_i:
+                    del row_i[j]
+                    columns[j].discard(i)
+            if S is not None:
+                s_i = S[i]
+                for j, v in S[p].items():
+                    value = s_i.get(j, 0) - f * v
+                    if value:
+                        s_i[j] = value
+                    else:
+                        s_i.pop(j, None)
+        if Tt is not None:
+            t_c = Tt[c]
+            m = len(t_c)
+            for j, v in row_p.items():
+                if j != c:
+                    t_j = Tt[j]
+                    f = v * e
+                    for i in range(m):
+                        if t_c[i]:
+                            t_j[i] -= f * t_c[i]
+        if S is not None and e < 0:
+            S[p] = {j: -v for j, v in S[p].items()}
+        for j in row_p:
+            columns[j].discard(p)
+        active_rows.discard(p)
+        pivot_rows.append(p)
+        pivot_columns.append(c)
+        for i in updated:
+            unit_entries(i)
+    return pivot_rows, pivot_columns
+
+
+def _dense_block(a: list[dict[int, int]], pivot_rows: list[int], pivot_columns: list[int],
+                 m: int) -> (list[int], list[int], list[list[int]]):
+    """
+    Give the dense block of the rows and columns without pivot
+    Input:
+        - a: the rows of the matrix as dicts {column: value}
+        - pivot_rows, pivot_columns: the rows and columns of the pivots
+        - m: the number of columns
+    Output:
+        - the rows of the block
+        - the columns of the block
+        - the block, list of rows
+    """
+    removed_rows = set(pivot_rows)
+    block_rows = [i for i in range(len(a)) if i not in removed_rows]
+    removed = set(pivot_columns)
+    block_columns = [j for j in range(m) if j not in removed]
+    position = {j: k for k, j in enumerate(block_columns)}
+    block = [[0] * len(block_columns) for _ in block_rows]
+    for k, i in enumerate(block_rows):
+        for j, v in a[i].items():
+            block[k][position[j]] = v
+    return block_rows, block_columns, block
+
+
+def _dense_row(row: dict[int, int], n: int, modulus: int=0) -> list[int]:
+    """
+    Input:
+        - row: sparse row {column: value}
+        - n: the length of the row
+        - modulus: if not 0, the entries are reduced modulo it
+    Output:
+        - the row as a list
+    """
+    dense = [0] * n
+    for j, v in row.items():
+        dense[j] = v % modulus if modulus else v
+    return dense
+
+
+def smith_normal_form(rows: list[list[int]] or list[dict[int, int]] or np.ndarray, transforms: bool=False,
+                      nb_columns: int=None) -> list[int] or (list[int], list[list[int]], list[list[int]]):
+    """
+    Compute the smith normal form J = S * A * T of an integer matrix with exact integer arithmetic.
+    First every entry equal to 1 or -1 is used as a pivot on the sparse rows (chosen to limit the fill-in),
+    which gives an invariant factor 1 and removes its row and its column (the laplacian of a graph has many of them),
+    then the remaining dense block is diagonalized: modulo its determinant when only the invariant factors are wanted
+    (the entries stay smaller than the determinant), else over the integers with the transforms.
+    Input:
+        - rows: list of the rows of the matrix, as lists or as dicts {column: value}, or an integer array (not modified)
+        - transforms: boolean (default: False), if True also give the unimodular matrices S and T
+        - nb_columns: number of columns if the rows are dicts (default: the number of rows)
+    Output:
+        - the invariant factors (the diagonal of J, with a zero for each missing rank)
+        - if transforms: the matrices S (n x n) and T (m x m), as lists of rows, such that S * A * T = J
+    """
+    a, columns, m = _sparse_rows(rows, nb_columns)
+    n = len(a)
+    S, Tt = None, None
+    if transforms:
+        S = [{i: 1} for i in range(n)]
+        Tt = [[int(i == j) for j in range(m)] for i in range(m)] # T transposed: Tt[j] is the column j of T
+    pivot_rows, pivot_columns = _unit_pivots(a, columns, S, Tt)
+    block_rows, block_columns, block = _dense_block(a, pivot_rows, pivot_columns, m)
+
+    units = [1] * len(pivot_rows)
+    if transforms:
+        srows = [_dense_row(S[i], n) for i in block_rows]
+        tcols = [Tt[j] for j in block_columns]
+        diagonal = _diagonalize(block, srows=srows, tcols=tcols)
+        S = [_dense_row(S[i], n) for i in pivot_rows] + srows
+        Tt = [Tt[j] for j in pivot_columns] + tcols
+        T = [list(column) for column in zip(*Tt)] if m else list()
+        return units + diagonal, S, T
+
+    modulus = 0
+    if block and len(block_rows) == len(block_columns):
+        modulus = abs(bareiss_determinant(block))
+    if modulus:
+        diagonal = [gcd(d, modulus) for d in _diagonalize(block, modulus=modulus, divisibility=False)]
+    else:
+        diagonal = [abs(d) for d in _diagonalize(block, divisibility=False)]
+    diagonal = [d for d in diagonal if d != 1]
+    nontrivial = _divisibility_chain([d for d in diagonal if d] + [0] * diagonal.count(0))
+    return units + [1] * (min(n, m) - len(units) - len(nontrivial)) + nontrivial
+
+
+def cokernel_map(rows: list[list[int]] or list[dict[int, int]] or np.ndarray) -> (list[int], list[list[int]]):
+    """
+    Compute the invariant factors d1 | ... | dk (not equal to 1) of a non singular square integer matrix A
+    and a matrix U (k x n) such that v -> (U * v mod d1, ..., U * v mod dk) is an isomorphism
+    from Z^n / A * Z^n (the lattice of the columns) to Z/d1 x ... x Z/dk.
+    The rows of U are the rows of the transform S of the smith normal form with an invariant factor not equal to 1,
+    and they only matter modulo the determinant D of A (every di divides D): the unit pivots are eliminated exactly,
+    then the dense block is diagonalized modulo D with its row operations, which gives cyclic factors gcd(d, D),
+    finally put in divisibility order by the smith normal form of this small diagonal.
+    Input:
+        - rows: list of the rows of the matrix, as lists or as dicts {column: value}, or an integer array (not modified)
+    Output:
+        - the invariant factors not equal to 1
+        - the rows of U, each one reduced modulo its invariant factor
+    """
+    a, columns, m = _sparse_rows(rows)
+    n = len(a)
+    if n != m:
+        raise ValueError("The matrix has to be square")
+    S = [{i: 1} for i in range(n)]
+    pivot_rows, pivot_columns = _unit_pivots(a, columns, S)
+    block_rows, block_columns, block = _dense_block(a, pivot_rows, pivot_columns, m)
+    if len(block_rows) != len(block_columns):
+        raise ValueError("The matrix is singular")
+    if not block:
+        return list(), list()
+    modulus = abs(bareiss_determinant(block))
+    if not modulus:
+        raise ValueError("The matrix is singular")
+
+    srows = [_dense_row(S[i], n, modulus) for i in block_rows]
+    diagonal = _diagonalize(block, modulus=modulus, srows=srows, divisibility=False)
+    cyclic = [(gcd(d, modulus), row) for d, row in zip(diagonal, srows) if gcd(d, modulus) != 1]
+
+    # Z/g1 x ... x Z/gr to the invariant factors with the smith normal form of diag(g1, ..., gr)
+    r = len(cyclic)
+    square = [[g if i == j else 0 for j in range(r)] for i, (g, _) in enumerate(cyclic)]
+    small = [[int(i == j) for j in range(r)] for i in range(r)]
+    factors = _diagonalize(square, srows=small)
+    transform = list()
+    for d, coefficients in zip(factors, small):
+        if d == 1:
+            continue
+        row = [0] * n
+        for c, (_, cyclic_row) in zip(coefficients, cyclic):
+            if c:
+                for j, v in enumerate(cyclic_row):
+                    if v:
+                        row[j] += c * v
+        transform.append([v % d for v in row])
+    return [d for d in factors if d != 1], transform
+
 
 class Matrix(matrix.Matrix):
     
@@ -22,6 +536,27 @@ class Matrix(matrix.Matrix):
         values = [z.Z(v) for line in obj.values() for v in line.values()]
         matrix.Matrix.__init__(self, n, m, values)
 
+    def bareiss_determinant(self) -> int:
+        """
+        Compute the determinant with the fraction-free Bareiss elimination (see bareiss_determinant),
+        much faster than determinant for large matrices
+        No input
+        Output:
+            - the determinant (int)
+        """
+        return bareiss_determinant([list(line.values()) for line in self.dictionnary.values()])
+
+    def smith_normal_form(self, transforms: bool=False) -> list[int] or (list[int], list[list[int]], list[list[int]]):
+        """
+        Compute the smith normal form with native integers (see smith_normal_form), much faster than snf_problem
+        Input:
+            - transforms: boolean (default: False), if True also give S and T such that S * A * T = J
+        Output:
+            - the invariant factors (the diagonal of J)
+            - if transforms: the matrices S and T (lists of rows)
+        """
+        return smith_normal_form([list(line.values()) for line in self.dictionnary.values()], transforms)
+
     def snf_problem(self) -> snfproblem.SNFProblem:
         """
         Compute the smith normal form problem of the matrix
@@ -55,3 +590,277 @@ class Matrix(matrix.Matrix):
 
             
 
+
+
+class SparseMatrix(object):
+
+    def __init__(self, labels: list, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray):
+        """
+        A sparse square integer matrix in CSR format (compressed rows), the rows and the columns
+        are labelled (by the nodes for a laplacian matrix).
+        The entries of the row i are data[indptr[i]:indptr[i+1]] in the columns indices[indptr[i]:indptr[i+1]] (sorted).
+        Input:
+            - labels: list of the labels of the rows (and of the columns)
+            - indptr: array of the n+1 positions of the rows in indices and data
+            - indices: array of the column index of each entry
+            - data: array of the value of each entry
+        """
+        self.labels = list(labels)
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.int64)
+        if len(self.indptr) != len(self.labels) + 1:
+            raise ValueError("indptr has to have one more entry than labels")
+
+    def from_coo(labels: list, rows: list[int], columns: list[int], values: list[int]) -> "SparseMatrix":
+        """
+        Create a SparseMatrix from entries in COO format (the values of the same position are added, the zeros are dropped)
+        Input:
+            - labels: list of the labels of the rows (and of the columns)
+            - rows, columns, values: the row index, the column index and the value of each entry
+        Output:
+            - SparseMatrix
+        """
+        n = len(labels)
+        keys = np.asarray(rows, dtype=np.int64) * n + np.asarray(columns, dtype=np.int64)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(sums, inverse, np.asarray(values, dtype=np.int64))
+        keys, sums = keys[sums != 0], sums[sums != 0]
+        indptr = np.searchsorted(keys // n if n else keys, np.arange(n+1))
+        return SparseMatrix(labels, indptr, keys % n if n else keys, sums)
+
+    @property
+    def shape(self) -> (int, int):
+        return len(self.labels), len(self.labels)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    def coo(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Give the entries in COO format
+        No input
+        Output:
+            - arrays of the row index, of the column index and of the value of each entry
+        """
+        rows = np.repeat(np.arange(len(self.labels), dtype=np.int64), np.diff(self.indptr))
+        return rows, self.indices.copy(), self.data.copy()
+
+    def row(self, i: int) -> dict[int, int]:
+        """
+        Give a row
+        Input:
+            - i: the row index
+        Output:
+            - dict {column index: value} of the non zero entries
+        """
+        start, end = self.indptr[i], self.indptr[i+1]
+        return dict(zip(self.indices[start:end].tolist(), self.data[start:end].tolist()))
+
+    def rows(self, order: list=None) -> list[dict[int, int]]:
+        """
+        Give the rows as sparse dicts (the input of bareiss_determinant and snf)
+        Input:
+            - order: list of the labels, the rows and the columns are permuted in this order (optional)
+        Output:
+            - list of dicts {column index: value}
+        """
+        if order is None:
+            return [self.row(i) for i in range(len(self.labels))]
+        position = [0] * len(self.labels)
+        for k, label in enumerate(order):
+            position[self.index[label]] = k
+        return [{position[j]: v for j, v in self.row(self.index[label]).items()} for label in order]
+
+    def __contains__(self, label: object) -> bool:
+        return label in self.index
+
+    def __getitem__(self, label: object) -> dict[object, int]:
+        """
+        Give the row of a label
+        Input:
+            - label: the label of the row
+        Output:
+            - dict {column label: value} of the non zero entries
+        """
+        labels = self.labels
+        return {labels[j]: v for j, v in self.row(self.index[label]).items()}
+
+    def to_dense(self) -> np.ndarray:
+        """
+        No input
+        Output:
+            - the matrix as a dense (n, n) array
+        """
+        dense = np.zeros(self.shape, dtype=np.int64)
+        rows, columns, values = self.coo()
+        dense[rows, columns] = values
+        return dense
+
+    def to_dict(self) -> dict[object, dict[object, int]]:
+        """
+        No input
+        Output:
+            - the matrix as a dense dict of dicts {row label: {column label: value}}
+        """
+        return {u: dict(zip(self.labels, line)) for u, line in zip(self.labels, self.to_dense().tolist())}
+
+    def to_matrix(self) -> "Matrix":
+        """
+        No input
+        Output:
+            - the matrix as a Matrix (dense, for the smithnormalform module)
+        """
+        return Matrix(self.to_dict())
+
+    def to_scipy(self, format: str="csr") -> object:
+        """
+        Give the matrix as a scipy.sparse matrix (scipy is an optional dependency)
+        Input:
+            - format: "csr" or "coo" (default: "csr")
+        Output:
+            - scipy.sparse.csr_matrix or scipy.sparse.coo_matrix
+        """
+        try:
+            import scipy.sparse
+        except ImportError:
+            raise ImportError("to_scipy needs scipy: pip install scipy")
+        if format == "csr":
+            return scipy.sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+        elif format == "coo":
+            rows, columns, values = self.coo()
+            return scipy.sparse.coo_matrix((values, (rows, columns)), shape=self.shape)
+        raise ValueError("format has to be 'csr' or 'coo'")
+
+    def matvec(self, x: np.ndarray, transpose: bool=False) -> np.ndarray:
+        """
+        Multiply the matrix (or its transpose) by a vector in floating point from the CSR arrays
+        Input:
+            - x: vector of size n
+            - transpose: boolean (default: False), if True multiply the transpose
+        Output:
+            - the product
+        """
+        n = len(self.labels)
+        rows = np.repeat(np.arange(n), np.diff(self.indptr))
+        if transpose:
+            return np.bincount(self.indices, weights=self.data * x[rows], minlength=n)
+        return np.bincount(rows, weights=self.data * x[self.indices], minlength=n)
+
+    def solve(self, b: np.ndarray, transpose: bool=False, tolerance: float=1e-10,
+              max_iterations: int=None) -> np.ndarray:
+        """
+        Solve A * x = b (or A^T * x = b) in floating point without building the dense matrix:
+        with scipy.sparse.linalg.spsolve if scipy is installed, else with the stabilized biconjugate gradient
+        method (preconditioned by the diagonal) on the CSR arrays, in O(nnz) per iteration
+        Input:
+            - b: the right hand side, vector of size n
+            - transpose: boolean (default: False), if True solve the transposed system
+            - tolerance: relative residual at which the iterations stop (default: 1e-10)
+            - max_iterations: maximal number of iterations (default: 10*n + 100)
+        Output:
+            - the solution x (the last iterate if the iterations did not converge)
+        """
+        n = len(self.labels)
+        b = np.asarray(b, dtype=float)
+        if n == 0:
+            return np.zeros(0)
+        try:
+            import scipy.sparse.linalg
+        except ImportError:
+            pass
+        else:
+            matrix = self.to_scipy()
+            return np.atleast_1d(scipy.sparse.linalg.spsolve((matrix.T if transpose else matrix).tocsc(), b))
+
+        def product(x: np.ndarray) -> np.ndarray:
+            return self.matvec(x, transpose)
+
+        diagonal = np.ones(n)
+        rows = np.repeat(np.arange(n), np.diff(self.indptr))
+        on_diagonal = rows == self.indices
+        diagonal[rows[on_diagonal]] = self.data[on_diagonal]
+        diagonal[diagonal == 0] = 1.0
+        if max_iterations is None:
+            max_iterations = 10 * n + 100
+
+        x = b / diagonal
+        r = b - product(x)
+        goal = tolerance * max(np.linalg.norm(b), 1e-300)
+        r_hat = r.copy()
+        rho = alpha = omega = 1.0
+        v = np.zeros(n)
+        p = np.zeros(n)
+        for _ in range(max_iterations):
+            if np.linalg.norm(r) <= goal:
+                break
+            rho_next = r_hat @ r
+            if rho_next == 0:
+                break
+            p = r + (rho_next / rho) * (alpha / omega) * (p - omega * v)
+            p_hat = p / diagonal
+            v = product(p_hat)
+            alpha = rho_next / (r_hat @ v)
+            s = r - alpha * v
+            if np.linalg.norm(s) <= goal:
+                x += alpha * p_hat
+                break
+            s_hat = s / diagonal
+            t = product(s_hat)
+            omega = (t @ s) / (t @ t)
+            x += alpha * p_hat + omega * s_hat
+            r = s - omega * t
+            rho = rho_next
+            if omega == 0:
+                break
+        return x
+
+    def determinant(self) -> int:
+        """
+        Compute the exact determinant with the sparse fraction-free Bareiss elimination (see bareiss_determinant)
+        No input
+        Output:
+            - the determinant (int)
+        """
+        return bareiss_determinant(self.rows())
+
+    def smith_normal_form(self, transforms: bool=False) -> list[int] or (list[int], list[list[int]], list[list[int]]):
+        """
+        Compute the smith normal form from the sparse rows (see smith_normal_form)
+        Input:
+            - transforms: boolean (default: False), if True also give S and T such that S * A * T = J
+        Output:
+            - the invariant factors (the diagonal of J)
+            - if transforms: the matrices S and T (lists of rows, in the order of labels)
+        """
+        return smith_normal_form(self.rows(), transforms, len(self.labels))
+
+    def cokernel_map(self) -> (list[int], list[list[int]]):
+        """
+        Compute the invariant factors and the map to Z/d1 x ... x Z/dk of the quotient of Z^n
+        by the lattice of the columns (see cokernel_map), the matrix has to be non singular
+        Output:
+            - the invariant factors not equal to 1
+            - the rows of U (in the order of labels), v -> U * v mod (d1, ..., dk) is the quotient map
+        """
+        return cokernel_map(self.rows())
+
+    def transpose(self) -> "SparseMatrix":
+        """
+        Output:
+            - the transposed SparseMatrix (same labels)
+        """
+        rows, columns, values = self.coo()
+        return SparseMatrix.from_coo(self.labels, columns.tolist(), rows.tolist(), values.tolist())
+
+    def snf_problem(self) -> snfproblem.SNFProblem:
+        """
+        Compute the smith normal form problem of the matrix (see Matrix.snf_problem)
+        No input
+        Output:
+            - instance of the class SNFProblem
+        """
+        return self.to_matrix().snf_problem()
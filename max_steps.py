@@ -4,6 +4,7 @@ from vector import Vector
 from rotorconfig import RotorConfig
 from rotorgraph import RotorGraph, display_path, all_config_from_recurrent, display_grid
 from particleconfig import ParticleConfig
+from enumeration import sharded_enumeration, assignment_to_config
 
 
 def equal(n, x):
@@ -39,7 +40,8 @@ def max_steps(n:int=5, x:int=1, y:int=1) -> (RotorConfig, Node, int):
     
     for config in G.enum_configurations():
         for node in set(G.nodes)-set(G.sinks):
-            rc, n = G.route_one_particle(node, config)
+            rc, info = G.route_one_particle(node, config, history=None)
+            n = info.nb_steps
             if n > nb_steps:
                 configs = [(node, config)]
                 nb_steps = n
@@ -48,6 +50,52 @@ def max_steps(n:int=5, x:int=1, y:int=1) -> (RotorConfig, Node, int):
     return nb_steps, configs
 
 
+def _max_steps_of_rotors(compiled: CompiledRotorGraph, rotors: list[int]) -> int:
+    """
+    Function of parallel_max_steps for sharded_enumeration: route one particle from every non sink node
+    Input:
+        - compiled: the CompiledRotorGraph
+        - rotors: the rotor indices of the configuration
+    Output:
+        - the maximal number of steps over the starting nodes
+    """
+    return max((compiled.walk_to_sink(u, list(rotors))[1]
+                for u in range(len(compiled.nodes)) if not compiled.is_sink[u]), default=0)
+
+
+def parallel_max_steps(n: int=5, x: int=1, y: int=1, processes: int=None,
+                       G: RotorGraph=None) -> (int, list[tuple[Node, RotorConfig]]):
+    """
+    Same as max_steps but the configurations are searched by a pool of processes with the compiled routing engine
+    (enumeration.sharded_enumeration with the "max" aggregate), then the starting nodes reaching the maximum
+    are found again for the few configurations which reach it
+    Input:
+        - n, x, y: parameters of the simple path (see RotorGraph.simple_path)
+        - processes: number of processes (default: number of cpus)
+        - G: the RotorGraph to search instead of the simple path (optional)
+    Output:
+        - maximal number of steps
+        - list of (node, RotorConfig) reaching it, in the same order as max_steps
+            (empty if the graph has no non sink node)
+    """
+    if G is None:
+        G = RotorGraph.simple_path(n, x, y)
+    nb_steps, assignments = sharded_enumeration(G, _max_steps_of_rotors, "max", compact=True, processes=processes)
+    if nb_steps is None:
+        return 0, []
+
+    compiled = G.compile()
+    starts = [node for node in set(G.nodes)-set(G.sinks)]
+    configs = list()
+    for assignment in assignments:
+        config = assignment_to_config(G, assignment)
+        rotors = compiled.rotors_from_config(config)
+        for node in starts:
+            if compiled.walk_to_sink(compiled.node_index[node], list(rotors))[1] == nb_steps:
+                configs.append((node, config))
+    return nb_steps, configs
+
+
 def max_config(n, x, y):
     rc = dict()
     if x > y:
@@ -144,46 +192,10 @@ def display_config(config, node=None):
         print(' ',end='')
 
 
-
-
-
-if __name__ != "__main__":
-    mat = matrix.Matrix(2, 2, [z.Z(9), z.Z(6), z.Z(12), z.Z(8)])
-    graph = RotorGraph.simple_path(4)
-    L = graph.reduced_laplacian_matrix()
-    for line in L.values():
-        print(line.values())
-    mati = snf_matrix(L)
-    prob = snfproblem.SNFProblem(mat)
-    prob.computeSNF()
-    print(prob.isValid())
-    print(prob.A)
-    print(prob.J)
-    print(prob.S)
-    print(prob.T)
-
-    print(prob.S * prob.A * prob.T)
-elif 0:
-    G = RotorGraph.grid(5,3, 'corners')
-
-    rho = RotorConfig(G)
-    sigma = ParticleConfig(G)
-    sigma[7] = 5
-    particle_conf, rotor_conf, info = G.legal_routing(sigma, rho)
-    #print(info)
-    G = RotorGraph.simple_path(5,2,2)
-    print(det(G))
-    rho, node = max_config(5,2,2)
-    rotor_conf, info = G.route_one_particle(node, rho)
-    print(info)
-else:
-    G = RotorGraph.simple_path()
-    mat = G.reduced_laplacian_matrix()
-    from matrices import Matrix
-    mat = {0: {0: 2, 1: 4, 2: 4}, 1: {0: -6, 1: 6, 2: 12}, 2: {0: 10, 1: 4, 2: 16}}
-    m = Matrix(mat)
-    print(m)
-    prob = m.snf_problem()
-    print(prob.J)
-    print(prob.S)
-    print(prob.T)
+if __name__ == "__main__":
+    n, x, y = 5, 1, 1
+    nb_steps, configs = parallel_max_steps(n, x, y)
+    print("nombre d'etapes maximal: ", nb_steps, "(attendu:", expected_max_steps(n, x, y), ")")
+    for node, config in configs:
+        display_config(config, node)
+        print()
@@ -15,44 +15,142 @@ class ParticleConfig(vector.Vector):
                 - a dictionnary which will become the ParticleConfig
                 - a graph, every nodes of the graph will be initialized with zero particle
                 - None (default) which gives an empty dict
+        The non sink nodes holding particles (resp. antiparticles) are kept in worklists
+        (ordered sets updated by the methods of the class), so that finding the next node to route is O(1).
+        The lookups and the routings bring them up to date first (sync_worklists), so configuration can also be modified directly.
         """
+        self.sinks = set()
         if isinstance(configuration, dict):
             self.configuration = configuration
         elif type(configuration).__name__ == "RotorGraph":
             self.configuration = {node: 0 for node in configuration}
+            self.sinks = set(configuration.sinks)
         elif configuration is None:
             self.configuration = dict()
         else:
             raise TypeError("configuration has to be a dict, RotorGraph or nothing")
+        self.update_worklists()
+
+    def update_worklists(self, sinks: set=None):
+        """
+        Rebuild the worklists of the nodes holding particles and antiparticles
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional, default: the current sinks)
+        No output
+        """
+        if sinks is not None:
+            self.sinks = set(sinks)
+        self.particle_nodes = dict() # ordered set of non sink nodes with k > 0
+        self.antiparticle_nodes = dict() # ordered set of non sink nodes with k < 0
+        for node in self.configuration:
+            self._update_node(node)
+
+    def copy(self) -> "ParticleConfig":
+        """
+        Give a copy of the configuration, the worklists are copied instead of being rebuilt
+        (the numbers of particles are ints, so the dicts are copied shallowly)
+        No input
+        Output:
+            - new ParticleConfig
+        """
+        new = type(self).__new__(type(self))
+        new.__dict__.update(self.__dict__)
+        new.configuration = dict(self.configuration)
+        new.sinks = set(self.sinks)
+        new.particle_nodes = dict(self.particle_nodes)
+        new.antiparticle_nodes = dict(self.antiparticle_nodes)
+        return new
+
+    def _update_node(self, node: Node):
+        """
+        Update the worklists for the given node
+        Input:
+            - node: the node whose number of particles changed
+        No output
+        """
+        k = self.configuration.get(node, 0)
+        if k > 0 and node not in self.sinks:
+            self.particle_nodes[node] = None
+            self.antiparticle_nodes.pop(node, None)
+        elif k < 0 and node not in self.sinks:
+            self.antiparticle_nodes[node] = None
+            self.particle_nodes.pop(node, None)
+        else:
+            self.particle_nodes.pop(node, None)
+            self.antiparticle_nodes.pop(node, None)
+
+    def sync_worklists(self, sinks: set=None):
+        """
+        Bring the worklists up to date after direct modifications of configuration:
+        the nodes which are still active keep their place, the other ones are dropped,
+        and the nodes which became active are appended in the order of the configuration
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional, default: the current sinks)
+        No output
+        """
+        if sinks is not None and sinks != self.sinks:
+            self.sinks = set(sinks) # a copy: the caller may modify its set in place
+        configuration = self.configuration
+        sinks = self.sinks
+        for worklist, sign in ((self.particle_nodes, 1), (self.antiparticle_nodes, -1)):
+            for node in [node for node in worklist if node in sinks or configuration.get(node, 0) * sign <= 0]:
+                del worklist[node]
+        for node, k in configuration.items():
+            if k > 0 and node not in self.particle_nodes and node not in sinks:
+                self.particle_nodes[node] = None
+            elif k < 0 and node not in self.antiparticle_nodes and node not in sinks:
+                self.antiparticle_nodes[node] = None
+
+    def nodes_with_particle(self, sinks: set) -> list[Node]:
+        """
+        Give the non sink nodes which hold at least one particle, in the order of the worklist
+        (brought up to date first, see sync_worklists)
+        Input:
+            - sinks: set of nodes that are considered as sinks
+        Output:
+            - list of nodes
+        """
+        self.sync_worklists(sinks)
+        return list(self.particle_nodes)
+
+    def nodes_with_antiparticle(self, sinks: set) -> list[Node]:
+        """
+        Give the non sink nodes which hold at least one antiparticle, in the order of the worklist
+        (brought up to date first, see sync_worklists)
+        Input:
+            - sinks: set of nodes that are considered as sinks
+        Output:
+            - list of nodes
+        """
+        self.sync_worklists(sinks)
+        return list(self.antiparticle_nodes)
 
 
     def first_node_with_particle(self, sinks: set) -> Node or None:
         """
         Find the first (non sink) node which holds at least one particle
+        The node is the oldest one of the worklist (brought up to date first, see sync_worklists).
         Input:
             - sinks: set of nodes that are considered as sinks
         Output:
             - the first non sink node with at least one particle if there is one
             else None
         """
-        for node, k in self.configuration.items():
-            if k > 0 and node not in sinks:
-                return node
-        return None
+        self.sync_worklists(sinks)
+        return next(iter(self.particle_nodes), None)
 
     def first_node_with_antiparticle(self, sinks: set) -> Node or None:
         """
         Find the first (non sink) node which holds at least one antiparticle
+        The node is the oldest one of the worklist (brought up to date first, see sync_worklists).
         Input:
             - sinks: set of nodes that are considered as sinks
         Output:
             - the first non sink node with at least antiparticle if there is one
             else None
         """
-        for node, k in self.configuration.items():
-            if k < 0 and node not in sinks:
-                return node
-        return None
+        self.sync_worklists(sinks)
+        return next(iter(self.antiparticle_nodes), None)
 
     def transfer_particles(self, u: Node, v: Node, k: int=1):
         """
@@ -63,6 +161,8 @@ class ParticleConfig(vector.Vector):
             - k: the number of particles to transfer (default: one particle)
         No output
         """
+        if u == v and u in self.configuration:
+            return
         self.remove_particles(u, k)
         self.add_particles(v, k)
 
@@ -77,6 +177,7 @@ class ParticleConfig(vector.Vector):
         if node in self.configuration:
             self.configuration[node] += k
         else: self.configuration[node] = k
+        self._update_node(node)
 
     def add_all_particles(self, k:int=1):
         """
@@ -87,6 +188,7 @@ class ParticleConfig(vector.Vector):
         """
         for node in self.configuration:
             self.configuration[node] += k
+        self.update_worklists()
 
     def remove_particles(self, node:Node, k:int=1):
         """
@@ -99,6 +201,7 @@ class ParticleConfig(vector.Vector):
         if node in self.configuration:
             self.configuration[node] -= k
         else: self.configuration[node] = -k
+        self._update_node(node)
 
     def remove_all_particles(self, node:Node, k:int=1):
         """
@@ -110,6 +213,7 @@ class ParticleConfig(vector.Vector):
         if node in self.configuration:
             self.configuration[node] -= k
         else: self.configuration[node] = -k
+        self._update_node(node)
 
     def set_particles(self, node:Node, k:int=1):
         """
@@ -120,6 +224,7 @@ class ParticleConfig(vector.Vector):
         No output
         """
         self.configuration[node] = k
+        self._update_node(node)
 
     def set_all_particles(self, k:int=1):
         """
@@ -130,4 +235,26 @@ class ParticleConfig(vector.Vector):
         """
         for node in self.configuration:
             self.configuration[node] = k
+        self.update_worklists()
+
+    def __setitem__(self, index: Node, value: int):
+        """
+        Overload the assignement operator.
+        Set the number of particles of the given node and update the worklists.
+        Input:
+            - index: the node
+            - value: the number of particles
+        No ouput
+        """
+        self.configuration[index] = value
+        self._update_node(index)
 
+    def __delitem__(self, index: Node):
+        """
+        Overload the deleter operator and update the worklists.
+        Input:
+            - index: the node
+        No output
+        """
+        del self.configuration[index]
+        self._update_node(index)
@@ -1,8 +1,11 @@
 from types_definition import *
 
+HISTORY_ALL = "all"
+HISTORY_DELTA = "delta"
+
 class Results(object):
 
-    def __init__(self, graph, particle_config, rotor_config):
+    def __init__(self, graph, particle_config, rotor_config, history: str or int=HISTORY_ALL):
         """
         Keep track of important informations during a routing:
             - nb_steps: total number of steps for the routing
@@ -13,7 +16,22 @@ class Results(object):
             - nb_particles_in_sinks: a dictionnary, {sink: number of particles}
             - last_visit: a dictionnary, {node: number of the step when it was last visited (between 0 and nb_steps)}
             - configuration_history: the list of the configurations (rotor, particle) from oldest to newest
+            - history_steps: the step of each configuration of configuration_history
+            - deltas: the list of the steps (node, old edge, new edge, (particle source, particle destination))
+            - rotor_config, particle_config: the last configurations
+        Input:
+            - graph: the routed graph
+            - particle_config: the initial particle configuration
+            - rotor_config: the initial rotor configuration
+            - history: the recording policy of the configurations (default: "all")
+                - "all": a copy of the configurations after every step
+                - N (int): a copy of the configurations every N steps (and after the last step)
+                - "delta": only the initial configurations and the deltas of every step,
+                    any intermediate configuration can be rebuilt with configuration_at
+                - None: no history, only the counters are kept
         """
+        if not (history in {HISTORY_ALL, HISTORY_DELTA, None} or (isinstance(history, int) and history > 0)):
+            raise ValueError(f"Invalid history policy {history}")
         self.nb_steps = 0
         self.nb_l_edges = 0
         self.nb_r_edges = 0
@@ -21,8 +39,12 @@ class Results(object):
         self.nodes_counter = {node:0 for node in graph.nodes}
         self.nb_particles_in_sinks = {sink:particle_config[sink] for sink in graph.sinks}
         self.last_visit = {node:None for node in graph.nodes}
-        self.configuration_history = [(rotor_config, particle_config)]
-        
+        self.history = history
+        self.configuration_history = [(rotor_config, particle_config)] if history is not None else list()
+        self.history_steps = [0] if history is not None else list()
+        self.deltas = list()
+        self.rotor_config = rotor_config
+        self.particle_config = particle_config
 
     def __str__(self):
         """
@@ -32,7 +54,7 @@ class Results(object):
         if (self.nb_l_edges != 0) or (self.nb_r_edges != 0):
             res += f"Number of left edges : {self.nb_l_edges} \nNumber of right edges : {self.nb_r_edges}\n\n"
         res += " Node | visits | last_visit | nb_particles | sink \n"
-        particle_config = self.configuration_history[-1][-1]
+        particle_config = self.particle_config
         f = " {0:>4} | {1:>6} | {2:>10} | {3:>12} | "
         for node in self.nodes_counter:
             #res += f"  {node}   |   {self.nodes_counter[node]}    | {self.last_visit[node]}      | {particle_config[node]} | "
@@ -60,6 +82,85 @@ class Results(object):
                 self.nb_r_edges += 1
 
 
+    def snapshot_needed(self) -> bool:
+        """
+        Tell if the configurations after the current step have to be stored in configuration_history
+        No input
+        Output:
+            - boolean
+        """
+        if self.history == HISTORY_ALL:
+            return True
+        if isinstance(self.history, int):
+            return self.nb_steps % self.history == 0
+        return False
+
+    def add_snapshot(self, rotor_config: RotorConfig, particle_config: ParticleConfig):
+        """
+        Store the configurations after the current step
+        Input:
+            - rotor_config: the current rotor configuration
+            - particle_config: the current particle configuration
+        """
+        self.configuration_history.append((rotor_config, particle_config))
+        self.history_steps.append(self.nb_steps)
+
+    def add_delta(self, node: Node, old_edge: Edge, new_edge: Edge, move: tuple[Node, Node]):
+        """
+        Store the delta of a step (only with the "delta" policy)
+        Input:
+            - node: the fired node
+            - old_edge: the rotor of the node before the step
+            - new_edge: the rotor of the node after the step
+            - move: (source, destination) of the moved particle
+        """
+        if self.history == HISTORY_DELTA:
+            self.deltas.append((node, old_edge, new_edge, move))
+
+    def configuration_at(self, step: int) -> (RotorConfig, ParticleConfig):
+        """
+        Give the configurations after the given step.
+        With the "delta" policy, they are rebuilt from the initial configurations,
+        else they have to be in configuration_history.
+        Input:
+            - step: number of the step (between 0 and nb_steps)
+        Output:
+            - rotor configuration
+            - particle configuration
+        """
+        if not 0 <= step <= self.nb_steps:
+            raise ValueError(f"Invalid step {step}")
+        if step == self.nb_steps:
+            return self.rotor_config, self.particle_config
+        if self.history != HISTORY_DELTA:
+            if step not in self.history_steps:
+                raise ValueError(f"The configuration of the step {step} was not recorded")
+            return self.configuration_history[self.history_steps.index(step)]
+
+        rotor_config, particle_config = self.configuration_history[0]
+        rotor_config = type(rotor_config)(dict(rotor_config.configuration))
+        particle_config = type(particle_config)(dict(particle_config.configuration))
+        for node, old_edge, new_edge, (u, v) in self.deltas[:step]:
+            rotor_config[node] = new_edge
+            particle_config[u] = particle_config[u] - 1
+            particle_config[v] = particle_config[v] + 1
+        return rotor_config, particle_config
+
+    def load_counters(self, compiled_graph: CompiledRotorGraph, counters: RoutingCounters):
+        """
+        Update the counters from the counters of a routing on a CompiledRotorGraph
+        Input:
+            - compiled_graph: the CompiledRotorGraph on which the routing was done
+            - counters: the RoutingCounters of the routing
+        """
+        self.nb_steps = counters.nb_steps
+        for edge, k in zip(compiled_graph.edges, counters.edges):
+            if edge in self.edges_counter:
+                self.edges_counter[edge] = k
+        for node, k, last in zip(compiled_graph.nodes, counters.nodes, counters.last_visit):
+            self.nodes_counter[node] = k
+            self.last_visit[node] = last
+
     def particles_in_sinks(self, particle_config: ParticleConfig):
         """
         Update the number of particles in the sinks
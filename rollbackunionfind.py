@@ -0,0 +1,86 @@
+from types_definition import *
+
+
+class RollbackUnionFind(object):
+
+    def __init__(self, elements: list):
+        """
+        A union-find with union by rank and without path compression,
+        so that the unions can be undone in reverse order (O(log n) per operation).
+        Input:
+            - elements: list of the elements of the disjoint sets
+        """
+        self.elements = list(elements)
+        self.index = {element: i for i, element in enumerate(elements)}
+        self.parent = list(range(len(elements)))
+        self.rank = [0] * len(elements)
+        self.history = list() # undo stack of (attached root, new root, rank increased)
+
+    def _find(self, i: int) -> int:
+        """
+        Give the root of the set of the given element index
+        Input:
+            - i: element index
+        Output:
+            - index of the root
+        """
+        parent = self.parent
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    def find(self, element: object) -> object:
+        """
+        Give the representative of the set of the given element
+        Input:
+            - element: the element
+        Output:
+            - the representative element
+        """
+        return self.elements[self._find(self.index[element])]
+
+    def connected(self, a: object, b: object) -> bool:
+        """
+        Check if two elements are in the same set
+        Input:
+            - a, b: the elements
+        Output:
+            - True if a and b are in the same set
+        """
+        return self._find(self.index[a]) == self._find(self.index[b])
+
+    def union(self, a: object, b: object) -> bool:
+        """
+        Merge the sets of two elements, the union is pushed on the undo stack
+        (even if the elements are already in the same set, so that each union has its undo)
+        Input:
+            - a, b: the elements
+        Output:
+            - True if two different sets were merged
+        """
+        ra = self._find(self.index[a])
+        rb = self._find(self.index[b])
+        if ra == rb:
+            self.history.append(None)
+            return False
+        rank = self.rank
+        if rank[ra] > rank[rb]:
+            ra, rb = rb, ra
+        self.parent[ra] = rb
+        increased = rank[ra] == rank[rb]
+        if increased:
+            rank[rb] += 1
+        self.history.append((ra, rb, increased))
+        return True
+
+    def undo(self):
+        """
+        Undo the last union
+        No output
+        """
+        last = self.history.pop()
+        if last is not None:
+            ra, rb, increased = last
+            self.parent[ra] = ra
+            if increased:
+                self.rank[rb] -= 1
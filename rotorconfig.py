@@ -1,4 +1,5 @@
 from types_definition import *
+from array import array
 import rotorgraph
 
 
@@ -28,6 +29,15 @@ class RotorConfig(object):
         else:
             raise TypeError("configuration has to be a dict, RotorGraph or nothing")
 
+    def copy(self) -> "RotorConfig":
+        """
+        Give a copy of the configuration (the edges are tuples, so the dict is copied shallowly)
+        No input
+        Output:
+            - new RotorConfig
+        """
+        return RotorConfig(dict(self.configuration))
+
     def __str__(self):
         """dictionnary method"""
         return str(self.configuration)
@@ -86,6 +96,16 @@ class RotorConfig(object):
         """dictionnary method"""
         return len(self.configuration)
 
+    def to_compact(self, compiled_graph: CompiledRotorGraph) -> CompactRotorConfig:
+        """
+        Give the compact (hashable) form of the configuration
+        Input:
+            - compiled_graph: the CompiledRotorGraph giving the order of the nodes
+        Output:
+            - CompactRotorConfig
+        """
+        return CompactRotorConfig.from_rotor_config(compiled_graph, self)
+
     def find_cycles(self, sinks: set[Node]=set()) -> list[list[Edge]]:
         """
         Find all cycles from a rotor configuration
@@ -99,16 +119,16 @@ class RotorConfig(object):
 
         for node in self.configuration:
             cycle = list()
+            position = dict() # position in cycle of the edge of each node of this walk
             while (node not in visited_nodes) and (node not in sinks) and (node in self.configuration):
                 edge = self.configuration[node]
+                position[node] = len(cycle)
                 cycle.append(edge)
                 visited_nodes.add(node)
                 node = edge[1]
-            while cycle and cycle[0][0] != cycle[-1][1]:
-                del cycle[0]
 
-            if cycle and cycle[0][0] == cycle[-1][1]:
-                cycles.append(cycle)
+            if node in position: # the walk came back on itself
+                cycles.append(cycle[position[node]:])
 
         return cycles
 
@@ -138,14 +158,117 @@ class RotorConfig(object):
 
     def destination_forest(self, rotor_graph: RotorGraph, sinks: set[Node]=set()):
         """
-        The configuration obtained by a maximal cycle push sequence on a rotor configuration 
+        The configuration obtained by a maximal cycle push sequence on a rotor configuration,
+        computed on the compiled graph (see CompiledRotorGraph.destination_forest),
+        the walks stop on the sinks and on the nodes missing from the configuration
         Input:
+            - rotor_graph: the RotorGraph of the configuration
             - sinks: set of nodes that are considered as sinks
         Output:
-            - new rotor configuration without cycle
+            - new rotor configuration without cycle (the configuration is modified in place)
         """
-        while cycles := self.find_cycles(sinks):
-            for cycle in cycles:
-                self.cycle_push(rotor_graph, cycle)
+        compiled = rotor_graph.compile(set(sinks))
+        rotors = compiled.rotors_from_config(self)
+        stop = [True] * len(compiled.nodes)
+        for node in self.configuration:
+            if node in compiled.node_index:
+                stop[compiled.node_index[node]] = False
+        compiled.destination_forest(rotors, stop)
+        self.configuration.update(compiled.rotor_config_from(rotors, self))
+
+
+class CompactRotorConfig(object):
 
+    __slots__ = ("compiled_graph", "rotors")
 
+    def __init__(self, compiled_graph: CompiledRotorGraph, rotors: list[int] or bytes):
+        """
+        A compact and hashable rotor configuration: the rotor indices of the nodes of a CompiledRotorGraph
+        (in the order of compiled_graph.nodes) stored in bytes, one byte per node when every out-degree
+        is at most 256 (four bytes per node otherwise).
+        Two CompactRotorConfigs are equal if they have the same compiled graph and the same rotors,
+        so they can be stored in sets and used as dict keys.
+        Input:
+            - compiled_graph: the CompiledRotorGraph giving the order of the nodes
+            - rotors: list of rotor indices, or their encoding (bytes)
+        """
+        self.compiled_graph = compiled_graph
+        if isinstance(rotors, bytes):
+            self.rotors = rotors
+        elif max(compiled_graph.degrees, default=0) <= 256:
+            self.rotors = bytes(rotors)
+        else:
+            self.rotors = array('I', rotors).tobytes()
+
+    def from_rotor_config(compiled_graph: CompiledRotorGraph, rotor_config: RotorConfig) -> CompactRotorConfig:
+        """
+        Give the compact form of a RotorConfig
+        Input:
+            - compiled_graph: the CompiledRotorGraph giving the order of the nodes
+            - rotor_config: the RotorConfig
+        Output:
+            - CompactRotorConfig
+        """
+        return CompactRotorConfig(compiled_graph, compiled_graph.rotors_from_config(rotor_config))
+
+    def indices(self) -> list[int]:
+        """
+        Give the rotor indices
+        No input
+        Output:
+            - list of rotor indices (in the order of compiled_graph.nodes)
+        """
+        if len(self.rotors) == len(self.compiled_graph.nodes):
+            return list(self.rotors)
+        return array('I', self.rotors).tolist()
+
+    def to_rotor_config(self) -> RotorConfig:
+        """
+        Give the RotorConfig of the non sink nodes
+        No input
+        Output:
+            - RotorConfig
+        """
+        compiled = self.compiled_graph
+        edges = compiled.edges
+        offsets = compiled.offsets
+        return RotorConfig({node: edges[offsets[i] + r]
+                            for i, (node, r, sink) in enumerate(zip(compiled.nodes, self.indices(), compiled.is_sink))
+                            if not sink})
+
+    def __getitem__(self, node: Node) -> Edge:
+        """
+        Give the edge of the rotor of the given node
+        Input:
+            - node: the node
+        Output:
+            - the edge
+        """
+        compiled = self.compiled_graph
+        i = compiled.node_index[node]
+        if len(self.rotors) == len(compiled.nodes):
+            r = self.rotors[i]
+        else:
+            r = array('I', self.rotors[4*i:4*i+4])[0]
+        return compiled.edges[compiled.offsets[i] + r]
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Overload the == operator.
+        Input:
+            - other: object to compare
+        Output:
+            - True if other is a CompactRotorConfig with the same compiled graph and the same rotors
+        """
+        return (isinstance(other, CompactRotorConfig) and self.compiled_graph is other.compiled_graph
+                and self.rotors == other.rotors)
+
+    def __hash__(self) -> int:
+        return hash(self.rotors)
+
+    def __len__(self) -> int:
+        """number of nodes"""
+        return len(self.compiled_graph.nodes)
+
+    def __repr__(self):
+        return f"CompactRotorConfig({self.indices()})"
@@ -1,11 +1,20 @@
 import networkx as nx
 from types_definition import * 
-from unionfind import UnionFind
+from rollbackunionfind import RollbackUnionFind
 from copy import deepcopy
 import rotorconfig
 import particleconfig
-from random import randint
-from results import Results
+from random import randint, Random
+from collections import deque
+from results import Results, HISTORY_ALL, HISTORY_DELTA
+from compiledgraph import CompiledRotorGraph
+from derivedcache import DerivedCache
+from trajectory import Trajectory
+from routingiterator import RoutingIterator
+from sandpilegroup import SandpileGroup
+from rotorroutingaction import RotorRoutingAction
+import batchrouting
+import numpy as np
 import matrices
 
 class RotorGraph(nx.MultiDiGraph):
@@ -19,6 +28,8 @@ class RotorGraph(nx.MultiDiGraph):
         self.sinks = set() # all sinks (manually and automatically
         self.rotor_order = dict() # {node: list[edge]}
         self.edge_index = dict() # {edge: index in the rotor order list}
+        self.version = 0 # incremented by each change of the graph, the sinks or the rotor order
+        self.derived_cache = DerivedCache() # structures derived from the current version (see _derived)
         nx.MultiDiGraph.__init__(self, incoming_graph_data, multigraph_input, **attr)
 
 
@@ -110,6 +121,111 @@ class RotorGraph(nx.MultiDiGraph):
         return G
 
 
+    def _changed(self):
+        """
+        Record a change of the graph, the sinks or the rotor order: increment the version and drop the derived structures
+        No output
+        """
+        self.version += 1
+        self.derived_cache.invalidate()
+
+    def _derived(self, name: str, sinks: set, compute, *args) -> object:
+        """
+        Give a structure derived from the graph, memoised per (version, sinks, arguments)
+        Input:
+            - name: name of the structure
+            - sinks: set of nodes that are considered as sinks
+            - compute: function without argument computing the structure
+            - args: other hashable arguments the structure depends on
+        Output:
+            - the structure (shared by the callers, not to be modified)
+        """
+        return self.derived_cache.get((name, self.version, frozenset(sinks), args), compute)
+
+    def cache_stats(self) -> dict[str, int]:
+        """
+        Give the statistics of the cache of the derived structures
+        No input
+        Output:
+            - dict with the hits, misses, evictions and invalidations, the number of entries and the version of the graph
+        """
+        stats = self.derived_cache.stats()
+        stats["version"] = self.version
+        return stats
+
+    def clear_cache(self):
+        """
+        Drop the cached derived structures (the version does not change)
+        No input
+        No output
+        """
+        self.derived_cache.invalidate()
+
+    def add_node(self, node_for_adding: Node, **attr):
+        """
+        Add a node to the graph with MultiDiGraph method
+        Input:
+            - node_for_adding: the node
+            - attr: keyword arguments, optional
+        No output
+        """
+        nx.MultiDiGraph.add_node(self, node_for_adding, **attr)
+        self._changed()
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        """
+        Add nodes to the graph with MultiDiGraph method
+        Input:
+            - nodes_for_adding: iterable of nodes (or of (node, attribute dict) tuples)
+            - attr: keyword arguments, optional
+        No output
+        """
+        nx.MultiDiGraph.add_nodes_from(self, nodes_for_adding, **attr)
+        self._changed()
+
+    def _drop_node(self, node: Node):
+        """
+        Remove a node and its edges with MultiDiGraph method, and remove them from the rotor order and the sinks
+        (a node losing all its outgoing edges becomes a sink, as with remove_edge); edge_index is not updated
+        Input:
+            - node: the node
+        No output
+        """
+        in_edges = [edge for edge in self.in_edges(node, keys=True) if edge[0] != node]
+        nx.MultiDiGraph.remove_node(self, node)
+        self.rotor_order.pop(node, None)
+        for edge in in_edges:
+            self.rotor_order[edge[0]].remove(edge)
+            if len(self.rotor_order[edge[0]]) == 0:
+                self.sinks.add(edge[0])
+        self.sinks.discard(node)
+        self._sinks.discard(node)
+
+    def remove_node(self, n: Node):
+        """
+        Remove a node and its edges with MultiDiGraph method and update the rotor order and the sinks
+        Input:
+            - n: the node
+        No output
+        """
+        self._drop_node(n)
+        self.edge_index = rotor_order2edge_index(self.rotor_order)
+        self._changed()
+
+    def remove_nodes_from(self, nodes):
+        """
+        Remove nodes and their edges with MultiDiGraph method and update the rotor order and the sinks
+        (the nodes which are not in the graph are ignored)
+        Input:
+            - nodes: iterable of nodes
+        No output
+        """
+        for node in list(nodes):
+            if node in self:
+                self._drop_node(node)
+        self.edge_index = rotor_order2edge_index(self.rotor_order)
+        self._changed()
+
     def add_edge(self, u_for_edge: Node, v_for_edge: Node, key=None, **attr) -> object:
         """
         Add an edge to the graph with MultiDiGraph method and update the rotor order
@@ -131,6 +247,7 @@ class RotorGraph(nx.MultiDiGraph):
                 self.sinks.remove(u_for_edge)
             self.rotor_order[u_for_edge] = [edge]
             self.edge_index[edge] = 0
+        self._changed()
         return key
 
     def remove_edge(self, *edges: Edge) -> object:
@@ -146,6 +263,7 @@ class RotorGraph(nx.MultiDiGraph):
             del self.edge_index[edge]
             if len(self.rotor_order[edge[0]]) == 0:
                 self.sinks.add(edge[0])
+        self._changed()
 
 
     def set_sink(self, *nodes: Node):
@@ -157,6 +275,7 @@ class RotorGraph(nx.MultiDiGraph):
         """
         self.sinks.update(nodes)
         self._sinks.update(nodes)
+        self._changed()
 
     def remove_sink(self, *nodes: Node):
         """
@@ -169,6 +288,7 @@ class RotorGraph(nx.MultiDiGraph):
             if len(self.rotor_order[node]) == 0:
                 self.sinks.remove(node)
         self._sinks -= set(nodes)
+        self._changed()
 
 
 
@@ -225,6 +345,7 @@ class RotorGraph(nx.MultiDiGraph):
 
         self.rotor_order.update(new_order)
         self.edge_index = rotor_order2edge_index(self.rotor_order)
+        self._changed()
 
     def invert_rotor_order(self):
         """
@@ -235,6 +356,7 @@ class RotorGraph(nx.MultiDiGraph):
         for node in self.rotor_order:
             self.rotor_order[node].reverse()
         self.edge_index = rotor_order2edge_index(self.rotor_order)
+        self._changed()
 
 
     def check_rotor_config(self, rotor_config: RotorConfig):
@@ -290,7 +412,7 @@ class RotorGraph(nx.MultiDiGraph):
             if self.sinks:
                 sinks = self.sinks
 
-        res_config = deepcopy(rotor_config)
+        res_config = rotorconfig.RotorConfig(dict(rotor_config.configuration))
         for node in rotor_config.configuration.keys():
             res_config.configuration[node] = self.turn(rotor_config.configuration[node], k=k)
 
@@ -356,8 +478,8 @@ class RotorGraph(nx.MultiDiGraph):
             - new particle configuration
             - new rotor configuration
         """
-        particle_config = deepcopy(particle_config)
-        rotor_config = deepcopy(rotor_config)
+        particle_config = particle_config.copy()
+        rotor_config = rotor_config.copy()
 
         # retrieve sinks
         if sinks == None: sinks = self.sinks
@@ -370,9 +492,10 @@ class RotorGraph(nx.MultiDiGraph):
             # if no node given or found: nothing changes
             if node == None: return particle_config, rotor_config
 
+        old_edge = rotor_config.configuration[node]
         if turn_and_move:
             # turn
-            rotor_config.configuration[node] = self.turn(edge)
+            rotor_config.configuration[node] = self.turn(old_edge)
 
             # move
             edge = rotor_config.configuration[node]
@@ -394,7 +517,10 @@ class RotorGraph(nx.MultiDiGraph):
             info.last_visit[node] = info.nb_steps
             info.nb_steps += 1
             info.last_visit[succ] = info.nb_steps
-            info.configuration_history.append((rotor_config, particle_config))
+            info.add_delta(node, old_edge, rotor_config.configuration[node], (node, succ))
+            if info.snapshot_needed():
+                info.add_snapshot(rotor_config, particle_config)
+            info.rotor_config, info.particle_config = rotor_config, particle_config
             
         return particle_config, rotor_config
 
@@ -415,8 +541,8 @@ class RotorGraph(nx.MultiDiGraph):
             - new particle configuration
             - new rotor configuration
         """
-        particle_config = deepcopy(particle_config)
-        rotor_config = deepcopy(rotor_config)
+        particle_config = particle_config.copy()
+        rotor_config = rotor_config.copy()
 
         # retrieve sinks
         if sinks == None: sinks = self.sinks
@@ -429,6 +555,7 @@ class RotorGraph(nx.MultiDiGraph):
             # if no node given or found: nothing changes
             if node == None: return particle_config, rotor_config
 
+        old_edge = rotor_config.configuration[node]
         if turn_and_move:
             # move
             edge = rotor_config.configuration[node]
@@ -454,11 +581,216 @@ class RotorGraph(nx.MultiDiGraph):
             info.last_visit[node] = info.nb_steps
             info.nb_steps += 1
             info.last_visit[succ] = info.nb_steps
-            info.configuration_history.append((rotor_config, particle_config))
+            info.add_delta(node, old_edge, rotor_config.configuration[node], (succ, node))
+            if info.snapshot_needed():
+                info.add_snapshot(rotor_config, particle_config)
+            info.rotor_config, info.particle_config = rotor_config, particle_config
         return particle_config, rotor_config
 
+    def compile(self, sinks: set=None) -> CompiledRotorGraph:
+        """
+        Give the compiled (array-backed) form of the graph used by the routing methods,
+        cached until the graph changes
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - CompiledRotorGraph
+        """
+        if sinks is None:
+            sinks = self.sinks
+        return self._derived("compile", sinks, lambda: CompiledRotorGraph(self, sinks))
+
+    def compiled_routing(self, particle_config: object, rotor_config: RotorConfig, sinks: set,
+                         turn_and_move: bool=False, signs: tuple[int]=(1,),
+                         batch: bool=False, history: str or int=None) -> (ParticleConfig, RotorConfig, Results):
+        """
+        Route particles (sign 1) then antiparticles (sign -1) on the compiled graph.
+        The configurations are translated to integer arrays, routed in place
+        and translated back to RotorConfig, ParticleConfig and Results at the end.
+        Input:
+            - particle_config: the particle configuration of the graph
+            - rotor_config: the rotor configuration of the graph
+            - sinks: set of nodes that are considered as sinks
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+            - signs: the successive kinds of particles to route
+            - batch: boolean (default: False), if True every node fires all its particles at once
+                with the rotor period arithmetic (same result, time proportional to the number of node visits)
+            - history: the recording policy of the configurations in the Results (default: None, only the counters),
+                "all", N (every N steps), "delta" or None (see Results): the history replays the logged steps
+                after the routing, "delta" costs O(1) per step and "all" O(V) per step
+        Output:
+            - new particle configuration
+            - new rotor configuration
+            - Results of the routing
+        """
+        compiled = self.compile(sinks)
+        rotors = compiled.rotors_from_config(rotor_config)
+        particles = compiled.particles_from_config(particle_config)
+        counters = compiled.new_counters()
+        info = Results(self, particle_config, rotor_config, history)
+
+        logs = list()
+        for sign in signs:
+            if sign > 0:
+                nodes = particle_config.nodes_with_particle(sinks)
+            else:
+                nodes = particle_config.nodes_with_antiparticle(sinks)
+            worklist = compiled.worklist(nodes, particles, sign)
+            log = list() if history is not None else None
+            compiled.route(rotors, particles, worklist, sign, turn_and_move, counters, log, batch)
+            logs.append((sign, log))
+
+        if history is not None:
+            self._record_history(compiled, info, particle_config, rotor_config, logs, turn_and_move)
+
+        rotor_config = rotorconfig.RotorConfig(compiled.rotor_config_from(rotors, rotor_config))
+        particle_config = type(particle_config)(compiled.particle_config_from(particles, particle_config))
+        info.load_counters(compiled, counters)
+        info.rotor_config, info.particle_config = rotor_config, particle_config
+        if isinstance(history, int) and info.history_steps[-1] != info.nb_steps:
+            info.add_snapshot(rotor_config, particle_config)
+        info.orientation_edges(rotor_config)
+        info.particles_in_sinks(particle_config)
+
+        return particle_config, rotor_config, info
+
+    def _record_history(self, compiled: CompiledRotorGraph, info: Results, particle_config: ParticleConfig,
+                        rotor_config: RotorConfig, logs: list[tuple[int, list]], turn_and_move: bool):
+        """
+        Rebuild the history of a compiled routing from the logs of fired nodes
+        according to the recording policy of the Results
+        Input:
+            - compiled: the CompiledRotorGraph of the routing
+            - info: the Results to fill
+            - particle_config: the initial particle configuration
+            - rotor_config: the initial rotor configuration
+            - logs: list of (sign, log of fired nodes)
+            - turn_and_move: same meaning as in compiled_routing
+        No output
+        """
+        nodes = compiled.nodes
+        edges = compiled.edges
+        offsets = compiled.offsets
+        heads = compiled.heads
+        rotors = compiled.rotors_from_config(rotor_config)
+        particles = compiled.particles_from_config(particle_config)
+        for sign, log in logs:
+            for u, old, pos in compiled.replay(rotors, particles, log, sign, turn_and_move):
+                info.nb_steps += 1
+                if info.history == HISTORY_DELTA:
+                    move = (nodes[u], nodes[heads[pos]]) if sign > 0 else (nodes[heads[pos]], nodes[u])
+                    info.add_delta(nodes[u], edges[offsets[u] + old], edges[offsets[u] + rotors[u]], move)
+                elif info.snapshot_needed():
+                    info.add_snapshot(rotorconfig.RotorConfig(compiled.rotor_config_from(rotors, rotor_config)),
+                                      type(particle_config)(compiled.particle_config_from(particles, particle_config)))
+
+    def routing_trajectory(self, particle_config: ParticleConfig, rotor_config: RotorConfig, sinks: set=None,
+                           turn_and_move: bool=False, antiparticles: bool=False, batch: bool=False,
+                           keyframe_interval: int=1024) -> Trajectory:
+        """
+        Route particles (and antiparticles) to the sinks and give the Trajectory of the routing
+        Input:
+            - particle_config: the particle configuration of the graph
+            - rotor_config: the rotor configuration of the graph
+            - sinks: set of nodes that are considered as sinks (optional)
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+            - antiparticles: boolean (default: False), if True the antiparticles are routed
+                after the particles (as in complete_routing)
+            - batch: boolean (default: False), if True fire the k particles of a node at once
+            - keyframe_interval: number of steps between two keyframes (default: 1024)
+        Output:
+            - Trajectory of the routing
+        """
+        if sinks == None:
+            sinks = self.sinks
+
+        compiled = self.compile(sinks)
+        rotors = compiled.rotors_from_config(rotor_config)
+        particles = compiled.particles_from_config(particle_config)
+        counters = compiled.new_counters()
+        trajectory = Trajectory(compiled, rotors, particles,
+                                [node for node in rotor_config.keys() if node in compiled.node_index],
+                                [node for node in particle_config.keys() if node in compiled.node_index],
+                                turn_and_move, keyframe_interval)
+
+        for sign in ((1, -1) if antiparticles else (1,)):
+            if sign > 0:
+                nodes = particle_config.nodes_with_particle(sinks)
+            else:
+                nodes = particle_config.nodes_with_antiparticle(sinks)
+            replayed_rotors, replayed_particles = list(rotors), list(particles)
+            log = list()
+            compiled.route(rotors, particles, compiled.worklist(nodes, particles, sign), sign, turn_and_move,
+                           counters, log, batch)
+            for u, _, _ in compiled.replay(replayed_rotors, replayed_particles, log, sign, turn_and_move):
+                trajectory.append(u, replayed_rotors[u], sign)
+
+        return trajectory
+
+    def iter_routing(self, particle_config: ParticleConfig, rotor_config: RotorConfig, sinks: set=None,
+                     turn_and_move: bool=False, antiparticles: bool=False) -> RoutingIterator:
+        """
+        Give a lazy routing of the particles (and antiparticles) to the sinks:
+        iterating over it yields a RoutingStep (step, node, edge, successor) for each step,
+        the steps are made only when they are asked and the configurations are not copied.
+        The routing can be stopped with a predicate (RoutingIterator.until) and resumed.
+        Input:
+            - particle_config: the particle configuration of the graph
+            - rotor_config: the rotor configuration of the graph
+            - sinks: set of nodes that are considered as sinks (optional)
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+            - antiparticles: boolean (default: False), if True the antiparticles are routed
+                after the particles (as in complete_routing)
+        Output:
+            - RoutingIterator
+        """
+        if sinks == None:
+            sinks = self.sinks
+
+        return RoutingIterator(self.compile(sinks), rotor_config, particle_config, sinks, turn_and_move, antiparticles)
+
+    def rotor_walk_orbit(self, node: Node, rotor_config: RotorConfig,
+                         turn_and_move: bool=False) -> (int, int, RotorConfig, Results):
+        """
+        Detect the periodic orbit of the rotor walk of one particle, ignoring the sinks.
+        On a strongly connected graph the walk eventually locks into a periodic Eulerian-tour orbit.
+        The detection uses the cycle detection algorithm of Brent on hashed states,
+        so it stores only a constant number of configurations.
+        Input:
+            - node: the starting node of the particle
+            - rotor_config: the initial rotor configuration
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+        Output:
+            - pre-period: number of steps before the lock-in
+            - period: number of steps of the orbit
+            - the rotor configuration when entering the orbit
+            - Results of one period of the orbit (visit counters, no history)
+        """
+        compiled = self.compile(set())
+        rotors = compiled.rotors_from_config(rotor_config)
+        u = compiled.node_index[node]
+        pre_period, period = compiled.find_orbit(u, rotors, turn_and_move)
+
+        u = compiled.walk(u, rotors, pre_period, turn_and_move)
+        orbit_config = rotorconfig.RotorConfig(compiled.rotor_config_from(rotors, rotor_config))
+        sigma = particleconfig.ParticleConfig(self) + compiled.nodes[u]
+        info = Results(self, sigma, orbit_config, None)
+        counters = compiled.new_counters()
+        compiled.walk(u, rotors, period, turn_and_move, counters)
+        info.load_counters(compiled, counters)
+
+        return pre_period, period, orbit_config, info
+
     def legal_routing(self, particle_config: object, rotor_config: RotorConfig, sinks: set=None,
-                      turn_and_move: bool=False) -> (ParticleConfig, RotorConfig):
+                      turn_and_move: bool=False, batch: bool=False, history: str or int=None) -> (ParticleConfig, RotorConfig):
         """
         Route particles to the sinks
         Input:
@@ -468,6 +800,10 @@ class RotorGraph(nx.MultiDiGraph):
             - turn_and_move: boolean (default: False),
                 if True: turn first then move
                 else (False): move first then turn
+            - batch: boolean (default: False), if True fire the k particles of a node at once
+            - history: the recording policy of the configurations in the Results (default: None, only the counters),
+                "all", N (every N steps), "delta" or None (see Results): the history replays the logged steps
+                after the routing, "delta" costs O(1) per step and "all" O(V) per step
         Output:
             - new particle configuration
             - new rotor configuration
@@ -480,20 +816,11 @@ class RotorGraph(nx.MultiDiGraph):
         if sinks == None:
             sinks = self.sinks
 
-        
-        info = Results(self, particle_config, rotor_config)
-        while (node := particle_config.first_node_with_particle(sinks)) != None:
-            particle_config, rotor_config = self.step(particle_config, rotor_config, node, sinks,
-                                                      turn_and_move, info)
-        info.orientation_edges(rotor_config)
-        info.particles_in_sinks(particle_config)
-
-        return particle_config, rotor_config, info
-
+        return self.compiled_routing(particle_config, rotor_config, sinks, turn_and_move, (1,), batch, history)
 
 
     def route_one_particle(self, node: Node, rotor_config: RotorConfig, sinks: set=None,
-                           turn_and_move: bool=False) -> RotorConfig:
+                           turn_and_move: bool=False, batch: bool=False, history: str or int=None) -> RotorConfig:
         """
         Route one particule from the given node to a sink.
         Input:
@@ -503,16 +830,20 @@ class RotorGraph(nx.MultiDiGraph):
             - turn_and_move: boolean (default: False)
                 if True: turn first then move
                 else (False): move first then turn
+            - batch: boolean (default: False), if True fire the k particles of a node at once
+            - history: the recording policy of the configurations in the Results (default: None, only the counters),
+                "all", N (every N steps), "delta" or None (see Results): the history replays the logged steps
+                after the routing, "delta" costs O(1) per step and "all" O(V) per step
         Output:
             - new rotor configuration
         """
         sigma = particleconfig.ParticleConfig(self) + node
-        particle_config, rotor_config, info = self.legal_routing(sigma, rotor_config, sinks, turn_and_move)
+        particle_config, rotor_config, info = self.legal_routing(sigma, rotor_config, sinks, turn_and_move, batch, history)
         return rotor_config, info
 
 
     def complete_routing(self, particle_config: ParticleConfig, rotor_config: RotorConfig, sinks: set=None,
-                      turn_and_move: bool=False) -> (ParticleConfig, RotorConfig):
+                      turn_and_move: bool=False, batch: bool=False, history: str or int=None) -> (ParticleConfig, RotorConfig):
         """
         Route particles and antiparticles to the sinks
         Input:
@@ -522,6 +853,10 @@ class RotorGraph(nx.MultiDiGraph):
             - turn_and_move: boolean (default: False),
                 if True: turn first then move
                 else (False): move first then turn
+            - batch: boolean (default: False), if True fire the k particles of a node at once
+            - history: the recording policy of the configurations in the Results (default: None, only the counters),
+                "all", N (every N steps), "delta" or None (see Results): the history replays the logged steps
+                after the routing, "delta" costs O(1) per step and "all" O(V) per step
         Output:
             - new particle configuration
             - new rotor configuration
@@ -534,71 +869,277 @@ class RotorGraph(nx.MultiDiGraph):
         if sinks == None:
             sinks = self.sinks
 
-        
-        info = Results(self, particle_config, rotor_config)
-        while (node := particle_config.first_node_with_particle(sinks)) != None:
-            particle_config, rotor_config = self.step(particle_config, rotor_config, node, sinks, turn_and_move, info)
-        while (node := particle_config.first_node_with_antiparticle(sinks)) != None:
-            particle_config, rotor_config = self.reverse_step(particle_config, rotor_config, node, sinks, turn_and_move, info)
+        return self.compiled_routing(particle_config, rotor_config, sinks, turn_and_move, (1, -1), batch, history)
+
 
+    def odometer_routing(self, particle_config: ParticleConfig, rotor_config: RotorConfig, sinks: set=None,
+                         turn_and_move: bool=False, margin: int=2) -> (ParticleConfig, RotorConfig, Results):
+        """
+        Route particles to the sinks from an approximate odometer (number of times each node fires).
+        The odometer is approximated by solving the reduced laplacian system with SparseMatrix.solve
+        (scipy.sparse when it is installed, an iterative solver on the CSR arrays else), a lower bound of it
+        (margin full rotor periods less) is fired with the vector_routing arithmetic,
+        and the routing is finished with a short exact simulation.
+        The result is checked (no particle left and acyclic last exits) and the lower bound is
+        lowered if needed, so the rotor configuration, the particle configuration and the counters
+        nb_steps, edges_counter and nodes_counter are exactly the ones of legal_routing
+        last_visit is not computed: it depends on the order of the steps, which are not simulated one by one.
+        Input:
+            - particle_config: the particle configuration of the graph (without antiparticles)
+            - rotor_config: the rotor configuration of the graph
+            - sinks: set of nodes that are considered as sinks (optional)
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+            - margin: number of rotor periods removed from the approximate odometer (default: 2)
+        Output:
+            - new particle configuration
+            - new rotor configuration
+            - Results of the routing (no history, last_visit is None for every node)
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else: raise Exception("No sink in the graph: the routing would not end.")
+
+        compiled = self.compile(sinks)
+        initial_particles = compiled.particles_from_config(particle_config)
+        if any(k < 0 for k, sink in zip(initial_particles, compiled.is_sink) if not sink):
+            raise ValueError("odometer_routing only routes particles, not antiparticles")
+
+        if not compiled.reaches_sinks():
+            raise ValueError("The sinks cannot be reached from every node")
+
+        # continuous odometer y (in rotor periods): L^T y = sigma on the non sink nodes (sparse solve)
+        laplacian = self.sparse_laplacian(sinks, reduced=True)
+        nodes = laplacian.labels
+        sigma = np.array([particle_config[u] for u in nodes], dtype=float)
+        periods = laplacian.solve(sigma, transpose=True)
+        if not np.all(np.isfinite(periods)):
+            periods = np.zeros(len(nodes))
+
+        while True:
+            approximation = [0] * len(compiled.nodes)
+            for u, y in zip(nodes, periods):
+                i = compiled.node_index[u]
+                approximation[i] = max(0, int(compiled.degrees[i] * (y - margin)))
+
+            rotors = compiled.rotors_from_config(rotor_config)
+            particles = list(initial_particles)
+            counters = compiled.new_counters()
+            compiled.fire_odometer(rotors, particles, approximation, turn_and_move, counters)
+            worklist = compiled.worklist(compiled.nodes, particles)
+            compiled.route(rotors, particles, worklist, 1, turn_and_move, counters, None, True)
+
+            odometer = [sum(counters.edges[compiled.offsets[i]:compiled.offsets[i+1]])
+                        for i in range(len(compiled.nodes))]
+            stable = all(k == 0 for k, sink in zip(particles, compiled.is_sink) if not sink)
+            if not any(approximation) or (stable and compiled.last_exits_acyclic(rotors, odometer, turn_and_move)):
+                break
+            margin = 2 * margin + 1
+
+        info = Results(self, particle_config, rotor_config, None)
+        counters.last_visit = [None] * len(compiled.nodes)
+        info.load_counters(compiled, counters)
+        rotor_config = rotorconfig.RotorConfig(compiled.rotor_config_from(rotors, rotor_config))
+        particle_config = type(particle_config)(compiled.particle_config_from(particles, particle_config))
+        info.rotor_config, info.particle_config = rotor_config, particle_config
         info.orientation_edges(rotor_config)
         info.particles_in_sinks(particle_config)
 
         return particle_config, rotor_config, info
 
-
-    def laplacian_matrix(self, sinks: set=None) -> dict[Node, dict[Node, int]]:
+    def batch_routing(self, rotors: np.ndarray or list[RotorConfig], particles: np.ndarray or ParticleConfig,
+                      sinks: set=None, turn_and_move: bool=False) -> (np.ndarray, np.ndarray, np.ndarray):
         """
-        Create the laplacian matrix of the graph
+        Route B independent instances in lockstep with NumPy (see batchrouting.batch_route).
+        The columns of the arrays follow the order of the nodes of the compiled graph (self.compile(sinks).nodes).
         Input:
+            - rotors: (B, V) array of rotor indices or list of B RotorConfig
+            - particles: (B, V) or (V,) array of numbers of particles, or a ParticleConfig shared by all the instances
             - sinks: set of nodes that are considered as sinks (optional)
-        Output : 
-            - the laplacian matrix of the graph (dict of dict)
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+        Output:
+            - (B,) array of the number of steps of each instance
+            - (B, V) array of the final rotor indices
+            - (B, S) array of the numbers of particles on the sinks
+        """
+        compiled = self.compile(sinks)
+        if not isinstance(rotors, np.ndarray):
+            rotors = np.array([compiled.rotors_from_config(rotor_config) for rotor_config in rotors], dtype=np.int64)
+        if type(particles).__name__ == "ParticleConfig":
+            particles = np.array(compiled.particles_from_config(particles), dtype=np.int64)
+        return batchrouting.batch_route(compiled, rotors, particles, turn_and_move)
+
+    def sparse_laplacian(self, sinks: set=None, reduced: bool=False, scipy: bool=False) -> matrices.SparseMatrix:
+        """
+        Create the laplacian matrix of the graph in sparse form, in one pass over the rotor order
+        (the row of a non sink node u has out_degree(u) - (number of loops) on the diagonal and -(number of edges u -> v) in the column v),
+        cached until the graph changes
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+            - reduced: boolean (default: False),
+                if True: the reduced laplacian matrix (rows and columns of the non sink nodes)
+                else (False): the laplacian matrix (rows and columns of all the nodes, the rows of the sinks are zero)
+            - scipy: boolean (default: False), if True give a scipy.sparse.csr_matrix (scipy has to be installed)
+        Output:
+            - SparseMatrix (CSR arrays, the rows and the columns follow the order of self.nodes), shared: not to be modified
         """
         if sinks is None:
-            non_sink_nodes = self.nodes - self.sinks
+            sinks = self.sinks
+        laplacian = self._derived("sparse_laplacian", sinks, lambda: self._build_laplacian(sinks, reduced), reduced)
+        if scipy:
+            return laplacian.to_scipy()
+        return laplacian
+
+    def _build_laplacian(self, sinks: set, reduced: bool) -> matrices.SparseMatrix:
+        """
+        Build the sparse laplacian matrix (see sparse_laplacian)
+        Input:
+            - sinks: set of nodes that are considered as sinks
+            - reduced: boolean, if True the reduced laplacian matrix
+        Output:
+            - SparseMatrix
+        """
+        if reduced:
+            labels = [node for node in self.nodes if node not in sinks]
         else:
-            non_sink_nodes = self.nodes - sinks
-
-        matrix = dict()
-        for u in self.nodes:
-            if u in non_sink_nodes:
-                matrix[u] = dict()
-                for v in self.nodes:
-                    if u == v:
-                        matrix[u][v] = self.out_degree(u) - self.number_of_edges(u, v)
-                    else:
-                        matrix[u][v] = -self.number_of_edges(u, v)
-            else:
-                matrix[u] = {v: 0 for v in self.nodes}
+            labels = list(self.nodes)
+        index = {node: i for i, node in enumerate(labels)}
+
+        rows, columns, values = list(), list(), list()
+        for u, edges in self.rotor_order.items():
+            if u in sinks or u not in index:
+                continue
+            i = index[u]
+            rows.append(i)
+            columns.append(i)
+            values.append(len(edges))
+            for edge in edges:
+                if edge[1] in index:
+                    rows.append(i)
+                    columns.append(index[edge[1]])
+                    values.append(-1)
+
+        return matrices.SparseMatrix.from_coo(labels, rows, columns, values)
 
-        return matrices.Matrix(matrix)
+    def laplacian_matrix(self, sinks: set=None) -> matrices.Matrix:
+        """
+        Create the laplacian matrix of the graph
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output : 
+            - the laplacian matrix of the graph (Matrix, see sparse_laplacian for the sparse form)
+        """
+        return self.sparse_laplacian(sinks).to_matrix()
 
-    def reduced_laplacian_matrix(self, sinks: set=None) -> dict[Node, dict[Node, int]]:
+    def reduced_laplacian_matrix(self, sinks: set=None) -> matrices.Matrix:
         """
         Create the reduced laplacian matrix of the graph
         Input:
             - sinks: set of nodes that are considered as sinks (optional)
         Output : 
-            - the reduced laplacian matrix of the graph (dict of dict)
+            - the reduced laplacian matrix of the graph (Matrix, see sparse_laplacian for the sparse form)
         """
-        if sinks is None:
-            nodes = self.nodes - self.sinks
-        else:
-            nodes = self.nodes - sinks
-
-        matrix = dict()
-        for u in nodes:
-            matrix[u] = dict()
-            for v in nodes:
-                if u == v:
-                    matrix[u][v] = self.out_degree(u) - self.number_of_edges(u, v)
-                else:
-                    matrix[u][v] = -self.number_of_edges(u, v)
+        return self.sparse_laplacian(sinks, reduced=True).to_matrix()
+
+    def count_acyclic_configurations(self, sinks: set=None) -> int:
+        """
+        Count the acyclic configurations of the graph, which is also the number of rotor classes
+        (matrix-tree theorem: determinant of the reduced laplacian matrix, computed exactly with the
+        sparse fraction-free Bareiss elimination, the nodes are ordered by reverse Cuthill-McKee to keep the matrix banded),
+        cached until the graph changes.
+        The exact determinant of a n x n grid has about 2*n^2 bits and its cost grows faster than n^6
+        (about 1 s for 30 x 30 and 10 s for 40 x 40): a 100 x 100 grid is out of reach
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - the number of acyclic configurations
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else:
+                raise Exception("No sink in the graph: cannot find an acyclic configuration.")
+
+        def determinant() -> int:
+            # sparse reduced laplacian, with a bandwidth reducing order of the nodes
+            laplacian = self.sparse_laplacian(sinks, reduced=True)
+            undirected = nx.Graph(self.subgraph(laplacian.labels))
+            order = list(nx.utils.reverse_cuthill_mckee_ordering(undirected))
+            return matrices.bareiss_determinant(laplacian.rows(order))
+
+        return self._derived("count_acyclic_configurations", sinks, determinant)
+
+
+
+    def sandpile_group(self, sinks: set=None) -> list[int]:
+        """
+        Give the structure of the sandpile group of the graph (isomorphic to the rotor-routing group acting on the classes):
+        the invariant factors d1 | d2 | ... | dk, not equal to 1, of the smith normal form of the reduced laplacian matrix,
+        the group is Z/d1 x ... x Z/dk and its order is the number of acyclic configurations
+        (the factors of the cached SandpileGroup, see sandpile)
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - list of the invariant factors (empty for the trivial group)
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else:
+                raise Exception("No sink in the graph: the sandpile group is infinite.")
+
+        return list(self.sandpile(sinks).factors)
+
+    def sandpile(self, sinks: set=None) -> SandpileGroup:
+        """
+        Give the sandpile group of the graph with the coordinates of the particle configurations
+        in Z/d1 x ... x Z/dk (computed once from the smith normal form of the reduced laplacian, cached until the graph changes),
+        so that the equivalence of particle configurations modulo the laplacian is decided without routing
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - SandpileGroup (shared: not to be modified)
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else:
+                raise Exception("No sink in the graph: the sandpile group is infinite.")
+
+        return self._derived("sandpile", sinks, lambda: SandpileGroup.from_graph(self, sinks))
 
-        return matrices.Matrix(matrix)
+    def sandpile_coordinates(self, particles: ParticleConfig or np.ndarray, sinks: set=None) -> tuple[int] or np.ndarray:
+        """
+        Give the coordinates of particle configurations in the sandpile group (see SandpileGroup.coordinates)
+        Input:
+            - particles: a ParticleConfig, or a (V,) or (B, V) integer array of numbers of particles
+                (the columns follow the order of the nodes of the compiled graph, self.compile(sinks).nodes)
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - tuple of coordinates for a ParticleConfig, (k,) or (B, k) array for an array
+        """
+        return self.sandpile(sinks).coordinates(particles)
 
+    def rotor_routing_action(self, sinks: set=None) -> RotorRoutingAction:
+        """
+        Give the rotor-routing action of the sandpile group on the acyclic configurations
+        (the permutations of the generators and of the elements are computed once and kept with it), cached until the graph changes
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - RotorRoutingAction (shared)
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else:
+                raise Exception("No sink in the graph: the sandpile group is infinite.")
 
+        return self._derived("rotor_routing_action", sinks, lambda: RotorRoutingAction(self, sinks))
 
     def vector_routing(self, particle_config: object, rotor_config: RotorConfig, vector:
                        dict[Node:int], sinks: set=None, turn_and_move: bool=False) -> (ParticleConfig, RotorConfig):
@@ -616,17 +1157,19 @@ class RotorGraph(nx.MultiDiGraph):
             - the new particle configuration
             - the new rotor configuration
         """
-        matrix = self.laplacian_matrix(sinks)
+        matrix = self.sparse_laplacian(sinks)
         for u, k in vector.items():
             if u not in matrix: continue
+            row = matrix[u]
+            if not row.get(u, 0): continue
 
-            c = k // matrix[u][u]
+            c = k // row[u]
 
-            for v, p in matrix[u].items():
-                particle_config.configuration[v] -= c*p
+            for v, p in row.items():
+                particle_config[v] = particle_config[v] - c*p
 
-            for _ in range(k % matrix[u][u]):
-                self.step(particle_config, rotor_config, node=u, sinks=sinks, turn_and_move=turn_and_move)
+            for _ in range(k % row[u]):
+                particle_config, rotor_config = self.step(particle_config, rotor_config, node=u, sinks=sinks, turn_and_move=turn_and_move)
 
         return particle_config, rotor_config
 
@@ -670,6 +1213,63 @@ class RotorGraph(nx.MultiDiGraph):
                     rotor_configuration[i] += 1
         # return config_list
 
+    def enum_configurations_gray(self, sinks: set=None, compact: bool=True):
+        """
+        Enumerate all the rotor configurations of the graph in reflected (mixed-radix) Gray code order:
+        two consecutive configurations differ by one rotor turned once forward or backward.
+        A single mutable configuration is updated in place and yielded with the change
+        (loopless algorithm, O(1) per configuration).
+        Input:
+            - sinks: set of nodes that are considered as sinks
+            - compact: boolean (default: True),
+                if True: the configuration is a list of rotor indices, in the order of the non sink nodes
+                    of rotor_order (the order of enum_configurations)
+                else (False): the configuration is a RotorConfig
+        Output:
+            - generator of (configuration, change), change is (node, old edge, new edge)
+                (None for the first configuration)
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else: raise Exception("No sink in the graph: cannot find an acyclic configuration.")
+
+        rotor_order = self.rotor_order
+        nodes = [node for node in rotor_order.keys() if node not in sinks]
+        radices = [len(rotor_order[node]) for node in nodes]
+        if 0 in radices:
+            return
+        rotors = [0] * len(nodes)
+        if compact:
+            configuration = rotors
+        else:
+            configuration = rotorconfig.RotorConfig({node: rotor_order[node][0] for node in nodes})
+            dic = configuration.configuration
+        yield configuration, None
+
+        digits = [i for i, radix in enumerate(radices) if radix > 1] # nodes with a single edge never change
+        n = len(digits)
+        focus = list(range(n + 1)) # focus pointers
+        direction = [1] * n
+        while True:
+            j = focus[0]
+            focus[0] = 0
+            if j == n:
+                return
+            i = digits[j]
+            old = rotors[i]
+            new = old + direction[j]
+            rotors[i] = new
+            if new == 0 or new == radices[i] - 1:
+                direction[j] = -direction[j]
+                focus[j] = focus[j + 1]
+                focus[j + 1] = j + 1
+            node = nodes[i]
+            edges = rotor_order[node]
+            if not compact:
+                dic[node] = edges[new]
+            yield configuration, (node, edges[old], edges[new])
+
 
     def enum_acyclic_configurations(self, sinks:set=None) -> list[RotorConfig]:
         """
@@ -690,15 +1290,14 @@ class RotorGraph(nx.MultiDiGraph):
         i = 0 # index of the node where to chose the next edge
         acyclic_config = list() # resulting list
         rotor_configuration = [0 for _ in range(len(nodes))] # take first edges of all nodes
-        uf_list = [None for _ in range(len(nodes))] # set unionfind list
-        uf_list[0] = UnionFind(list(self.nodes)) # create the first unionfind
+        uf = RollbackUnionFind(list(self.nodes)) # union of the edges of nodes[:i], undone when going back
 
         while rotor_configuration[0] < self.out_degree(nodes[0]):
             if i == len(nodes)-1: # last node
                 if rotor_configuration[i] < self.out_degree(nodes[i]): # not his last edge
                     # check if adding the edge will not create a cycle
                     edge = self.rotor_order[nodes[i]][rotor_configuration[i]]
-                    if not uf_list[i].connected(edge[0], edge[1]):
+                    if not uf.connected(edge[0], edge[1]):
                         dic = {nodes[i]: self.rotor_order[nodes[i]][rotor_configuration[i]] for i in range(len(nodes))}
                         rc = rotorconfig.RotorConfig(dic)
                         acyclic_config.append(rc)
@@ -706,24 +1305,235 @@ class RotorGraph(nx.MultiDiGraph):
                 else:
                     rotor_configuration[i] = 0
                     i -= 1
+                    uf.undo()
                     rotor_configuration[i] += 1
 
             else:
                 if rotor_configuration[i] < self.out_degree(nodes[i]):
                     edge = self.rotor_order[nodes[i]][rotor_configuration[i]]
-                    if not uf_list[i].connected(edge[0], edge[1]):
-                        uf_list[i+1] = deepcopy(uf_list[i])
-                        uf_list[i+1].union(edge[0], edge[1])
+                    if not uf.connected(edge[0], edge[1]):
+                        uf.union(edge[0], edge[1])
                         i += 1
                     else:
                         rotor_configuration[i] += 1
                 else:
                     rotor_configuration[i] = 0
                     i -= 1
+                    uf.undo()
                     rotor_configuration[i] += 1
         return acyclic_config
 
 
+    def enum_spanning_forests(self, sinks: set=None, compact: bool=False, prefix: tuple[int]=(),
+                              start: list[int]=None):
+        """
+        Enumerate the acyclic rotor configurations of the graph (the oriented spanning forests rooted at the sinks)
+        with a polynomial delay: the edges are chosen node by node (in the order of enum_acyclic_configurations)
+        and an edge u -> v is only chosen if v still reaches a sink without going through u,
+        so that every branch of the search gives at least one configuration.
+        Input:
+            - sinks: set of nodes that are considered as sinks
+            - compact: boolean (default: False),
+                if True: yield a single list of rotor indices (in the order of the non sink nodes of rotor_order)
+                    updated in place
+                else (False): yield a new RotorConfig for each configuration
+            - prefix: the rotor indices of the first nodes, only the configurations starting with them are given
+                (default: no prefix)
+            - start: an acyclic configuration as a list of rotor indices (starting with prefix),
+                the enumeration starts after it (optional)
+        Output:
+            - generator of the acyclic configurations (in the same order as enum_acyclic_configurations)
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else:
+                raise Exception("No sink in the graph: cannot find an acyclic configuration.")
+
+        rotor_order = self.rotor_order
+        nodes = [node for node in rotor_order.keys() if node not in sinks]
+        heads = {node: [edge[1] for edge in rotor_order.get(node, [])] for node in self.nodes}
+        decided = dict() # node -> head of its chosen edge
+
+        def reaches_sink(v: Node, u: Node) -> bool:
+            # can v reach a sink without going through u (decided nodes only follow their chosen edge)
+            if v == u:
+                return False
+            stack = [v]
+            seen = {v, u}
+            while stack:
+                w = stack.pop()
+                if w in sinks:
+                    return True
+                for x in ([decided[w]] if w in decided else heads[w]):
+                    if x not in seen:
+                        seen.add(x)
+                        stack.append(x)
+            return False
+
+        # every node has to reach a sink
+        reached = set(sink for sink in sinks if sink in heads)
+        stack = list(reached)
+        while stack:
+            w = stack.pop()
+            for edge in self.in_edges(w):
+                if edge[0] not in reached:
+                    reached.add(edge[0])
+                    stack.append(edge[0])
+        if any(node not in reached for node in nodes):
+            return
+
+        n = len(nodes)
+        rotors = [-1] * n
+        for i, r in enumerate(prefix):
+            u = nodes[i]
+            if r >= len(heads[u]) or not reaches_sink(heads[u][r], u):
+                return
+            rotors[i] = r
+            decided[u] = heads[u][r]
+        i = len(prefix)
+        if start is not None:
+            # go on as if start had just been yielded
+            for k in range(i, n):
+                rotors[k] = start[k]
+                decided[nodes[k]] = heads[nodes[k]][start[k]]
+            i = n - 1
+        while i >= len(prefix):
+            if i == n:
+                if compact:
+                    yield rotors
+                else:
+                    yield rotorconfig.RotorConfig({node: rotor_order[node][r] for node, r in zip(nodes, rotors)})
+                i -= 1
+                continue
+            u = nodes[i]
+            decided.pop(u, None)
+            r = rotors[i] + 1
+            while r < len(heads[u]) and not reaches_sink(heads[u][r], u):
+                r += 1
+            if r == len(heads[u]):
+                rotors[i] = -1
+                i -= 1
+            else:
+                rotors[i] = r
+                decided[u] = heads[u][r]
+                i += 1
+
+    def sample_configurations(self, nb_samples: int, sinks: set=None, seed: int or Random=None,
+                              compact: bool=False) -> list[tuple[RotorConfig, RotorConfig]]:
+        """
+        Draw uniformly random acyclic configurations with Wilson's algorithm (loop-erased random walks
+        toward the sinks) and the recurrent configurations of their classes (turn_all).
+        Input:
+            - nb_samples: number of configurations to draw
+            - sinks: set of nodes that are considered as sinks (optional)
+            - seed: seed of the random number generator, or a random.Random (optional)
+            - compact: boolean (default: False),
+                if True: the configurations are lists of rotor indices (in the order of self.compile(sinks).nodes)
+                else (False): the configurations are RotorConfigs
+        Output:
+            - list of (acyclic configuration, recurrent configuration)
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else:
+                raise Exception("No sink in the graph: cannot find an acyclic configuration.")
+
+        compiled = self.compile(sinks)
+        if not compiled.reaches_sinks():
+            raise ValueError("The sinks cannot be reached from every node")
+        rng = seed if isinstance(seed, Random) else Random(seed)
+        nodes = [node for node in self.rotor_order.keys() if node not in sinks]
+
+        samples = list()
+        for _ in range(nb_samples):
+            rotors = compiled.random_acyclic_rotors(rng)
+            if compact:
+                recurrent = [(r + 1) % degree if degree else 0 for r, degree in zip(rotors, compiled.degrees)]
+                samples.append((rotors, recurrent))
+            else:
+                acyclic = rotorconfig.RotorConfig({node: self.rotor_order[node][rotors[compiled.node_index[node]]]
+                                                   for node in nodes})
+                samples.append((acyclic, self.turn_all(acyclic, sinks=sinks)))
+        return samples
+
+    def random_acyclic_configuration(self, sinks: set=None, seed: int or Random=None) -> (RotorConfig, RotorConfig):
+        """
+        Draw a uniformly random acyclic configuration with Wilson's algorithm
+        and the recurrent configuration of its class (see sample_configurations)
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+            - seed: seed of the random number generator, or a random.Random (optional)
+        Output:
+            - acyclic configuration
+            - recurrent configuration
+        """
+        return self.sample_configurations(1, sinks, seed)[0]
+
+    def class_key(self, rotor_config: RotorConfig, sinks: set=None) -> bytes:
+        """
+        Give a hashable key of the class of a rotor configuration: two configurations are in
+        the same class if and only if they have the same key (the compact encoding of their destination forest,
+        CompactRotorConfig(self.compile(sinks), key).to_rotor_config() gives the acyclic configuration of the class).
+        The nodes missing from the configuration take the first edge of their rotor order.
+        Input:
+            - rotor_config: the rotor configuration
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - the key (bytes)
+        """
+        if sinks == None:
+            sinks = self.sinks
+
+        compiled = self.compile(sinks)
+        return compiled.class_key(compiled.rotors_from_config(rotor_config))
+
+    def class_index(self, sinks: set=None, members: bool=False) -> dict[bytes, int or list[RotorConfig]]:
+        """
+        Sort all the rotor configurations of the graph by class in one pass (see class_key)
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+            - members: boolean (default: False),
+                if True: give the list of the configurations of each class
+                else (False): give the number of configurations of each class
+        Output:
+            - dict {class key: number of configurations or list of configurations}
+        """
+        if sinks == None:
+            if self.sinks:
+                sinks = self.sinks
+            else: raise Exception("No sink in the graph: cannot find an acyclic configuration.")
+
+        compiled = self.compile(sinks)
+        nodes = [node for node in self.rotor_order.keys() if node not in sinks]
+        indices = [compiled.node_index[node] for node in nodes]
+        rotors = [0] * len(compiled.nodes)
+        index = dict()
+        for config, _ in self.enum_configurations_gray(sinks):
+            for i, r in zip(indices, config):
+                rotors[i] = r
+            key = compiled.class_key(rotors)
+            if members:
+                member = rotorconfig.RotorConfig({node: self.rotor_order[node][r] for node, r in zip(nodes, config)})
+                index.setdefault(key, list()).append(member)
+            else:
+                index[key] = index.get(key, 0) + 1
+        return index
+
+    def class_size_distribution(self, sinks: set=None) -> dict[int, int]:
+        """
+        Give the distribution of the sizes of the classes
+        Input:
+            - sinks: set of nodes that are considered as sinks (optional)
+        Output:
+            - dict {size: number of classes of this size}
+        """
+        distribution = dict()
+        for size in self.class_index(sinks).values():
+            distribution[size] = distribution.get(size, 0) + 1
+        return dict(sorted(distribution.items()))
+
     def recurrent_from_acyclic(self, list_acyclic:list[RotorConfig]) -> list[tuple[RotorConfig, RotorConfig]]:
         """
         For all acyclic configuration, gives the corresponding recurrent configuration in the class
@@ -749,39 +1559,79 @@ class RotorGraph(nx.MultiDiGraph):
         rec_acyclic = list()
         for config in list_acyclic:
             rec = self.turn_all(config)
-            acy = deepcopy(rec)
+            acy = rotorconfig.RotorConfig(dict(rec.configuration))
             acy.destination_forest(self)
             rec_acyclic.append((rec, acy))
 
         return rec_acyclic
 
 
-def all_config_from_recurrent(rotor_graph: RotorGraph, rotor_config: RotorConfig, sinks:set=None,
-                              set_config: set[RotorConfig]=None) -> set[RotorConfig]:
+def iter_class(rotor_graph: RotorGraph, rotor_config: RotorConfig, sinks: set=None, compact: bool=False):
+    """
+    Give all the configurations reachable from the given configuration by cycle pushes
+    (the class of a recurrent configuration), each one once.
+    The exploration is an iterative breadth first search on the compiled graph, the visited configurations
+    are stored as hashed compact encodings (bytes of the rotor indices).
+    Input:
+        - rotor_graph: the RotorGraph of the configuration
+        - rotor_config: the RotorConfig to start from
+        - sinks: a set of Node to consider as sink
+        - compact: boolean (default: False),
+            if True: yield lists of rotor indices (in the order of rotor_graph.compile(sinks).nodes)
+            else (False): yield RotorConfigs
+    Output:
+        - generator of the configurations
+    """
+    if sinks == None:
+        sinks = rotor_graph.sinks
+
+    compiled = rotor_graph.compile(sinks)
+    degrees = compiled.degrees
+    encode = bytes if max(degrees, default=0) <= 256 else tuple
+    start = compiled.rotors_from_config(rotor_config)
+    seen = {encode(start)}
+    queue = deque([start])
+    while queue:
+        rotors = queue.popleft()
+        if compact:
+            yield rotors
+        else:
+            yield rotorconfig.RotorConfig(compiled.rotor_config_from(rotors, rotor_config))
+        for cycle in compiled.rotor_cycles(rotors):
+            next_rotors = list(rotors)
+            for u in cycle:
+                next_rotors[u] = (next_rotors[u] + 1) % degrees[u]
+            key = encode(next_rotors)
+            if key not in seen:
+                seen.add(key)
+                queue.append(next_rotors)
+
+
+def class_size(rotor_graph: RotorGraph, rotor_config: RotorConfig, sinks: set=None) -> int:
+    """
+    Count the configurations reachable from the given configuration by cycle pushes
+    without building them (see iter_class)
+    Input:
+        - rotor_graph: the RotorGraph of the configuration
+        - rotor_config: the RotorConfig to start from
+        - sinks: a set of Node to consider as sink
+    Output:
+        - number of configurations of the class
+    """
+    return sum(1 for _ in iter_class(rotor_graph, rotor_config, sinks, compact=True))
+
+
+def all_config_from_recurrent(rotor_graph: RotorGraph, rotor_config: RotorConfig, sinks:set=None) -> list[RotorConfig]:
     """
     Gives all the configuration in the class of the given recurrent configuration
     Input:
         - rotor_graph: the RotorGraph of the recurrent configuration
         - rotor_config: the recurrent RotorConfig of the class
         - sinks: a set of Node to consider as sink
-        - set_config: the set where to store the RotorConfig
     Output:
-        - set of all the RotorConfig of the class
+        - list of all the RotorConfig of the class (each one once, see iter_class)
     """
-    if set_config is None:
-        set_config = [rotor_config]
-        if sinks == None:
-            if rotor_graph.sinks:
-                sinks = rotor_graph.sinks
-
-    if cycles := rotor_config.find_cycles(sinks):
-        for cycle in cycles:
-            next_config = deepcopy(rotor_config)
-            next_config.cycle_push(rotor_graph, cycle)
-            if next_config not in set_config:
-                set_config.append(next_config)
-            all_config_from_recurrent(rotor_graph, next_config, sinks, set_config)
-    return set_config
+    return list(iter_class(rotor_graph, rotor_config, sinks))
 
 
 
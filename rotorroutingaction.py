@@ -0,0 +1,189 @@
+from types_definition import *
+from collections import deque
+import numpy as np
+import batchrouting
+
+
+class RotorRoutingAction(object):
+
+    def __init__(self, G: RotorGraph, sinks: set):
+        """
+        The rotor-routing action of the sandpile group on the acyclic configurations of a graph:
+        a particle configuration sigma sends the acyclic configuration a to the acyclic configuration
+        of legal_routing(sigma, rho) where rho = recurrent_from_acyclic(a), and the action is simply transitive.
+        The acyclic configurations are numbered (in the order of enum_acyclic_configurations), the action of
+        a generator (one particle on a node) is a permutation of these numbers computed once for all the
+        configurations by a batched route_one_particle, and the configurations are labelled by their coordinates
+        in the sandpile group (SandpileGroup) relative to the first one, so that the action of any element is a table lookup.
+            - group: the SandpileGroup of the graph
+            - compiled: the CompiledRotorGraph of the graph
+            - nodes: the non sink nodes (the generators), in the order of the compiled graph
+            - acyclic: list of the acyclic configurations
+            - rotors: (N, V) array of the rotor indices of the recurrent configurations (recurrent_from_acyclic)
+            - index, acyclic_index: dicts {bytes of the rotor indices: number} of the recurrent and acyclic configurations
+            - generators: dict {node: permutation}, the cached permutations of the generators (int64 arrays)
+            - permutations: dict {coordinates: permutation}, the cached permutations of the other elements
+            - labels: list of the coordinates of each configuration (None until they are needed)
+        Input:
+            - G: the RotorGraph
+            - sinks: set of nodes that are considered as sinks
+        """
+        self.group = G.sandpile(sinks)
+        self.compiled = G.compile(sinks)
+        self.nodes = [node for node in self.compiled.nodes if node not in sinks]
+        self.acyclic = G.enum_acyclic_configurations(sinks)
+        recurrent = G.recurrent_from_acyclic(self.acyclic)
+        self.rotors = np.array([self.compiled.rotors_from_config(rotor_config) for rotor_config in recurrent],
+                               dtype=np.int64).reshape(len(recurrent), len(self.compiled.nodes))
+        self.index = {row.tobytes(): i for i, row in enumerate(self.rotors)}
+        self.acyclic_index = {self._key(rotor_config): i for i, rotor_config in enumerate(self.acyclic)}
+        if len(self.acyclic) != self.group.order():
+            raise ValueError("The number of acyclic configurations is not the order of the sandpile group")
+        self.generators = dict()
+        self.permutations = dict()
+        self.labels = None
+        self.label_index = None
+
+    def __len__(self) -> int:
+        return len(self.acyclic)
+
+    def _key(self, rotor_config: RotorConfig) -> bytes:
+        """
+        Input:
+            - rotor_config: a rotor configuration
+        Output:
+            - the bytes of its rotor indices
+        """
+        return np.array(self.compiled.rotors_from_config(rotor_config), dtype=np.int64).tobytes()
+
+    def config_index(self, acyclic_config: RotorConfig) -> int:
+        """
+        Input:
+            - acyclic_config: an acyclic configuration of the graph
+        Output:
+            - its number
+        """
+        key = self._key(acyclic_config)
+        if key not in self.acyclic_index:
+            raise ValueError("The configuration is not an acyclic configuration of the graph")
+        return self.acyclic_index[key]
+
+    def generator(self, node: Node) -> np.ndarray:
+        """
+        Give the permutation of the acyclic configurations by one particle on a node
+        (route_one_particle from every recurrent configuration at once with batch_route), cached
+        Input:
+            - node: a non sink node
+        Output:
+            - int64 array, the configuration i is sent to the configuration permutation[i]
+        """
+        if node not in self.generators:
+            if node not in self.compiled.node_index or node in self.group.sinks:
+                raise ValueError(f"{node} is not a non sink node of the graph")
+            particles = np.zeros(len(self.compiled.nodes), dtype=np.int64)
+            particles[self.compiled.node_index[node]] = 1
+            _, rotors, _ = batchrouting.batch_route(self.compiled, self.rotors, particles)
+            permutation = np.array([self.index[row.tobytes()] for row in rotors], dtype=np.int64)
+            self.generators[node] = permutation
+        return self.generators[node]
+
+    def _label(self):
+        """
+        Label every configuration by its coordinates relative to the first one (breadth first search
+        with the permutations of the generators, every configuration is reached since the action is transitive)
+        No output
+        """
+        steps = [(self.group.coordinates({node: 1}), self.generator(node)) for node in self.nodes]
+        labels = [None] * len(self)
+        labels[0] = self.group.identity()
+        queue = deque([0])
+        while queue:
+            i = queue.popleft()
+            for coordinates, permutation in steps:
+                j = int(permutation[i])
+                if labels[j] is None:
+                    labels[j] = self.group.add(labels[i], coordinates)
+                    queue.append(j)
+        self.labels = labels
+        self.label_index = {label: i for i, label in enumerate(labels)}
+
+    def permutation(self, element: ParticleConfig or tuple[int]) -> np.ndarray:
+        """
+        Give the permutation of the acyclic configurations by an element of the sandpile group, cached
+        Input:
+            - element: a ParticleConfig or the coordinates of an element (see SandpileGroup)
+        Output:
+            - int64 array, the configuration i is sent to the configuration permutation[i]
+        """
+        coordinates = element if isinstance(element, tuple) else self.group.coordinates(element)
+        if coordinates not in self.permutations:
+            if self.labels is None:
+                self._label()
+            self.permutations[coordinates] = np.array(
+                [self.label_index[self.group.add(label, coordinates)] for label in self.labels], dtype=np.int64)
+        return self.permutations[coordinates]
+
+    def act(self, element: ParticleConfig or tuple[int], indices: int or np.ndarray) -> int or np.ndarray:
+        """
+        Apply an element of the sandpile group to acyclic configurations
+        Input:
+            - element: a ParticleConfig or the coordinates of an element
+            - indices: the number of a configuration, or an array of numbers
+        Output:
+            - the number(s) of the resulting configuration(s)
+        """
+        result = self.permutation(element)[indices]
+        return int(result) if np.ndim(result) == 0 else result
+
+    def apply_generators(self, indices: int or np.ndarray, nodes: list[Node]=None) -> np.ndarray:
+        """
+        Apply the generators (one particle on a node) to acyclic configurations in batch
+        Input:
+            - indices: the number of a configuration, or an array of B numbers
+            - nodes: the nodes of the generators (default: every non sink node)
+        Output:
+            - (len(nodes),) or (len(nodes), B) array, the row g gives the images by the generator of nodes[g]
+        """
+        if nodes is None:
+            nodes = self.nodes
+        return np.array([self.generator(node)[indices] for node in nodes], dtype=np.int64)
+
+    def orbit(self, index: int, elements: list[ParticleConfig or tuple[int]]=None) -> list[int]:
+        """
+        Give the orbit of an acyclic configuration under the subgroup generated by elements
+        (breadth first search with their cached permutations)
+        Input:
+            - index: the number of the configuration
+            - elements: list of ParticleConfig or coordinates (default: the generators, the orbit is then every configuration)
+        Output:
+            - list of the numbers of the configurations of the orbit, in the order of the search
+        """
+        if elements is None:
+            permutations = [self.generator(node) for node in self.nodes]
+        else:
+            permutations = [self.permutation(element) for element in elements]
+        seen = {index}
+        orbit = [index]
+        queue = deque([index])
+        while queue:
+            i = queue.popleft()
+            for permutation in permutations:
+                j = int(permutation[i])
+                if j not in seen:
+                    seen.add(j)
+                    orbit.append(j)
+                    queue.append(j)
+        return orbit
+
+    def stabilizes(self, element: ParticleConfig or tuple[int], indices: int or np.ndarray) -> bool or np.ndarray:
+        """
+        Check if an element of the sandpile group fixes acyclic configurations
+        (only the identity does, the action is simply transitive)
+        Input:
+            - element: a ParticleConfig or the coordinates of an element
+            - indices: the number of a configuration, or an array of numbers
+        Output:
+            - boolean, or array of booleans
+        """
+        result = self.permutation(element)[indices] == indices
+        return bool(result) if np.ndim(result) == 0 else result
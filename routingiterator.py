@@ -0,0 +1,110 @@
+from types_definition import *
+from collections import namedtuple
+import rotorconfig
+
+RoutingStep = namedtuple("RoutingStep", ["step", "node", "edge", "successor"])
+
+
+class RoutingIterator(object):
+
+    def __init__(self, compiled_graph: CompiledRotorGraph, rotor_config: RotorConfig, particle_config: ParticleConfig,
+                 sinks: set, turn_and_move: bool=False, antiparticles: bool=False):
+        """
+        A lazy routing: iterating over it makes the steps of the routing one by one
+        and gives a RoutingStep (step index, fired node, edge taken, successor) for each of them,
+        without copying the configurations.
+        The iteration can be stopped at any time and resumed later.
+        The steps are the ones of RotorGraph.legal_routing (and complete_routing with antiparticles).
+        Input:
+            - compiled_graph: the CompiledRotorGraph to route on
+            - rotor_config: the initial rotor configuration
+            - particle_config: the initial particle configuration
+            - sinks: set of nodes that are considered as sinks
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+            - antiparticles: boolean (default: False), if True the antiparticles are routed after the particles
+        """
+        self.compiled_graph = compiled_graph
+        self.rotor_config = rotor_config
+        self.particle_config = particle_config
+        self.sinks = sinks
+        self.turn_and_move = turn_and_move
+        self.rotors = compiled_graph.rotors_from_config(rotor_config)
+        self.particles = compiled_graph.particles_from_config(particle_config)
+        self.signs = [1, -1] if antiparticles else [1]
+        self.nb_steps = 0
+        self._steps = self._all_steps()
+
+    def _all_steps(self):
+        """
+        Generator of the steps of every phase (particles, then antiparticles)
+        Output:
+            - generator of (fired node index, edge position, successor index)
+        """
+        compiled = self.compiled_graph
+        for sign in self.signs:
+            if sign > 0:
+                nodes = self.particle_config.nodes_with_particle(self.sinks)
+            else:
+                nodes = self.particle_config.nodes_with_antiparticle(self.sinks)
+            worklist = compiled.worklist(nodes, self.particles, sign)
+            yield from compiled.iter_steps(self.rotors, self.particles, worklist, sign, self.turn_and_move)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> RoutingStep:
+        u, pos, v = next(self._steps)
+        nodes = self.compiled_graph.nodes
+        event = RoutingStep(self.nb_steps, nodes[u], self.compiled_graph.edges[pos], nodes[v])
+        self.nb_steps += 1
+        return event
+
+    def until(self, predicate=None, max_steps: int=None):
+        """
+        Iterate over the next steps until the predicate holds or max_steps steps are done.
+        The routing can be resumed with another call (or by iterating over self).
+        Input:
+            - predicate: function RoutingStep -> bool, the iteration stops after the first step for which it is True (optional)
+            - max_steps: maximal number of steps of this call (optional)
+        Output:
+            - generator of RoutingStep
+        """
+        count = 0
+        while max_steps is None or count < max_steps:
+            try:
+                event = next(self)
+            except StopIteration:
+                return
+            count += 1
+            yield event
+            if predicate is not None and predicate(event):
+                return
+
+    def run(self, predicate=None, max_steps: int=None) -> RoutingStep or None:
+        """
+        Make the next steps without yielding them, until the predicate holds or max_steps steps are done
+        Input:
+            - predicate: function RoutingStep -> bool (optional)
+            - max_steps: maximal number of steps of this call (optional)
+        Output:
+            - the last step done if there is one
+            else None
+        """
+        event = None
+        for event in self.until(predicate, max_steps):
+            pass
+        return event
+
+    def configurations(self) -> (ParticleConfig, RotorConfig):
+        """
+        Give the current configurations (translated from the arrays, O(V))
+        Output:
+            - particle configuration
+            - rotor configuration
+        """
+        compiled = self.compiled_graph
+        rotor_config = rotorconfig.RotorConfig(compiled.rotor_config_from(self.rotors, self.rotor_config))
+        particle_config = type(self.particle_config)(compiled.particle_config_from(self.particles, self.particle_config))
+        return particle_config, rotor_config
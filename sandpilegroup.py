@@ -0,0 +1,141 @@
+from types_definition import *
+from math import prod
+import numpy as np
+
+
+class SandpileGroup(object):
+
+    def __init__(self, nodes: list[Node], sinks: set, factors: list[int], transform: list[list[int]]):
+        """
+        The sandpile group of a graph with sinks: the particle configurations (the sinks are ignored)
+        modulo the lattice of the rows of the reduced laplacian (the firings), isomorphic to Z/d1 x ... x Z/dk.
+        A particle configuration sigma has the coordinates (U * sigma mod d1, ..., U * sigma mod dk),
+        two configurations are equivalent (route a recurrent rotor configuration to the same one) if and only if
+        they have the same coordinates, which costs O(k*V) operations without routing.
+            - nodes: the nodes of the graph, in the order of the columns of the transform
+                (the order of the compiled graph, as in batch_routing)
+            - sinks: the sinks of the group (their columns are zero)
+            - factors: the invariant factors d1 | ... | dk not equal to 1
+            - transform: (k, V) object array U, the row i is reduced modulo di
+            - small_transform: the same array of int64 if every factor fits (else None)
+        Input:
+            - nodes: list of the nodes
+            - sinks: set of the sinks
+            - factors: list of the invariant factors not equal to 1
+            - transform: the rows of U
+        """
+        if len(factors) != len(transform):
+            raise ValueError("factors and transform have to have the same length")
+        self.nodes = list(nodes)
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.sinks = set(sinks)
+        self.factors = list(factors)
+        self.transform = np.array(transform, dtype=object).reshape(len(factors), len(self.nodes))
+        self.moduli = np.array(self.factors, dtype=object)
+        self.small_transform = None
+        if all(d < 2**62 for d in self.factors):
+            self.small_transform = self.transform.astype(np.int64)
+
+    def from_graph(G: RotorGraph, sinks: set) -> "SandpileGroup":
+        """
+        Compute the sandpile group of a graph from the smith normal form of the transposed reduced laplacian
+        (its columns are the rows of the laplacian, see matrices.cokernel_map)
+        Input:
+            - G: the RotorGraph
+            - sinks: set of nodes that are considered as sinks
+        Output:
+            - SandpileGroup
+        """
+        laplacian = G.sparse_laplacian(sinks, reduced=True)
+        factors, reduced_transform = laplacian.transpose().cokernel_map()
+        nodes = list(G.compile(sinks).nodes)
+        position = {node: i for i, node in enumerate(nodes)}
+        columns = [position[node] for node in laplacian.labels]
+        transform = list()
+        for reduced_row in reduced_transform:
+            row = [0] * len(nodes)
+            for j, v in zip(columns, reduced_row):
+                row[j] = v
+            transform.append(row)
+        return SandpileGroup(nodes, sinks, factors, transform)
+
+    def order(self) -> int:
+        """
+        Output:
+            - the number of elements of the group (the number of acyclic configurations)
+        """
+        return prod(self.factors)
+
+    def identity(self) -> tuple[int]:
+        """
+        Output:
+            - the coordinates of the identity (the class of the empty configuration)
+        """
+        return (0,) * len(self.factors)
+
+    def coordinates(self, particles: ParticleConfig or dict or np.ndarray) -> tuple[int] or np.ndarray:
+        """
+        Give the coordinates of particle configurations in Z/d1 x ... x Z/dk
+        Input:
+            - particles: a ParticleConfig (or a dict {node: number of particles}),
+                or a (V,) or (B, V) integer array of numbers of particles in the order of nodes
+        Output:
+            - tuple of the k coordinates for a configuration, (k,) or (B, k) array for an array
+        """
+        if isinstance(particles, dict) or type(particles).__name__ == "ParticleConfig":
+            configuration = particles if isinstance(particles, dict) else particles.configuration
+            values = [0] * len(self.factors)
+            for node, k in configuration.items():
+                if k and node not in self.sinks:
+                    j = self.node_index[node]
+                    for i, row in enumerate(self.transform):
+                        values[i] += int(row[j]) * k
+            return tuple(v % d for v, d in zip(values, self.factors))
+
+        particles = np.asarray(particles)
+        if particles.shape[-1] != len(self.nodes):
+            raise ValueError(f"The arrays have to have {len(self.nodes)} columns (one per node)")
+        if not self.factors:
+            return np.zeros(particles.shape[:-1] + (0,), dtype=np.int64)
+        bound = max(self.factors) * int(np.abs(particles).sum(axis=-1).max(initial=0))
+        if self.small_transform is not None and bound < 2**63:
+            return (particles.astype(np.int64) @ self.small_transform.T) % np.array(self.factors, dtype=np.int64)
+        return (particles.astype(object) @ self.transform.T) % self.moduli
+
+    def add(self, a: tuple[int], b: tuple[int]) -> tuple[int]:
+        """
+        Input:
+            - a, b: coordinates of two elements
+        Output:
+            - the coordinates of their sum
+        """
+        return tuple((x + y) % d for x, y, d in zip(a, b, self.factors))
+
+    def neg(self, a: tuple[int]) -> tuple[int]:
+        """
+        Input:
+            - a: coordinates of an element
+        Output:
+            - the coordinates of its opposite
+        """
+        return tuple(-x % d for x, d in zip(a, self.factors))
+
+    def is_identity(self, a: tuple[int] or ParticleConfig) -> bool:
+        """
+        Input:
+            - a: coordinates of an element, or a particle configuration
+        Output:
+            - True if the element is the identity (the configuration is in the lattice of the laplacian)
+        """
+        if not isinstance(a, tuple):
+            a = self.coordinates(a)
+        return not any(a)
+
+    def equivalent(self, sigma: ParticleConfig, tau: ParticleConfig) -> bool:
+        """
+        Input:
+            - sigma, tau: particle configurations
+        Output:
+            - True if their difference is in the lattice of the laplacian (same element of the group)
+        """
+        return self.coordinates(sigma) == self.coordinates(tau)
@@ -1,11 +1,24 @@
 import unittest
+import os
+import tempfile
+import json
 from networkx import simple_cycles, strongly_connected_components
-from rotorgraph import RotorGraph
-from rotorconfig import RotorConfig
+from rotorgraph import RotorGraph, iter_class, class_size, all_config_from_recurrent
+from rotorconfig import RotorConfig, CompactRotorConfig
 from vector import Vector
 from particleconfig import ParticleConfig
-from random import randint
-from numpy import array, linalg
+from trajectory import Trajectory
+from max_steps import max_steps, parallel_max_steps
+from enumeration import sharded_enumeration, assignment_to_config
+from rollbackunionfind import RollbackUnionFind
+from matrices import bareiss_determinant, smith_normal_form
+from random import randint, seed, Random
+from numpy import array, linalg, allclose
+
+
+def random_rotor_config(G: RotorGraph) -> RotorConfig:
+    """a rotor configuration with a random rotor on every node (the tests seed the random module first)"""
+    return RotorConfig({node: edges[randint(0, len(edges)-1)] for node, edges in G.rotor_order.items()})
 
 
 class TestRotorConfig(unittest.TestCase):
@@ -19,6 +32,42 @@ class TestRotorConfig(unittest.TestCase):
         calculated_len = len(rc.find_cycles())
         self.assertEqual(expected_len, calculated_len)
 
+    def test_destination_forest(self):
+        """the destination forest is the acyclic configuration reached by pushing cycles"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        acyclic = [config.configuration for config in G.enum_acyclic_configurations()]
+        for config in G.enum_configurations():
+            forest = RotorConfig(dict(config.configuration))
+            forest.destination_forest(G, G.sinks)
+            self.assertEqual(forest.find_cycles(G.sinks), [])
+            self.assertIn(forest.configuration, acyclic)
+            # pushing one cycle first does not change the destination forest
+            for cycle in config.find_cycles(G.sinks):
+                pushed = RotorConfig(dict(config.configuration))
+                pushed.cycle_push(G, cycle)
+                pushed.destination_forest(G, G.sinks)
+                self.assertEqual(pushed.configuration, forest.configuration)
+            # the rotor configuration and the compiled graph share the same implementation
+            compiled = G.compile(G.sinks)
+            rotors = compiled.rotors_from_config(config)
+            compiled.destination_forest(rotors)
+            self.assertEqual(compiled.rotor_config_from(rotors, config), forest.configuration)
+
+    def test_compact(self):
+        """the compact configurations are hashable and convert back to the same configurations"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        compiled = G.compile()
+        configs = list(G.enum_configurations())
+        compacts = {config.to_compact(compiled) for config in configs}
+        self.assertEqual(len(compacts), len(configs))
+        for config in configs:
+            compact = CompactRotorConfig.from_rotor_config(compiled, config)
+            self.assertIn(compact, compacts)
+            self.assertEqual(compact.to_rotor_config().configuration, config.configuration)
+            self.assertEqual(CompactRotorConfig(compiled, compact.indices()), compact)
+            self.assertEqual(compact[1], config[1])
+            self.assertEqual(len(compact.rotors), len(compiled.nodes))
+
     def test_edges(self):
         for i in range(2,9):
             G = RotorGraph.simple_path(i)
@@ -53,6 +102,7 @@ class TestRotorGraph(unittest.TestCase):
 
     def test_classes(self):
         """"""
+        seed(98)
         G = RotorGraph.random_graph()
         cp = list(strongly_connected_components(G))
         #self.assertTrue((len(cp) == 2) and ({G.number_of_nodes()-1} in cp))
@@ -63,6 +113,457 @@ class TestRotorGraph(unittest.TestCase):
         ac = G.enum_acyclic_configurations()
         self.assertEqual(len(ac),det.a)
 
+    def test_count_acyclic_configurations(self):
+        """the matrix-tree theorem counts the acyclic configurations"""
+        seed(110)
+        for G in (RotorGraph.simple_path(5, 2, 1), RotorGraph.grid(3, 4, "corners"), RotorGraph.random_graph(3, 8)):
+            self.assertEqual(G.count_acyclic_configurations(), len(G.enum_acyclic_configurations()))
+            mx = G.reduced_laplacian_matrix()
+            self.assertEqual(mx.bareiss_determinant(), mx.determinant().a)
+        self.assertEqual(bareiss_determinant([[0, 2, 1], [3, 1, 4], [1, 5, 9]]), -32)
+        self.assertEqual(bareiss_determinant([{0: 2, 1: 1}, {0: 4, 1: 2}]), 0)
+
+    def test_sparse_laplacian(self):
+        """the sparse laplacian has the entries of the laplacian and vector_routing fires with it"""
+        seed(119)
+        G = RotorGraph.random_graph(3, 8)
+        G.add_edge(1, 1)
+        for reduced in [False, True]:
+            laplacian = G.sparse_laplacian(reduced=reduced)
+            dense = laplacian.to_dense()
+            for i, u in enumerate(laplacian.labels):
+                for j, v in enumerate(laplacian.labels):
+                    expected = 0 if u in G.sinks else (G.out_degree(u) if u == v else 0) - G.number_of_edges(u, v)
+                    self.assertEqual(dense[i][j], expected)
+            rows, columns, values = laplacian.coo()
+            self.assertEqual(list(dense[rows, columns]), list(values))
+            self.assertEqual(laplacian.nnz, (dense != 0).sum())
+        self.assertEqual(G.sparse_laplacian(reduced=True).determinant(), G.count_acyclic_configurations())
+
+        G = RotorGraph.grid(3, 4, "corners")
+        sigma = ParticleConfig(G)
+        sigma.set_all_particles(20)
+        vector = {u: randint(0, 9) for u in G.nodes if u not in G.sinks}
+        sigma2, rho2 = G.vector_routing(sigma, RotorConfig(G), vector)
+        sigma3, rho3 = ParticleConfig(G), RotorConfig(G)
+        sigma3.set_all_particles(20)
+        for u, k in vector.items():
+            for _ in range(k):
+                sigma3, rho3 = G.step(sigma3, rho3, node=u)
+        self.assertEqual(sigma2, sigma3)
+        self.assertEqual(rho2.configuration, rho3.configuration)
+
+    def test_derived_cache(self):
+        """the derived structures are cached until the graph changes"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        compiled = G.compile()
+        self.assertIs(G.compile(), compiled)
+        self.assertIsNot(G.compile({0}), compiled)
+        count = G.count_acyclic_configurations()
+        self.assertEqual(G.count_acyclic_configurations(), count)
+        self.assertEqual(G.cache_stats()["hits"], 2)
+
+        version = G.version
+        G.add_edge(2, 0)
+        self.assertEqual(G.version, version + 1)
+        self.assertEqual(len(G.derived_cache), 0)
+        self.assertIsNot(G.compile(), compiled)
+        self.assertEqual(G.count_acyclic_configurations(), len(G.enum_acyclic_configurations()))
+        G.invert_rotor_order()
+        self.assertEqual(G.compile().edges[G.compile().offsets[2]], G.rotor_order[2][0])
+
+        # the node-only mutations also invalidate the derived structures
+        compiled = G.compile()
+        G.add_nodes_from([6, 7])
+        self.assertEqual(G.version, version + 3)
+        self.assertIsNot(G.compile(), compiled)
+        self.assertIn(6, G.compile().node_index)
+        G.remove_node(6)
+        self.assertNotIn(6, G.compile().node_index)
+        G.remove_nodes_from([7, 8])
+        self.assertEqual(G.version, version + 5)
+        G.remove_node(5)
+        self.assertEqual(G.version, version + 6)
+        self.assertNotIn(5, G.compile().node_index)
+        self.assertTrue(all(edge[1] != 5 for edges in G.rotor_order.values() for edge in edges))
+        self.assertEqual(G.edge_index, {edge: i for edges in G.rotor_order.values() for i, edge in enumerate(edges)})
+        self.assertEqual(G.count_acyclic_configurations(), len(G.enum_acyclic_configurations()))
+
+        G.clear_cache()
+        G.derived_cache.max_entries = 2
+        for sinks in ({0}, {5}, {0, 5}):
+            G.compile(sinks)
+        self.assertEqual(len(G.derived_cache), 2)
+        self.assertEqual(G.cache_stats()["evictions"], 1)
+
+    def test_iter_class(self):
+        """the class exploration visits each configuration of the class once"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        acyclic = [config.configuration for config in G.enum_acyclic_configurations()]
+        total = 0
+        for recurrent in G.recurrent_from_acyclic(G.enum_acyclic_configurations()):
+            configs = [config.configuration for config in all_config_from_recurrent(G, recurrent)]
+            self.assertEqual(len(configs), class_size(G, recurrent))
+            self.assertEqual(len(set(tuple(config.items()) for config in configs)), len(configs))
+            self.assertEqual(sum(config in acyclic for config in configs), 1)
+            total += len(configs)
+        self.assertEqual(total, sum(1 for _ in G.enum_configurations()))
+        self.assertEqual(len(list(iter_class(G, recurrent, compact=True))), len(configs))
+
+    def test_class_index(self):
+        """the class keys sort the configurations by class"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        index = G.class_index(members=True)
+        self.assertEqual(len(index), G.count_acyclic_configurations())
+        for recurrent in G.recurrent_from_acyclic(G.enum_acyclic_configurations()):
+            key = G.class_key(recurrent)
+            members = [config.configuration for config in index[key]]
+            self.assertEqual(len(members), class_size(G, recurrent))
+            for config in iter_class(G, recurrent):
+                self.assertEqual(G.class_key(config), key)
+                self.assertIn(config.configuration, members)
+        distribution = G.class_size_distribution()
+        self.assertEqual(sum(distribution.values()), len(index))
+        self.assertEqual(sum(size * number for size, number in distribution.items()), sum(1 for _ in G.enum_configurations()))
+
+    def test_sample_configurations(self):
+        """Wilson's algorithm draws every acyclic configuration with the same probability"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        acyclic = [config.configuration for config in G.enum_acyclic_configurations()]
+        samples = G.sample_configurations(6000, seed=0)
+        counts = [0] * len(acyclic)
+        for config, recurrent in samples:
+            counts[acyclic.index(config.configuration)] += 1
+            self.assertEqual(recurrent.configuration, G.turn_all(config).configuration)
+        expected = len(samples) / len(acyclic)
+        for count in counts:
+            self.assertTrue(0.7 * expected < count < 1.3 * expected)
+        self.assertEqual(G.sample_configurations(5, seed=3, compact=True), G.sample_configurations(5, seed=3, compact=True))
+
+    def test_enum_spanning_forests(self):
+        """the spanning forests are the acyclic configurations, in the same order"""
+        for G in (RotorGraph.simple_path(4, 2, 2), RotorGraph.grid(4, 4, "borders"), RotorGraph.random_graph(3, 8)):
+            expected = [config.configuration for config in G.enum_acyclic_configurations()]
+            self.assertEqual([config.configuration for config in G.enum_spanning_forests()], expected)
+        G = RotorGraph.grid(4, 4, "borders")
+        self.assertEqual(sum(1 for _ in G.enum_spanning_forests(compact=True)), G.reduced_laplacian_matrix().determinant().a)
+
+    def test_enum_configurations_gray(self):
+        """the Gray code enumeration gives every configuration once, turning one rotor at each step"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        expected = [config.configuration for config in G.enum_configurations()]
+        configs = list()
+        previous = None
+        for config, change in G.enum_configurations_gray(compact=False):
+            if change is not None:
+                node, old_edge, new_edge = change
+                self.assertEqual(previous[node], old_edge)
+                self.assertEqual(config[node], new_edge)
+                self.assertTrue(G.turn(old_edge) == new_edge or G.turn(new_edge) == old_edge)
+            previous = dict(config.configuration)
+            configs.append(previous)
+        self.assertEqual(len(configs), len(expected))
+        for config in expected:
+            self.assertIn(config, configs)
+
+    def test_compiled_routing(self):
+        """the compiled routing gives the same results as routing step by step"""
+        seed(1)
+        for _ in range(10):
+            G = RotorGraph.random_graph()
+            rho = random_rotor_config(G)
+            sigma = ParticleConfig(G)
+            for node in G.nodes:
+                sigma[node] = randint(0, 4)
+
+            sigma2, rho2, info = G.legal_routing(sigma, rho, history="all")
+
+            sigma3, rho3 = sigma, rho
+            while (node := sigma3.first_node_with_particle(G.sinks)) != None:
+                sigma3, rho3 = G.step(sigma3, rho3, node)
+
+            self.assertEqual(sigma2, sigma3)
+            self.assertEqual(rho2.configuration, rho3.configuration)
+            self.assertEqual(info.nb_steps, len(info.configuration_history) - 1)
+            self.assertEqual(info.nb_steps, sum(info.edges_counter.values()))
+
+    def test_batch_routing(self):
+        """firing k particles at once gives the same results as firing them one by one"""
+        seed(3)
+        for _ in range(20):
+            G = RotorGraph.random_graph()
+            rho = random_rotor_config(G)
+            sigma = ParticleConfig(G)
+            for node in G.nodes:
+                sigma[node] = randint(-10, 30)
+
+            sigma2, rho2, info2 = G.complete_routing(sigma, rho)
+            sigma3, rho3, info3 = G.complete_routing(sigma, rho, batch=True)
+            self.assertEqual(sigma2, sigma3)
+            self.assertEqual(rho2.configuration, rho3.configuration)
+            self.assertEqual(info2.edges_counter, info3.edges_counter)
+            self.assertEqual(info2.last_visit, info3.last_visit)
+
+        # 10 particles from the middle of a path split evenly between the two sinks
+        G = RotorGraph.simple_path(5, 1, 1)
+        sigma = ParticleConfig(G)
+        sigma[3] = 10
+        sigma2, rho2, info = G.legal_routing(sigma, RotorConfig(G), batch=True)
+        self.assertEqual(info.nb_steps, 90)
+        self.assertEqual((sigma2[0], sigma2[6]), (5, 5))
+        self.assertEqual(rho2.configuration, {1: (1, 2, 0), 2: (2, 3, 0), 3: (3, 4, 0), 4: (4, 5, 0), 5: (5, 6, 0)})
+
+    def test_batch_routing_without_replay(self):
+        """with the default arguments a routing (batched or not) does not replay the steps"""
+        G = RotorGraph.grid(10, 10, "borders")
+        compiled = G.compile()
+        def replay(*args, **kwargs):
+            raise AssertionError("the steps are replayed")
+        compiled.replay = replay
+        sigma = ParticleConfig(G)
+        sigma[45] = 5000
+        sigma2, rho2, info = G.legal_routing(sigma, RotorConfig(G), batch=True)
+        self.assertIsNone(info.history)
+        self.assertEqual(info.configuration_history, [])
+        self.assertEqual(sum(sigma2.configuration[sink] for sink in G.sinks), 5000)
+        sigma3, rho3, info3 = G.legal_routing(sigma, RotorConfig(G))
+        self.assertIsNone(info3.history)
+        self.assertEqual(sigma3, sigma2)
+        self.assertEqual(rho3.configuration, rho2.configuration)
+        del compiled.replay
+        _, _, info2 = G.legal_routing(sigma, RotorConfig(G), batch=True, history="delta")
+        self.assertEqual(info2.nb_steps, info.nb_steps)
+
+
+    def test_history_policies(self):
+        """every recording policy gives the same configurations"""
+        G = RotorGraph.simple_path(6, 2, 1)
+        rho = RotorConfig(G)
+        sigma = ParticleConfig(G)
+        sigma[3] = 5
+        sigma[5] = -2
+
+        info = G.complete_routing(sigma, rho, history="all")[2]
+        info_delta = G.complete_routing(sigma, rho, history="delta")[2]
+        info_periodic = G.complete_routing(sigma, rho, history=4)[2]
+        info_none = G.complete_routing(sigma, rho, history=None)[2]
+
+        self.assertEqual(info_none.configuration_history, [])
+        self.assertEqual(info_none.last_visit, info.last_visit)
+        for step in range(info.nb_steps + 1):
+            rho1, sigma1 = info.configuration_at(step)
+            rho2, sigma2 = info_delta.configuration_at(step)
+            self.assertEqual(rho1.configuration, rho2.configuration)
+            self.assertEqual(sigma1, sigma2)
+            if step % 4 == 0:
+                rho3, sigma3 = info_periodic.configuration_at(step)
+                self.assertEqual(rho1.configuration, rho3.configuration)
+                self.assertEqual(sigma1, sigma3)
+
+
+    def test_trajectory(self):
+        """the trajectory gives the same configurations as the history, forward, backward and after loading"""
+        G = RotorGraph.simple_path(5, 1, 2)
+        rho = RotorConfig(G)
+        sigma = ParticleConfig(G)
+        sigma[2] = 6
+        sigma[4] = -3
+
+        info = G.complete_routing(sigma, rho, history="all")[2]
+        trajectory = G.routing_trajectory(sigma, rho, antiparticles=True, keyframe_interval=5)
+        self.assertEqual(trajectory.nb_steps, info.nb_steps)
+        for step in range(info.nb_steps + 1):
+            rho1, sigma1 = info.configuration_at(step)
+            rho2, sigma2 = trajectory.state_at(step)
+            self.assertEqual(rho1.configuration, rho2.configuration)
+            self.assertEqual(sigma1, sigma2)
+
+        forward = [(step, list(rotors), list(particles)) for step, rotors, particles in trajectory.forward()]
+        backward = [(step, list(rotors), list(particles)) for step, rotors, particles in trajectory.backward()]
+        self.assertEqual(forward, backward[::-1])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trajectory.bin")
+            trajectory.save(path)
+            loaded = Trajectory.load(path)
+        self.assertEqual(loaded.edges, trajectory.edges)
+        self.assertEqual(loaded.phases, trajectory.phases)
+        for step in range(info.nb_steps + 1):
+            self.assertEqual(loaded.arrays_at(step), trajectory.arrays_at(step))
+            self.assertEqual(loaded.state_at(step)[0].configuration, trajectory.state_at(step)[0].configuration)
+
+
+    def test_rotor_walk_orbit(self):
+        """on a strongly connected graph without sink, the orbit is an Eulerian tour"""
+        seed(6)
+        for _ in range(10):
+            G = RotorGraph.grid(randint(2, 5), randint(2, 5))
+            rho = random_rotor_config(G)
+            node = randint(0, G.number_of_nodes()-1)
+            pre_period, period, orbit_config, info = G.rotor_walk_orbit(node, rho)
+
+            self.assertEqual(period, G.number_of_edges())
+            self.assertTrue(all(k == 1 for k in info.edges_counter.values()))
+
+            # the state is periodic from the pre-period on, and not before
+            compiled = G.compile(set())
+            rotors = compiled.rotors_from_config(rho)
+            u = compiled.walk(compiled.node_index[node], rotors, pre_period)
+            self.assertEqual(rotors, compiled.rotors_from_config(orbit_config))
+            v = compiled.walk(u, list(rotors), period)
+            self.assertEqual(u, v)
+
+
+    def test_batch_routing_lockstep(self):
+        """the lockstep routing of many configurations gives the result of each legal routing"""
+        seed(8)
+        G = RotorGraph.simple_path(6, 2, 1)
+        compiled = G.compile()
+        rhos = [random_rotor_config(G)
+                for _ in range(30)]
+        sigma = ParticleConfig(G)
+        sigma[2] = 3
+        sigma[5] = 1
+
+        steps, rotors, sinks = G.batch_routing(rhos, sigma)
+        for b, rho in enumerate(rhos):
+            sigma2, rho2, info = G.legal_routing(sigma, rho, history=None)
+            self.assertEqual(steps[b], info.nb_steps)
+            self.assertEqual(list(rotors[b]), compiled.rotors_from_config(rho2))
+            self.assertEqual(list(sinks[b]), [sigma2[0], sigma2[7]])
+
+        steps, rotors, sinks = G.batch_routing([RotorConfig(G)], sigma)
+        self.assertEqual(list(steps), [24])
+        self.assertEqual([list(r) for r in rotors], [[0, 2, 2, 2, 0, 2, 1, 0]])
+        self.assertEqual([list(s) for s in sinks], [[3, 1]])
+
+    def test_iter_routing(self):
+        """the lazy routing can be stopped and resumed and gives the steps of the routing"""
+        G = RotorGraph.simple_path(6, 2, 1)
+        rho = RotorConfig(G)
+        sigma = ParticleConfig(G)
+        sigma[2] = 3
+        sigma[4] = -2
+        sigma2, rho2, info = G.complete_routing(sigma, rho)
+
+        routing = G.iter_routing(sigma, rho, antiparticles=True)
+        event = routing.run(lambda event: event.successor == 3)
+        self.assertEqual(event.successor, 3)
+        self.assertEqual(routing.nb_steps, event.step + 1)
+        steps = [event] + list(routing.until(max_steps=5))
+        self.assertEqual([e.step for e in steps], list(range(event.step, event.step + 6)))
+        for e in routing:
+            self.assertEqual(G.tail(e.edge), e.node)
+            self.assertEqual(G.head(e.edge), e.successor)
+        self.assertEqual(routing.nb_steps, info.nb_steps)
+        sigma3, rho3 = routing.configurations()
+        self.assertEqual(sigma2, sigma3)
+        self.assertEqual(rho2.configuration, rho3.configuration)
+
+    def test_odometer_routing(self):
+        """the routing from the approximate odometer gives the result of the legal routing"""
+        seed(9)
+        for G in (RotorGraph.simple_path(8, 2, 1), RotorGraph.grid(4, 4, "borders")):
+            for turn_and_move in (False, True):
+                for margin in (0, 2):
+                    rho = random_rotor_config(G)
+                    sigma = ParticleConfig(G)
+                    for node in set(G.nodes) - G.sinks:
+                        sigma[node] = randint(0, 50)
+
+                    sigma2, rho2, info2 = G.legal_routing(sigma, rho, turn_and_move=turn_and_move, history=None)
+                    sigma3, rho3, info3 = G.odometer_routing(sigma, rho, turn_and_move=turn_and_move, margin=margin)
+                    self.assertEqual(sigma2, sigma3)
+                    self.assertEqual(rho2.configuration, rho3.configuration)
+                    self.assertEqual(info2.nb_steps, info3.nb_steps)
+                    self.assertEqual(info2.edges_counter, info3.edges_counter)
+                    self.assertEqual(info2.nodes_counter, info3.nodes_counter)
+                    # the documented gap: last_visit depends on the order of the steps and is not computed
+                    self.assertTrue(all(v is None for v in info3.last_visit.values()))
+                    self.assertTrue(any(v is not None for v in info2.last_visit.values()))
+
+        laplacian = RotorGraph.grid(12, 12, "borders").sparse_laplacian(reduced=True)
+        b = array([randint(0, 50) for _ in laplacian.labels], dtype=float)
+        for transpose in (False, True):
+            dense = laplacian.to_dense().astype(float)
+            expected = linalg.solve(dense.T if transpose else dense, b)
+            self.assertTrue(allclose(laplacian.solve(b, transpose=transpose), expected))
+
+
+class TestParticleConfig(unittest.TestCase):
+
+    def test_worklists(self):
+        """the worklists hold exactly the non sink nodes with particles or antiparticles"""
+        seed(2)
+        G = RotorGraph.simple_path()
+        for _ in range(20):
+            sigma = ParticleConfig(G)
+            for _ in range(30):
+                u, v = randint(0, 6), randint(0, 6)
+                k = randint(-3, 3)
+                [lambda: sigma.transfer_particles(u, v, k), lambda: sigma.add_particles(u, k),
+                 lambda: sigma.remove_particles(u, k), lambda: sigma.set_particles(u, k)][randint(0, 3)]()
+
+            positive = {node for node, k in sigma.items() if k > 0 and node not in G.sinks}
+            negative = {node for node, k in sigma.items() if k < 0 and node not in G.sinks}
+            self.assertEqual(set(sigma.nodes_with_particle(G.sinks)), positive)
+            self.assertEqual(set(sigma.nodes_with_antiparticle(G.sinks)), negative)
+            self.assertEqual(sigma.first_node_with_particle(G.sinks) is None, not positive)
+
+    def test_direct_modifications(self):
+        """the routings see the particles written directly in configuration"""
+        G = RotorGraph.simple_path()
+        rho = RotorConfig(G)
+        sigma = ParticleConfig(G)
+        sigma[2] = 1
+        sigma.configuration[2] = 0
+        sigma.configuration[3] = 4
+        sigma2, rho2, _ = G.legal_routing(sigma, rho, history=None)
+        expected, rho3, _ = G.legal_routing(ParticleConfig(dict(sigma.configuration)), rho, history=None)
+        self.assertEqual(sigma2, expected)
+        self.assertEqual(rho2.configuration, rho3.configuration)
+        self.assertEqual(sum(sigma2.configuration[sink] for sink in G.sinks), 4)
+        step, _ = G.step(sigma, rho)
+        self.assertEqual(step.configuration[3], 3)
+
+        # the lookups see the direct writes and the sets modified in place
+        p = ParticleConfig({1: 2, 2: 1})
+        sinks = set()
+        self.assertEqual(p.first_node_with_particle(sinks), 1)
+        sinks.add(1)
+        self.assertEqual(p.first_node_with_particle(sinks), 2)
+        p.configuration[2] = 0
+        self.assertIsNone(p.first_node_with_particle(sinks))
+        p.configuration[1] = 0
+        p.configuration[2] = -1
+        self.assertEqual(p.first_node_with_antiparticle(set()), 2)
+
+
+class TestRollbackUnionFind(unittest.TestCase):
+
+    def test_undo(self):
+        """the unions are undone in reverse order"""
+        uf = RollbackUnionFind(list(range(6)))
+        self.assertTrue(uf.union(0, 1))
+        self.assertTrue(uf.union(2, 3))
+        self.assertTrue(uf.union(1, 3))
+        self.assertFalse(uf.union(0, 2))
+        self.assertTrue(uf.connected(0, 3))
+        uf.undo()
+        self.assertTrue(uf.connected(0, 3))
+        uf.undo()
+        self.assertFalse(uf.connected(0, 3))
+        self.assertTrue(uf.connected(2, 3))
+        self.assertEqual(uf.find(0), uf.find(1))
+        uf.undo()
+        uf.undo()
+        self.assertEqual(len({uf.find(i) for i in range(6)}), 6)
+
+    def test_enumeration(self):
+        """the enumeration built on the union-find finds the acyclic configurations of a small path"""
+        self.assertEqual(len(RotorGraph.simple_path(3, 1, 1).enum_acyclic_configurations()), 4)
+
+
 class TestVector(unittest.TestCase):
 
     def test_dic_methods(self):
@@ -133,6 +634,206 @@ class TestVector(unittest.TestCase):
 
 
 
+class TestSmithNormalForm(unittest.TestCase):
+
+    def test_transforms(self):
+        """S * A * T is the diagonal of the invariant factors"""
+        for _ in range(50):
+            n, m = randint(1, 5), randint(1, 5)
+            A = [[randint(-6, 6) if randint(0, 2) else 0 for _ in range(m)] for _ in range(n)]
+            factors, S, T = smith_normal_form(A, transforms=True)
+            self.assertEqual(smith_normal_form(A), factors)
+            J = (array(S, dtype=object).dot(array(A, dtype=object))).dot(array(T, dtype=object))
+            for i in range(n):
+                for j in range(m):
+                    self.assertEqual(J[i][j], factors[i] if i == j else 0)
+            self.assertEqual(round(abs(linalg.det(array(S, dtype=float)))), 1)
+            self.assertEqual(round(abs(linalg.det(array(T, dtype=float)))), 1)
+            for a, b in zip(factors, factors[1:]):
+                self.assertTrue(b == 0 if a == 0 else b % a == 0)
+
+    def test_sandpile_group(self):
+        """the invariant factors of the reduced laplacian are the ones of the smithnormalform module"""
+        G = RotorGraph.grid(3, 4, "corners")
+        factors = G.sandpile_group()
+        product = 1
+        for d in factors:
+            product *= d
+        self.assertEqual(product, G.count_acyclic_configurations())
+        prob = G.reduced_laplacian_matrix().snf_problem()
+        expected = sorted(prob.J.get(i, i).a for i in range(prob.J.h) if prob.J.get(i, i).a != 1)
+        self.assertEqual(sorted(factors), expected)
+
+
+class TestSandpileGroup(unittest.TestCase):
+
+    def test_sandpile_coordinates(self):
+        """two particle configurations have the same coordinates if and only if they route to the same rotors"""
+        rng = Random(24)
+        G = RotorGraph.grid(3, 3, "corners")
+        group = G.sandpile()
+        self.assertEqual(group.factors, G.sandpile_group())
+        self.assertIs(G.sandpile(), group)
+        rho = G.recurrent_from_acyclic(G.enum_acyclic_configurations())[0]
+        compiled = G.compile(G.sinks)
+        final = dict()
+        for _ in range(60):
+            sigma = ParticleConfig({node: rng.randint(0, 3) for node in G.nodes if node not in G.sinks})
+            coordinates = group.coordinates(sigma)
+            particles = array(compiled.particles_from_config(sigma))
+            self.assertEqual(tuple(int(c) for c in G.sandpile_coordinates(particles)), coordinates)
+            _, rho2, _ = G.legal_routing(ParticleConfig(dict(sigma.configuration)), rho, history=None)
+            final.setdefault(coordinates, set()).add(tuple(sorted(rho2.configuration.items())))
+        self.assertTrue(all(len(rotors) == 1 for rotors in final.values()))
+        self.assertEqual(len({next(iter(rotors)) for rotors in final.values()}), len(final))
+
+        a, b = group.coordinates(sigma), group.coordinates(ParticleConfig({4: 5}))
+        self.assertTrue(group.is_identity(group.add(a, group.neg(a))))
+        total = ParticleConfig(dict(sigma.configuration))
+        total.configuration[4] = total.configuration.get(4, 0) + 5
+        self.assertEqual(group.add(a, b), group.coordinates(total))
+        fired = ParticleConfig(dict(sigma.configuration))
+        for edge in G.rotor_order[4]:
+            fired.configuration[4] -= 1
+            fired.configuration[edge[1]] = fired.configuration.get(edge[1], 0) + 1
+        self.assertTrue(group.equivalent(sigma, fired))
+
+    def test_rotor_routing_action(self):
+        """the permutations of the action follow legal_routing, and the action is simply transitive"""
+        rng = Random(24)
+        G = RotorGraph.simple_path(4, 2, 1)
+        action = G.rotor_routing_action()
+        self.assertIs(G.rotor_routing_action(), action)
+        recurrent = G.recurrent_from_acyclic(action.acyclic)
+        for i in range(0, len(action), 5):
+            for node in action.nodes:
+                rho, _ = G.route_one_particle(node, recurrent[i], history=None)
+                self.assertEqual(G.class_key(rho), G.class_key(recurrent[action.generator(node)[i]]))
+            sigma = ParticleConfig({node: rng.randint(0, 3) for node in action.nodes})
+            _, rho, _ = G.legal_routing(ParticleConfig(dict(sigma.configuration)), recurrent[i], history=None)
+            j = action.act(sigma, i)
+            self.assertEqual(action.config_index(action.acyclic[j]), j)
+            self.assertEqual(G.class_key(rho), G.class_key(recurrent[j]))
+        indices = array(range(len(action)))
+        self.assertEqual(action.apply_generators(indices).shape, (len(action.nodes), len(action)))
+        self.assertEqual(sorted(action.orbit(0)), list(range(len(action))))
+        self.assertTrue(action.stabilizes(action.group.identity(), indices).all())
+        self.assertFalse(action.stabilizes(ParticleConfig({1: 1}), indices).any())
+
+
+class TestParallelMaxSteps(unittest.TestCase):
+
+    def test_parallel_max_steps(self):
+        """the parallel search gives the same result as the serial one"""
+        for n, x, y in [(3, 1, 1), (4, 2, 1), (4, 1, 2)]:
+            nb_steps, configs = max_steps(n, x, y)
+            parallel_nb_steps, parallel_configs = parallel_max_steps(n, x, y, processes=2)
+            self.assertEqual(nb_steps, parallel_nb_steps)
+            self.assertEqual([(node, config.configuration) for node, config in configs],
+                             [(node, config.configuration) for node, config in parallel_configs])
+            if x <= y:
+                self.assertEqual(parallel_nb_steps, expected_max_steps(n, x, y))
+
+        G = RotorGraph.grid(2, 3, "corners")
+        expected = max(G.route_one_particle(node, config, history=None)[1].nb_steps
+                       for config in G.enum_configurations() for node in set(G.nodes)-set(G.sinks))
+        nb_steps, configs = parallel_max_steps(processes=2, G=G)
+        self.assertEqual(nb_steps, expected)
+        for node, config in configs:
+            self.assertEqual(G.route_one_particle(node, config, history=None)[1].nb_steps, expected)
+
+        # no non sink node: no configuration reaches a maximum
+        G = RotorGraph.simple_path(2, 1, 1)
+        G.set_sink(*G.nodes)
+        self.assertEqual(parallel_max_steps(processes=2, G=G), (0, []))
+
+
+def _steps_from_first_node(G, rotor_config):
+    rc, info = G.route_one_particle(1, rotor_config, history=None)
+    return info.nb_steps
+
+
+def _compact_steps_from_first_node(compiled, rotors):
+    return compiled.walk_to_sink(compiled.node_index[1], list(rotors))[1]
+
+
+def _interrupted_steps_from_first_node(G, rotor_config):
+    # fails on the configuration stored in the graph attributes (G.graph is not part of the checkpoint fingerprint)
+    if G.graph.get("interrupt") == rotor_config.configuration:
+        raise RuntimeError("interrupted")
+    return _steps_from_first_node(G, rotor_config)
+
+
+class TestShardedEnumeration(unittest.TestCase):
+
+    def test_same_result_as_serial(self):
+        """the sharded enumeration gives the same aggregates as a serial enumeration"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        values = [(_steps_from_first_node(G, config), config.configuration) for config in G.enum_configurations()]
+        histogram = dict()
+        for value, _ in values:
+            histogram[value] = histogram.get(value, 0) + 1
+        self.assertEqual(sharded_enumeration(G, _steps_from_first_node, "histogram", processes=2),
+                         dict(sorted(histogram.items())))
+        self.assertEqual(sharded_enumeration(G, _compact_steps_from_first_node, "count", compact=True, processes=2),
+                         len(values))
+
+        best = max(value for value, _ in values)
+        nb_steps, assignments = sharded_enumeration(G, _compact_steps_from_first_node, "max", compact=True, processes=2)
+        self.assertEqual(nb_steps, best)
+        self.assertEqual([assignment_to_config(G, assignment).configuration for assignment in assignments],
+                         [config for value, config in values if value == best])
+
+        acyclic = [_steps_from_first_node(G, config) for config in G.enum_acyclic_configurations()]
+        nb_steps, assignments = sharded_enumeration(G, _steps_from_first_node, "max", acyclic=True, processes=2)
+        self.assertEqual(nb_steps, max(acyclic))
+        self.assertEqual(len(assignments), acyclic.count(max(acyclic)))
+
+    def test_resume_from_checkpoint(self):
+        """an interrupted enumeration resumes from its last checkpoints, the checkpoints of another enumeration are rejected"""
+        G = RotorGraph.simple_path(4, 2, 1)
+        for acyclic in [False, True]:
+            expected = sharded_enumeration(G, _steps_from_first_node, "histogram", acyclic=acyclic,
+                                           nb_shards=2, processes=2)
+            configs = G.enum_acyclic_configurations() if acyclic else list(G.enum_configurations())
+            with tempfile.TemporaryDirectory() as directory:
+                G.graph["interrupt"] = configs[-2].configuration
+                with self.assertRaises(RuntimeError):
+                    sharded_enumeration(G, _interrupted_steps_from_first_node, "histogram", acyclic=acyclic,
+                                        nb_shards=2, processes=1, checkpoint_dir=directory, checkpoint_interval=2)
+                checkpoints = dict()
+                for name in os.listdir(directory):
+                    with open(os.path.join(directory, name)) as file:
+                        checkpoints[name] = json.load(file)
+                interrupted = [name for name, checkpoint in checkpoints.items() if not checkpoint["done"]]
+                self.assertEqual(len(interrupted), 1)
+                self.assertGreater(checkpoints[interrupted[0]]["count"], 0)
+                path = os.path.join(directory, interrupted[0])
+
+                del G.graph["interrupt"]
+                result = sharded_enumeration(G, _interrupted_steps_from_first_node, "histogram", acyclic=acyclic,
+                                             nb_shards=2, processes=2, checkpoint_dir=directory, checkpoint_interval=2)
+                self.assertEqual(result, expected)
+                with open(path) as file:
+                    self.assertTrue(json.load(file)["done"])
+
+                # another function, aggregate or number of shards does not resume these checkpoints
+                for function, aggregate, nb_shards in [(_steps_from_first_node, "histogram", 2),
+                                                       (_interrupted_steps_from_first_node, "count", 2),
+                                                       (_interrupted_steps_from_first_node, "histogram", 4)]:
+                    with self.assertRaises(ValueError):
+                        sharded_enumeration(G, function, aggregate, acyclic=acyclic, nb_shards=nb_shards,
+                                            processes=2, checkpoint_dir=directory)
+            G.graph.pop("interrupt", None)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "shard_0.ckpt"), "wb") as file:
+                file.write(b"\xffnot json")
+            with self.assertRaises(ValueError):
+                sharded_enumeration(G, _steps_from_first_node, "max", nb_shards=2, processes=2,
+                                    checkpoint_dir=directory)
+
+
 def expected_max_steps(n:int, x:int, y:int):
     if x != y: return -2*x + n + 2*n*x
     elif n%2: return (x*n*n + n - x + 1) // 2
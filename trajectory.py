@@ -0,0 +1,312 @@
+from types_definition import *
+from array import array
+import json
+import numbers
+import rotorconfig
+import particleconfig
+
+MAGIC = b"RTRJ"
+VERSION = 1
+
+
+def _encode(value: object) -> object:
+    """
+    Translate a plain value (node, edge...) to a JSON value, the tuples are kept as {"tuple": [...]}
+    (also used by the checkpoints of enumeration.sharded_enumeration)
+    Input:
+        - value: None, bool, int, float, str (or numpy scalars), or a tuple or list of such values
+    Output:
+        - the JSON value
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, tuple):
+        return {"tuple": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    raise TypeError(f"{value!r} cannot be saved as JSON")
+
+
+def _decode(value: object) -> object:
+    """
+    Translate back a JSON value given by _encode
+    Input:
+        - value: the JSON value
+    Output:
+        - the plain value
+    """
+    if isinstance(value, dict):
+        return tuple(_decode(v) for v in value["tuple"])
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+class Trajectory(object):
+
+    def __init__(self, compiled_graph: CompiledRotorGraph, rotors: list[int], particles: list[int],
+                 rotor_nodes: list[Node], particle_nodes: list[Node], turn_and_move: bool=False,
+                 keyframe_interval: int=1024):
+        """
+        A seekable, delta-encoded trajectory of a routing.
+        It stores the initial configurations, a keyframe (copy of the configurations) every
+        keyframe_interval steps and, for every step, the fired node index and its rotor index after the turn,
+        in typed arrays:
+            - fired: array of the fired node indices
+            - new_rotors: array of the rotor indices of the fired nodes after the step
+            - phases: list of (first step, sign), sign is 1 when particles are routed, -1 for antiparticles
+            - keyframes: list of (rotors, particles) arrays, the keyframe i is the state after i*keyframe_interval steps
+        The steps follow the semantics of RotorGraph.step (and reverse_step for antiparticles).
+        Input:
+            - compiled_graph: the CompiledRotorGraph of the routing
+            - rotors: the initial rotor indices
+            - particles: the initial numbers of particles
+            - rotor_nodes: the nodes of the initial RotorConfig
+            - particle_nodes: the nodes of the initial ParticleConfig
+            - turn_and_move: boolean (default: False),
+                if True: turn first then move
+                else (False): move first then turn
+            - keyframe_interval: number of steps between two keyframes (default: 1024)
+        """
+        if keyframe_interval <= 0:
+            raise ValueError("keyframe_interval has to be positive")
+        self.nodes = list(compiled_graph.nodes)
+        self.edges = list(compiled_graph.edges)
+        self.offsets = list(compiled_graph.offsets)
+        self.degrees = list(compiled_graph.degrees)
+        self.heads = list(compiled_graph.heads)
+        self.rotor_nodes = list(rotor_nodes)
+        self.particle_nodes = list(particle_nodes)
+        self.turn_and_move = turn_and_move
+        self.keyframe_interval = keyframe_interval
+        self.fired = array('i')
+        self.new_rotors = array('i')
+        self.phases = list()
+        self.keyframes = [(array('i', rotors), array('q', particles))]
+        self._rotors = list(rotors) # state after the last appended step
+        self._particles = list(particles)
+
+    def __len__(self) -> int:
+        """number of steps"""
+        return len(self.fired)
+
+    @property
+    def nb_steps(self) -> int:
+        """number of steps"""
+        return len(self.fired)
+
+    def start_phase(self, sign: int):
+        """
+        Start a new phase of the routing
+        Input:
+            - sign: 1 when particles are routed, -1 for antiparticles
+        """
+        self.phases.append((len(self.fired), sign))
+
+    def sign_at(self, step: int) -> int:
+        """
+        Give the sign of the given step (numbered from 0)
+        Input:
+            - step: the step
+        Output:
+            - 1 for a particle step, -1 for an antiparticle step
+        """
+        sign = 1
+        for first, phase_sign in self.phases:
+            if first > step:
+                break
+            sign = phase_sign
+        return sign
+
+    def _apply(self, rotors: list[int], particles: list[int], u: int, new: int, sign: int):
+        """
+        Apply one step on the arrays
+        Input:
+            - rotors, particles: the arrays to update in place
+            - u: the fired node index
+            - new: the rotor index of u after the step
+            - sign: 1 for particles, -1 for antiparticles
+        """
+        turn_first = self.turn_and_move if sign > 0 else not self.turn_and_move
+        pos = self.offsets[u] + (new if turn_first else rotors[u])
+        rotors[u] = new
+        particles[u] -= sign
+        particles[self.heads[pos]] += sign
+
+    def _unapply(self, rotors: list[int], particles: list[int], u: int, new: int, sign: int):
+        """
+        Undo one step on the arrays
+        Input:
+            - rotors, particles: the arrays to update in place
+            - u: the fired node index
+            - new: the rotor index of u after the step
+            - sign: 1 for particles, -1 for antiparticles
+        """
+        turn_first = self.turn_and_move if sign > 0 else not self.turn_and_move
+        old = (new - 1) % self.degrees[u]
+        pos = self.offsets[u] + (new if turn_first else old)
+        rotors[u] = old
+        particles[u] += sign
+        particles[self.heads[pos]] -= sign
+
+    def append(self, u: int, new: int, sign: int):
+        """
+        Append a step to the trajectory
+        Input:
+            - u: the fired node index
+            - new: the rotor index of u after the step
+            - sign: 1 for particles, -1 for antiparticles
+        """
+        if not self.phases or self.phases[-1][1] != sign:
+            self.start_phase(sign)
+        self._apply(self._rotors, self._particles, u, new, sign)
+        self.fired.append(u)
+        self.new_rotors.append(new)
+        if len(self.fired) % self.keyframe_interval == 0:
+            self.keyframes.append((array('i', self._rotors), array('q', self._particles)))
+
+    def arrays_at(self, step: int) -> (list[int], list[int]):
+        """
+        Give the rotor indices and numbers of particles after the given step,
+        from the closest keyframe (O(keyframe_interval))
+        Input:
+            - step: number of steps (between 0 and nb_steps)
+        Output:
+            - list of rotor indices
+            - list of numbers of particles
+        """
+        if not 0 <= step <= len(self.fired):
+            raise ValueError(f"Invalid step {step}")
+        k = min(step // self.keyframe_interval, len(self.keyframes) - 1)
+        rotors, particles = (list(a) for a in self.keyframes[k])
+        for t in range(k * self.keyframe_interval, step):
+            self._apply(rotors, particles, self.fired[t], self.new_rotors[t], self.sign_at(t))
+        return rotors, particles
+
+    def state_at(self, step: int) -> (RotorConfig, ParticleConfig):
+        """
+        Give the configurations after the given step
+        Input:
+            - step: number of steps (between 0 and nb_steps)
+        Output:
+            - rotor configuration
+            - particle configuration
+        """
+        return self.to_configs(*self.arrays_at(step))
+
+    def to_configs(self, rotors: list[int], particles: list[int]) -> (RotorConfig, ParticleConfig):
+        """
+        Translate arrays to configurations
+        Input:
+            - rotors: list of rotor indices
+            - particles: list of numbers of particles
+        Output:
+            - rotor configuration
+            - particle configuration
+        """
+        index = {node: i for i, node in enumerate(self.nodes)}
+        rotor_config = {node: self.edges[self.offsets[index[node]] + rotors[index[node]]]
+                        for node in self.rotor_nodes}
+        particle_config = {node: particles[index[node]] for node in self.particle_nodes}
+        for node, k in zip(self.nodes, particles):
+            if k and node not in particle_config:
+                particle_config[node] = k
+        return rotorconfig.RotorConfig(rotor_config), particleconfig.ParticleConfig(particle_config)
+
+    def forward(self, start: int=0, stop: int=None):
+        """
+        Iterate over the steps from start to stop
+        Input:
+            - start: first state (default: the initial state)
+            - stop: last state (default: the final state)
+        Output:
+            - generator of (step, rotors, particles), the same lists are updated in place
+        """
+        if stop is None:
+            stop = len(self.fired)
+        rotors, particles = self.arrays_at(start)
+        yield start, rotors, particles
+        for t in range(start, stop):
+            self._apply(rotors, particles, self.fired[t], self.new_rotors[t], self.sign_at(t))
+            yield t + 1, rotors, particles
+
+    def backward(self, start: int=None, stop: int=0):
+        """
+        Iterate over the steps from start down to stop
+        Input:
+            - start: first state (default: the final state)
+            - stop: last state (default: the initial state)
+        Output:
+            - generator of (step, rotors, particles), the same lists are updated in place
+        """
+        if start is None:
+            start = len(self.fired)
+        rotors, particles = self.arrays_at(start)
+        yield start, rotors, particles
+        for t in range(start - 1, stop - 1, -1):
+            self._unapply(rotors, particles, self.fired[t], self.new_rotors[t], self.sign_at(t))
+            yield t, rotors, particles
+
+    def save(self, path: str):
+        """
+        Save the trajectory in a binary file (a JSON header, then the typed arrays),
+        the nodes and the edges have to be plain values (None, bool, int, float, str, or tuples of them)
+        Input:
+            - path: the path of the file
+        No output
+        """
+        header = {"nodes": self.nodes, "edges": self.edges, "offsets": self.offsets,
+                  "degrees": self.degrees, "heads": self.heads, "rotor_nodes": self.rotor_nodes,
+                  "particle_nodes": self.particle_nodes, "turn_and_move": self.turn_and_move,
+                  "keyframe_interval": self.keyframe_interval, "phases": self.phases,
+                  "nb_steps": len(self.fired)}
+        header = json.dumps({name: _encode(value) for name, value in header.items()}).encode("utf-8")
+        with open(path, "wb") as file:
+            file.write(MAGIC)
+            file.write(array('q', [VERSION, len(header)]).tobytes())
+            file.write(header)
+            self.fired.tofile(file)
+            self.new_rotors.tofile(file)
+            for rotors, particles in self.keyframes:
+                rotors.tofile(file)
+                particles.tofile(file)
+
+    def load(path: str) -> Trajectory:
+        """
+        Load a trajectory saved with save (the header is JSON, loading a file does not run any code)
+        Input:
+            - path: the path of the file
+        Output:
+            - the Trajectory
+        """
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a trajectory file")
+            version, size = array('q', file.read(16))
+            if version != VERSION:
+                raise ValueError(f"Unsupported trajectory version {version}")
+            header = {name: _decode(value) for name, value in json.loads(file.read(size).decode("utf-8")).items()}
+
+            trajectory = Trajectory.__new__(Trajectory)
+            for name in ("nodes", "edges", "offsets", "degrees", "heads", "rotor_nodes", "particle_nodes",
+                         "turn_and_move", "keyframe_interval", "phases"):
+                setattr(trajectory, name, header[name])
+            nb_steps = header["nb_steps"]
+            nb_nodes = len(trajectory.nodes)
+            trajectory.fired = array('i')
+            trajectory.fired.fromfile(file, nb_steps)
+            trajectory.new_rotors = array('i')
+            trajectory.new_rotors.fromfile(file, nb_steps)
+            trajectory.keyframes = list()
+            for _ in range(nb_steps // trajectory.keyframe_interval + 1):
+                rotors = array('i')
+                rotors.fromfile(file, nb_nodes)
+                particles = array('q')
+                particles.fromfile(file, nb_nodes)
+                trajectory.keyframes.append((rotors, particles))
+        trajectory._rotors, trajectory._particles = trajectory.arrays_at(nb_steps)
+        return trajectory
@@ -5,4 +5,10 @@ ParticleConfig = object
 RotorConfig = object
 RotorGraph = object
 Vector = object
-
+CompiledRotorGraph = object
+RoutingCounters = object
+Trajectory = object
+RoutingIterator = object
+CompactRotorConfig = object
+SandpileGroup = object
+RotorRoutingAction = object